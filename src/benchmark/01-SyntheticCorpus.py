@@ -0,0 +1,167 @@
+'''
+Generates a synthetic corpus of tweets (one json per line, the fields of the 2016 database used by the pipeline), so that
+the throughput of the stages can be measured without the private corpus (see "02-Benchmark.py").
+
+The corpus imitates the features that matter for the cost of the stages:
+    - heavy-tailed activity: the number of tweets of the users and the number of retweets received by them follow
+      Pareto distributions (a few users post/are retweeted a lot);
+    - positions: each user is "favoravel", "contrario" or neutral; the tweets with hashtags use mostly the hashtags of
+      the user's group (files/hashtags_groups.txt), sometimes the ones of the other group or "incerto" ones;
+    - retweets: a share of the tweets are retweets of the tweets of popular users, mostly of the same position
+      (homophily); the retweet keeps the text and the hashtags of the original tweet;
+    - dates: the tweets are spread over a period of days (the retweet networks are daily).
+
+output: the corpus (.json, or .gz if the file name ends with ".gz").
+'''
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+from hashtag_matcher import load_hashtags_groups
+
+SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
+
+# words of the texts (portuguese) and other hashtags
+WORDS = ["o", "a", "de", "que", "e", "do", "da", "em", "um", "para", "com", "nao", "uma", "os", "no", "se", "na", "por",
+         "mais", "as", "dos", "como", "mas", "ao", "ele", "das", "seu", "sua", "ou", "quando", "muito", "nos", "ja", "eu",
+         "tambem", "so", "pelo", "pela", "ate", "isso", "ela", "entre", "depois", "sem", "mesmo", "aos", "seus", "quem",
+         "brasil", "governo", "presidente", "congresso", "camara", "senado", "votacao", "deputado", "deputados",
+         "golpe", "democracia", "impeachment", "dilma", "lula", "temer", "cunha", "povo", "hoje", "amanha", "rua",
+         "manifestacao", "protesto", "voto", "politica", "corrupcao", "crise", "economia", "pais", "justica", "stf",
+         "vc", "pq", "tb", "kkkk", "q", "hj", "mto", "td", "blz"]
+OTHER_HASHTAGS = ["bomdia", "futebol", "bbb16", "tbt", "musica", "sextafeira", "riodejaneiro", "saopaulo", "copa"]
+
+# positions of the users
+FAVORAVEL, CONTRARIO, NEUTRO = 0, 1, 2
+
+class SyntheticCorpus:
+
+    def __init__(self, hashtags_file, total_users=10000, seed=0, start="2016-03-01", days=31, retweet_share=0.6,
+                 hashtag_share=0.4, activity_shape=1.2, popularity_shape=1.0, homophily=0.85, tweets_per_author=20):
+        self.rng = np.random.default_rng(seed)
+        groups = load_hashtags_groups(hashtags_file)
+        self.hashtags = [[h for h in groups[group] if h != ""] for group in ["favoravel", "contrario", "incerto"]]
+        self.total_users = total_users
+        self.start = datetime.strptime(start, "%Y-%m-%d")
+        self.days = days
+        self.retweet_share = retweet_share
+        self.hashtag_share = hashtag_share
+        self.homophily = homophily
+        self.tweets_per_author = tweets_per_author
+
+        # users: ids, positions, activity (tweets) and popularity (retweets received)
+        self.user_ids = self.rng.choice(10 ** 9, size=total_users, replace=False) + 10 ** 6
+        self.positions = self.rng.choice([FAVORAVEL, CONTRARIO, NEUTRO], size=total_users, p=[0.35, 0.35, 0.3])
+        activity = self.rng.pareto(activity_shape, total_users) + 1
+        self.activity = activity / activity.sum()
+        popularity = self.rng.pareto(popularity_shape, total_users) + 1
+        self.popular = [np.flatnonzero(self.positions == position) for position in [FAVORAVEL, CONTRARIO, NEUTRO]]
+        self.popularity = [popularity[users] / popularity[users].sum() for users in self.popular]
+        self.all_popularity = popularity / popularity.sum()
+
+        # original tweets that can be retweeted (author, k) --> (id, text, hashtags), generated when first retweeted
+        self.originals = dict()
+        self.next_id = 700000000000000000
+
+    # hashtags_of: hashtags of a tweet of a user with the given position
+    def hashtags_of(self, position):
+        if self.rng.random() >= self.hashtag_share:
+            return []
+        r = self.rng.random()
+        if position == NEUTRO:
+            group = 2 if r < 0.3 else None
+        else:
+            group = position if r < 0.85 else (1 - position if r < 0.92 else 2)
+        total = self.rng.integers(1, 4)
+        hashtags = [self.rng.choice(self.hashtags[group]) if group is not None and len(self.hashtags[group]) > 0
+                    else self.rng.choice(OTHER_HASHTAGS)]
+        hashtags += [self.rng.choice(OTHER_HASHTAGS) for _ in range(total - 1)]
+        return [str(h) for h in hashtags]
+
+    # text: words, hashtags and sometimes a link
+    def text(self, hashtags):
+        words = self.rng.choice(WORDS, size=self.rng.integers(5, 20)).tolist()
+        if self.rng.random() < 0.3:
+            words.append("https://t.co/%s" % "".join(self.rng.choice(list("abcdefghijklmnopqrstuvwxyz0123456789"), 10)))
+        return " ".join(words + ["#" + h for h in hashtags])
+
+    def new_id(self):
+        self.next_id += int(self.rng.integers(1, 1000))
+        return str(self.next_id)
+
+    def user(self, index):
+        return {"id_str": str(self.user_ids[index]), "screen_name": "usuario%d" % index}
+
+    # original: a tweet of a popular author (the same tweet is retweeted many times)
+    def original(self, author):
+        key = (author, int(self.rng.integers(0, self.tweets_per_author)))
+        if key not in self.originals:
+            hashtags = self.hashtags_of(self.positions[author])
+            self.originals[key] = (self.new_id(), self.text(hashtags), hashtags)
+        return self.originals[key]
+
+    # retweeted_authors: popular users retweeted by users of the given positions (mostly the same position)
+    def retweeted_authors(self, positions):
+        authors = self.rng.choice(self.total_users, size=len(positions), p=self.all_popularity)
+        same_position = self.rng.random(len(positions)) < self.homophily
+        for position in [FAVORAVEL, CONTRARIO]:
+            rows = np.flatnonzero(same_position & (positions == position))
+            if len(rows) > 0 and len(self.popular[position]) > 0:
+                authors[rows] = self.rng.choice(self.popular[position], size=len(rows), p=self.popularity[position])
+        return authors
+
+    # tweets: yields the tweets (dicts), in order of date
+    def tweets(self, total_tweets):
+        authors = self.rng.choice(self.total_users, size=total_tweets, p=self.activity)
+        seconds = np.sort(self.rng.integers(0, self.days * 86400, size=total_tweets))
+        retweets = self.rng.random(total_tweets) < self.retweet_share
+        retweeted_authors = np.full(total_tweets, -1)
+        retweeted_authors[retweets] = self.retweeted_authors(self.positions[authors[retweets]])
+        for (author, second, retweeted) in zip(authors.tolist(), seconds.tolist(), retweeted_authors.tolist()):
+            date = self.start + timedelta(seconds=second)
+            tweet = {"id_str": self.new_id(), "created_at": date.strftime("%a %b %d %H:%M:%S +0000 %Y"),
+                     "user": self.user(author), "lang": "pt"}
+            if retweeted >= 0:
+                (original_id, text, hashtags) = self.original(retweeted)
+                tweet["text"] = "RT @usuario%d: %s" % (retweeted, text)
+                tweet["retweeted_status"] = {"id_str": original_id, "text": text, "user": self.user(retweeted),
+                                             "entities": {"hashtags": [{"text": h} for h in hashtags]}}
+            else:
+                hashtags = self.hashtags_of(self.positions[author])
+                tweet["text"] = self.text(hashtags)
+            tweet["entities"] = {"hashtags": [{"text": h} for h in hashtags]}
+            yield tweet
+
+    # write: writes the corpus --> (tweets, retweets)
+    def write(self, filename, total_tweets):
+        total_retweets = 0
+        opener = gzip.open if filename.endswith(".gz") else open
+        with opener(filename, "wt", encoding="utf-8") as cfile:
+            for tweet in self.tweets(total_tweets):
+                total_retweets += "retweeted_status" in tweet
+                cfile.write(json.dumps(tweet) + "\n")
+        return (total_tweets, total_retweets)
+
+# MAIN
+if __name__ == "__main__":
+    hashtagsFile = os.path.join(SCRIPT_FOLDER, "..", "..", "files", "hashtags_groups.txt")
+
+    parser = argparse.ArgumentParser(description="Generates a synthetic corpus of tweets.")
+    parser.add_argument("--output", default="tweets_sinteticos.json.gz", help="corpus file (.json or .gz)")
+    parser.add_argument("--tweets", type=int, default=100000, help="number of tweets")
+    parser.add_argument("--users", type=int, default=10000, help="number of users")
+    parser.add_argument("--days", type=int, default=31, help="days of the period")
+    parser.add_argument("--start", default="2016-03-01", help="first day (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--hashtags", default=hashtagsFile, help="file of the hashtags of each group")
+    args = parser.parse_args()
+
+    corpus = SyntheticCorpus(args.hashtags, args.users, args.seed, args.start, args.days)
+    (total_tweets, total_retweets) = corpus.write(args.output, args.tweets)
+    print("%d tweets (%d retweets) written to %s" % (total_tweets, total_retweets, args.output))
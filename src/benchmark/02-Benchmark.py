@@ -0,0 +1,227 @@
+'''
+Benchmark of the pipeline on a synthetic corpus (see "01-SyntheticCorpus.py"): times each stage and records its
+throughput and peak memory, and compares the results with a stored baseline.
+
+stages (in order; each one reads the outputs of the previous ones from the work folder):
+    - corpus: generation of the synthetic corpus (tweets/s)
+    - hashtags: ProcessingText.run ("labeling/01-FindingUsersHashtags.py", tweets/s)
+    - retweets: ObterRedesRetweets.getRetweetNetwork ("labeling/02-RetweetNetworks.py", tweets/s; edges/s is also recorded)
+    - gml: getRetweetNetworkGML of each daily network ("labeling/03-GenerateGML.py", edges/s)
+      --> "retweet_net.txt" is split into daily files (month folders) before the stage, as the networks of the pipeline
+    - labeling: regerarGML ("labeling/04-LabelingNetworks.py", edges/s)
+    - totals: obterTotalMensal, the totals of the unlabeled users ("polarities/01-TotalsUnlabeledUsers.py", edges/s)
+    - polarities: "polarities/02-PolaritiesUnlabeledUsers.py" (users/s)
+    - kde: "polarization/01-PolaritiesDistribution.py" (users/s)
+    - index: "polarization/02-PolarizationIndex.py" (users/s)
+
+Each stage runs in a new (forked) process, so that its peak RSS (resource.getrusage, including the processes it starts) is
+its own. The parent process only keeps the results, so its memory does not inflate the measures.
+
+output: json file with the parameters, the machine and, for each stage, the time, the throughput and the peak RSS
+(--results). With --baseline, a stage whose throughput is lower (or whose peak RSS is higher) than the baseline by more
+than --tolerance is flagged as a regression (exit code 1). --save-baseline stores the results as the new baseline.
+'''
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import timeit
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import utils
+
+SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
+SRC_FOLDER = os.path.join(SCRIPT_FOLDER, "..")
+
+STAGES = ["corpus", "hashtags", "retweets", "gml", "labeling", "totals", "polarities", "kde", "index"]
+
+# files of the work folder
+CORPUS = "tweets.json.gz"
+COUNTS = "counts.json"
+
+def script(path):
+    return utils.load_script(os.path.join(SRC_FOLDER, path))
+
+# peak_rss_mb: largest resident set size of this process and of the processes it started (MB)
+def peak_rss_mb():
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / (1024.0 ** 2 if sys.platform == "darwin" else 1024.0) # bytes on macOS, KB on Linux
+
+def read_counts(folder):
+    with open(os.path.join(folder, COUNTS), "r") as cfile:
+        return json.load(cfile)
+
+def write_counts(folder, **counts):
+    filename = os.path.join(folder, COUNTS)
+    current = read_counts(folder) if os.path.exists(filename) else dict()
+    current.update(counts)
+    utils.write_json_atomic(current, filename)
+
+# stage_*: run a stage on the work folder --> (items, unit) | setup_*: untimed preparation of a stage
+def stage_corpus(folder, options):
+    corpus = script("benchmark/01-SyntheticCorpus.py").SyntheticCorpus(options["hashtags"], options["users"],
+                                                                        options["seed"], days=options["days"])
+    (total_tweets, total_retweets) = corpus.write(os.path.join(folder, CORPUS), options["tweets"])
+    write_counts(folder, tweets=total_tweets, retweets=total_retweets)
+    return (total_tweets, "tweets")
+
+def stage_hashtags(folder, options):
+    output_folder = os.path.join(folder, "hashtags")
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    finding_users_hashtags = script("labeling/01-FindingUsersHashtags.py")
+    pt = finding_users_hashtags.ProcessingText(os.path.join(folder, CORPUS), os.path.join(output_folder, "Usuarios"),
+                                               options["hashtags"])
+    pt.run(processes=options["processes"])
+    return (read_counts(folder)["tweets"], "tweets")
+
+def stage_retweets(folder, options):
+    retweet_networks = script("labeling/02-RetweetNetworks.py")
+    obterRedes = retweet_networks.ObterRedesRetweets(os.path.join(folder, CORPUS), os.path.join(folder, "retweets"))
+    obterRedes.run_from_file()
+    return (obterRedes.total_tweets, "tweets", {"edges": obterRedes.total_retweets})
+
+def setup_gml(folder, options):
+    edges = script("labeling/03-GenerateGML.py").splitDailyEdges(os.path.join(folder, "retweets", "retweet_net.txt"),
+                                                                  os.path.join(folder, "redes"))
+    write_counts(folder, edges=sum(edges.values()), days=len(edges))
+
+def stage_gml(folder, options):
+    generate_gml = script("labeling/03-GenerateGML.py")
+    for filename in sorted(glob.glob(os.path.join(folder, "redes", "*", "*_ComPosicao.txt"))):
+        generate_gml.getRetweetNetworkGML(filename)
+    return (read_counts(folder)["edges"], "edges")
+
+def stage_labeling(folder, options):
+    labeling = script("labeling/04-LabelingNetworks.py")
+    favoravel = glob.glob(os.path.join(folder, "hashtags", "Usuarios_FAVORAVEL_*.json"))[0]
+    labeling.regerarGML(os.path.join(folder, "redes"), options["processes"],
+                        arquivo_polaridade=favoravel.replace("_FAVORAVEL_", "_%s_"),
+                        output_folder=os.path.join(folder, "rotuladas"))
+    return (read_counts(folder)["edges"], "edges")
+
+def stage_totals(folder, options):
+    script("polarities/01-TotalsUnlabeledUsers.py").obterTotalMensal(os.path.join(folder, "rotuladas"))
+    return (read_counts(folder)["edges"], "edges")
+
+def stage_polarities(folder, options):
+    script("polarities/02-PolaritiesUnlabeledUsers.py").run(
+        os.path.join(folder, "ScatterData_UsuariosSemLabel_GranMensal.csv"), folder)
+    import polarity_table
+    total_users = len(polarity_table.load(os.path.join(folder, "DiffPercentual_UsuariosSemLabel_GranMensal.npz")))
+    write_counts(folder, users=total_users)
+    return (total_users, "users")
+
+def stage_kde(folder, options):
+    script("polarization/01-PolaritiesDistribution.py").run(
+        os.path.join(folder, "DiffPercentual_UsuariosSemLabel_GranMensal.npz"),
+        os.path.join(folder, "DadosKDE_GranMensal"), processes=options["processes"])
+    return (read_counts(folder)["users"], "users")
+
+def stage_index(folder, options):
+    script("polarization/02-PolarizationIndex.py").run(os.path.join(folder, "DadosKDE_GranMensal.json"),
+                                                       os.path.join(folder, "Metricas_Polarizacao_GranMensal"))
+    return (read_counts(folder)["users"], "users")
+
+# run_stage: runs a stage (in a new process) --> its measures
+def run_stage(name, folder, options):
+    os.chdir(folder) # some scripts create folders in the current folder
+    setup = globals().get("setup_" + name)
+    if setup is not None:
+        setup(folder, options)
+    start = timeit.default_timer()
+    result = globals()["stage_" + name](folder, options)
+    seconds = timeit.default_timer() - start
+
+    (items, unit) = result[:2]
+    measures = {"seconds": seconds, "items": items, "unit": unit, "throughput": items / seconds if seconds > 0 else None,
+                "peak_rss_mb": peak_rss_mb()}
+    for (extra_unit, extra_items) in (result[2] if len(result) > 2 else {}).items():
+        measures[extra_unit] = extra_items
+        measures[extra_unit + "_per_second"] = extra_items / seconds if seconds > 0 else None
+    return measures
+
+# compare: regressions of the results against the baseline --> list of messages
+# --> throughput lower than (1 - tolerance) * baseline or peak RSS higher than (1 + tolerance) * baseline
+def compare(results, baseline, tolerance=0.2):
+    regressions = []
+    for (name, measures) in results["stages"].items():
+        reference = baseline.get("stages", {}).get(name)
+        if reference is None:
+            continue
+        if reference.get("throughput") and measures["throughput"] is not None and \
+                measures["throughput"] < (1 - tolerance) * reference["throughput"]:
+            regressions.append("%s: throughput %.1f %s/s < %.1f %s/s (baseline)" %
+                               (name, measures["throughput"], measures["unit"], reference["throughput"], reference["unit"]))
+        if reference.get("peak_rss_mb") and measures["peak_rss_mb"] > (1 + tolerance) * reference["peak_rss_mb"]:
+            regressions.append("%s: peak RSS %.1f MB > %.1f MB (baseline)" %
+                               (name, measures["peak_rss_mb"], reference["peak_rss_mb"]))
+    return regressions
+
+# run: runs the stages and writes the results --> regressions (empty if there is no baseline)
+def run(folder, options, stages=STAGES, results_filename=None, baseline_filename=None, tolerance=0.2):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    folder = os.path.abspath(folder)
+    results = {"date": datetime.now().isoformat(timespec="seconds"),
+               "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                           "cpus": os.cpu_count()},
+               "parameters": options, "stages": dict()}
+
+    for name in stages:
+        print("Running stage %s..." % name)
+        # fork: the stages start pools of scripts loaded by utils.load_script, which cannot be imported by name (spawn)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+            measures = executor.submit(run_stage, name, folder, options).result()
+        results["stages"][name] = measures
+        print("%s: %.3f s, %.1f %s/s, peak RSS %.1f MB" % (name, measures["seconds"], measures["throughput"] or 0,
+                                                          measures["unit"], measures["peak_rss_mb"]))
+
+    regressions = []
+    if baseline_filename is not None:
+        with open(baseline_filename, "r") as bfile:
+            regressions = compare(results, json.load(bfile), tolerance)
+        results["baseline"] = baseline_filename
+        results["regressions"] = regressions
+        for regression in regressions:
+            print("[REGRESSION] %s" % regression)
+        print("%d regressions" % len(regressions))
+
+    results_filename = results_filename if results_filename is not None else os.path.join(folder, "benchmark_results.json")
+    utils.write_json_atomic(results, results_filename)
+    print("Results written to %s" % results_filename)
+    return (results, regressions)
+
+# MAIN
+if __name__ == "__main__":
+    hashtagsFile = os.path.join(SRC_FOLDER, "..", "files", "hashtags_groups.txt")
+
+    parser = argparse.ArgumentParser(description="Benchmark of the pipeline on a synthetic corpus.")
+    parser.add_argument("--folder", default="benchmark_work", help="work folder (corpus and outputs of the stages)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="stages to run (in order)")
+    parser.add_argument("--tweets", type=int, default=100000, help="tweets of the corpus")
+    parser.add_argument("--users", type=int, default=10000, help="users of the corpus")
+    parser.add_argument("--days", type=int, default=31, help="days of the corpus")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the corpus")
+    parser.add_argument("--processes", type=int, default=1, help="processes of the stages that run in parallel")
+    parser.add_argument("--hashtags", default=hashtagsFile, help="file of the hashtags of each group")
+    parser.add_argument("--results", default=None, help="results file (default: benchmark_results.json in the folder)")
+    parser.add_argument("--baseline", default=None, help="baseline results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change flagged as a regression")
+    parser.add_argument("--save-baseline", default=None, help="also saves the results as a baseline file")
+    args = parser.parse_args()
+
+    options = {"tweets": args.tweets, "users": args.users, "days": args.days, "seed": args.seed,
+               "processes": args.processes, "hashtags": os.path.abspath(args.hashtags)}
+    (results, regressions) = run(args.folder, options, args.stages, args.results, args.baseline, args.tolerance)
+    if args.save_baseline is not None:
+        utils.write_json_atomic(results, args.save_baseline)
+        print("Baseline written to %s" % args.save_baseline)
+    sys.exit(1 if len(regressions) > 0 else 0)
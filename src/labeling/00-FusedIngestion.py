@@ -0,0 +1,105 @@
+'''
+Runs the first two labeling steps ("01-FindingUsersHashtags.py" and "02-RetweetNetworks.py") reading the database only once.
+
+Each tweet is decompressed and decoded a single time and fed to both stages: the counters of the users of each hashtag
+group (ProcessingText) and the edge writer of the retweet network (ObterRedesRetweets). Other per-tweet stages can be
+plugged into the same stream (see utils/ingestion.py). With --portugues, the tweets that are not in portuguese are dropped
+before both stages (PortugueseFilterStage).
+
+input: the dataset of tweets.
+
+output: the same files of the two scripts --> the users of each hashtag group (json files) and "retweet_net.txt"
+'''
+import argparse
+import os
+import sys
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import utils
+from ingestion import TweetStage, FusedIngestion, PortugueseFilterStage
+from tweet_reader import HASHTAGS, RETWEETS, LABELING_FIELDS, RETWEET_FIELDS
+
+SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
+finding_users_hashtags = utils.load_script(os.path.join(SCRIPT_FOLDER, "01-FindingUsersHashtags.py"))
+retweet_networks = utils.load_script(os.path.join(SCRIPT_FOLDER, "02-RetweetNetworks.py"))
+
+# stage: counts the users of each hashtag group (ProcessingText)
+class HashtagLabelingStage(TweetStage):
+    fields = LABELING_FIELDS
+    prefilters = [HASHTAGS]
+
+    def __init__(self, processing_text):
+        self.processing_text = processing_text
+
+    def start(self):
+        self.processing_text.reset_users_groups()
+
+    def process(self, tweet):
+        self.processing_text.count_tweet(tweet)
+
+    def finish(self):
+        self.processing_text.resolve_users_groups()
+
+# stage: writes the edges of the retweet network (ObterRedesRetweets)
+class RetweetEdgesStage(TweetStage):
+    fields = RETWEET_FIELDS
+    prefilters = [RETWEETS]
+
+    def __init__(self, obter_redes):
+        self.obter_redes = obter_redes
+
+    def start(self):
+        self.obter_redes.open_writing_files()
+
+    def process(self, tweet):
+        self.obter_redes.watchdog.begin(self.obter_redes.total_tweets)
+        try:
+            self.obter_redes.processTweet(tweet)
+        except TimeoutError:
+            print("[TIMEOUT-ERROR] Timeout on " + str(self.obter_redes.total_tweets))
+        finally:
+            self.obter_redes.watchdog.end()
+
+    # not decoded: it is not a retweet, so it is only counted
+    def skip(self):
+        self.obter_redes.total_tweets += 1
+
+    def finish(self):
+        self.obter_redes.watchdog.stop()
+        self.obter_redes.writeStatistics()
+        self.obter_redes.close_writing_files()
+
+# run_fused: reads the database once and runs both stages
+# --> somente_portugues: drops the tweets that are not in portuguese before the stages
+def run_fused(input_file, output_basic_filename, output_folder, somente_portugues=False):
+    processing_text = finding_users_hashtags.ProcessingText(input_file, output_basic_filename)
+    obter_redes = retweet_networks.ObterRedesRetweets(input_file, output_folder)
+
+    stages = [HashtagLabelingStage(processing_text), RetweetEdgesStage(obter_redes)]
+    if somente_portugues:
+        stages.insert(0, PortugueseFilterStage())
+    ingestion = FusedIngestion(stages)
+    obter_redes.tweet_reader = ingestion.tweet_reader # the statistics report the shared reader
+    ingestion.run(obter_redes.inputFile)
+    print(ingestion.tweet_reader.report())
+
+# MAIN
+if __name__ == "__main__":
+    # input: file containing the set of tweets to be analyzed
+    input_file = "/home/robertacoelineves/TwitterDatabases/TweetsFiltradosPublico/tweets_2016.gz"
+
+    # output of the hashtag labeling (see "01-FindingUsersHashtags.py")
+    output_basic_filename = "/Users/robertacoeli/Documents/Mestrado/Pesquisa/Results/Twitter/Publico/PorGrupo_2017_07/TweetsPublico2016_CentralHashtagsOnly"
+
+    # output folder of the retweet network (see "02-RetweetNetworks.py")
+    output_folder = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/Publico/RetweetNetwork"
+
+    parser = argparse.ArgumentParser(description="Hashtag labeling and retweet network reading the database once.")
+    parser.add_argument("--input", default=input_file, help="dataset of tweets")
+    parser.add_argument("--output-hashtags", default=output_basic_filename, help="prefix of the files of the hashtag groups")
+    parser.add_argument("--output-retweets", default=output_folder, help="output folder of the retweet network")
+    parser.add_argument("--portugues", action="store_true", help="drops the tweets that are not in portuguese")
+    args = parser.parse_args()
+
+    run_fused(args.input, args.output_hashtags, args.output_retweets, somente_portugues=args.portugues)
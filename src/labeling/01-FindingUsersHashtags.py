@@ -10,6 +10,7 @@
 # imports.
 from unidecode import unidecode
 from collections import Counter
+from itertools import islice
 import gzip
 import json
 import time
@@ -22,39 +23,40 @@ from datetime import datetime
 import dateutil.parser as dateparser
 import detect_language as dlang
 import sys
+from multiprocessing import Pool
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
 import utils
+import gzip_index
+import instrumentation
 from timeout import timeout
+from hashtag_matcher import HashtagMatcher, load_hashtags_groups
+from tweet_reader import TweetReader, HASHTAGS, LABELING_FIELDS
 import numpy as np
 from bisect import bisect_left
 
 current_time = time.strftime("%Y%m%d_%H%M%S")
 SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
 
+# lines decoded (and timed) at once by scan
+scan_chunk_size = 10000
+
 # class that cleans and processes the tweets
 class ProcessingText:
 
-    def __init__(self, input_file, output_basic_filename):
+    def __init__(self, input_file, output_basic_filename, hashtags_file=None):
         self.input_filename = input_file
         self.output_basic_filename = output_basic_filename
 
-        # hashtags for each group
-        self.hashtags_groups = dict()
-        self.hashtags_groups["favoravel"], self.hashtags_groups["contrario"], \
-        self.hashtags_groups["incerto"]= [], [], []
-        group_mode = ""
-        hgfile = open(os.path.join(SCRIPT_FOLDER, "hashtags_groups.txt"), "r")
-        for line in hgfile:
-            l = line.strip()
-            if l == "::favoravel::":
-                group_mode = "favoravel"
-            elif l == "::contrario::":
-                group_mode = "contrario"
-            elif l == "::incerto::":
-                group_mode = "incerto"
-            else:
-                self.hashtags_groups[group_mode].append(l)
+        # hashtags for each group (default: "hashtags_groups.txt" in the folder of this script)
+        self.hashtags_file = hashtags_file if hashtags_file is not None else os.path.join(SCRIPT_FOLDER, "hashtags_groups.txt")
+        self.hashtags_groups = load_hashtags_groups(self.hashtags_file)
+
+        # matcher built once: gives all the groups of a tweet in a single pass over its hashtags
+        self.hashtag_matcher = HashtagMatcher(self.hashtags_groups)
+
+        # reader: only tweets having hashtags are decoded (and only the fields used here are kept)
+        self.tweet_reader = TweetReader(LABELING_FIELDS, [HASHTAGS])
 
     # check for hashtags in the tweet
     def check_special_feature(self, hashtags, checked_hashtags):
@@ -65,48 +67,101 @@ class ProcessingText:
                     return True
         return False
 
-    ''' MAIN FUNCTION'''
-    def run(self):
+    # reset_users_groups: creates empty counters for the users of each group
+    def reset_users_groups(self):
         self.users_groups = dict()
         self.users_groups["favoravel"], self.users_groups["contrario"], \
         self.users_groups["incerto"], self.users_groups["favcont"] = Counter(), Counter(), \
                                                                       Counter(), Counter()
 
-        # reading the database
-        data_file = utils.open_file(self.input_filename)
-        for line in data_file:
-            # loads the tweet
-            tweet = json.loads(line.decode('utf-8'))
-
-            # identifies the hashtags
-            tweet_hashtags = []
-            if "entities" in tweet:
-                if "hashtags" in tweet["entities"]:
-                    tweet_hashtags = [htg["text"] for htg in tweet["entities"]["hashtags"]]
-            
-            # updates counter for hashtags (if there is any hashtag for the tweet)
-            if len(tweet_hashtags) > 0:
-
-                # checks if the tweet contains hashtags from any of the FAVORAVEL, CONTRARIO or INCERTO groups
-                tuserid = tweet["user"]["id_str"]
-                contains_favoravel = self.check_special_feature(tweet_hashtags, self.hashtags_groups["favoravel"])
-                contains_contrario = self.check_special_feature(tweet_hashtags, self.hashtags_groups["contrario"])
-                contains_incerto = self.check_special_feature(tweet_hashtags, self.hashtags_groups["incerto"])
-
-                # if:
-                # a) the tweet contains both FAVORAVEL and CONTRARIO hashtags, the author/user is counted as "favcont" for this tweet (counter increases +1 for the user "tuserid" in the label "favcont")
-                # b) the tweet contains only FAVORAVEL, the author/user is counted as "favoravel" for this tweet (counter increases +1 for the user "tuserid" in the label "favoravel")
-                # c) the tweet contains only CONTRARIO, the author/user is counted as "contrario" for this tweet (counter increases +1 for the user "tuserid" in the label "contrario")
-                # d) the tweet contains INCERTO (hashtags incertas da posicao), the author/user is counted as "incerto" for this tweet (counter increases +1 for the user "tuserid" in the label "incerto")
-                if contains_favoravel and contains_contrario:
-                    self.users_groups["favcont"].update([tuserid]) # a
-                elif contains_favoravel and (not contains_contrario):
-                    self.users_groups["favoravel"].update([tuserid]) # b
-                elif contains_contrario and (not contains_favoravel):
-                    self.users_groups["contrario"].update([tuserid]) # c
-                elif contains_incerto:
-                    self.users_groups["incerto"].update([tuserid]) # d
+    # count_tweet: updates the counters of the groups for the author of the tweet
+    def count_tweet(self, tweet):
+        # identifies the hashtags
+        tweet_hashtags = []
+        if "entities" in tweet:
+            if "hashtags" in tweet["entities"]:
+                tweet_hashtags = [htg["text"] for htg in tweet["entities"]["hashtags"]]
+
+        # updates counter for hashtags (if there is any hashtag for the tweet)
+        if len(tweet_hashtags) > 0:
+
+            # checks if the tweet contains hashtags from any of the FAVORAVEL, CONTRARIO or INCERTO groups
+            tuserid = tweet["user"]["id_str"]
+            (contains_favoravel, contains_contrario, contains_incerto) = self.hashtag_matcher.match_groups(tweet_hashtags)
+
+            # if:
+            # a) the tweet contains both FAVORAVEL and CONTRARIO hashtags, the author/user is counted as "favcont" for this tweet (counter increases +1 for the user "tuserid" in the label "favcont")
+            # b) the tweet contains only FAVORAVEL, the author/user is counted as "favoravel" for this tweet (counter increases +1 for the user "tuserid" in the label "favoravel")
+            # c) the tweet contains only CONTRARIO, the author/user is counted as "contrario" for this tweet (counter increases +1 for the user "tuserid" in the label "contrario")
+            # d) the tweet contains INCERTO (hashtags incertas da posicao), the author/user is counted as "incerto" for this tweet (counter increases +1 for the user "tuserid" in the label "incerto")
+            if contains_favoravel and contains_contrario:
+                self.users_groups["favcont"].update([tuserid]) # a
+            elif contains_favoravel and (not contains_contrario):
+                self.users_groups["favoravel"].update([tuserid]) # b
+            elif contains_contrario and (not contains_favoravel):
+                self.users_groups["contrario"].update([tuserid]) # c
+            elif contains_incerto:
+                self.users_groups["incerto"].update([tuserid]) # d
 
+    # scan: reads the lines of (a part of) the database and counts the tweets of each user
+    # --> the lines are decoded and counted in chunks of "scan_chunk_size", which are timed (not each tweet)
+    def scan(self, lines):
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, scan_chunk_size))
+            if len(chunk) == 0:
+                break
+            # loads the tweets (None if it has no hashtags)
+            with instrumentation.timer("json_decode"):
+                tweets = [tweet for tweet in map(self.tweet_reader.decode, chunk) if tweet is not None]
+            with instrumentation.timer("hashtag_matching"):
+                for tweet in tweets:
+                    self.count_tweet(tweet)
+
+    # merge_users_groups: adds partial counters (ex.: from a worker process) to the counters of the users
+    def merge_users_groups(self, partial_users_groups):
+        for group, partial_counter in partial_users_groups.items():
+            self.users_groups[group].update(partial_counter)
+
+    # input_shards: parts of the database that can be read independently
+    # --> one per input file, byte ranges of an uncompressed file or ranges of checkpoints of an indexed .gz file (see gzip_index.py)
+    def input_shards(self, processes):
+        input_files = self.input_filename if isinstance(self.input_filename, list) else [self.input_filename]
+        if len(input_files) == 1 and not input_files[0].endswith(".gz"):
+            return utils.byte_ranges(input_files[0], processes)
+        if len(input_files) == 1:
+            return gzip_index.shards(input_files[0], processes)
+        return [(input_file, None, None) for input_file in input_files]
+
+    ''' MAIN FUNCTION'''
+    # --> metrics of the run (see utils/instrumentation.py): "metrics_FindingUsersHashtags_<date>.*" in the output folder
+    def run(self, processes=1):
+        run = instrumentation.start_run("FindingUsersHashtags", os.path.dirname(self.output_basic_filename) or None,
+                                        instrumentation.SAMPLE_INTERVAL)
+        run.gauge("parsed", lambda: self.tweet_reader.total_parsed)
+        run.gauge("skipped", lambda: self.tweet_reader.total_skipped)
+        self.reset_users_groups()
+
+        # reading the database: serial mode, or each process counts a part of it and the counters are merged
+        if processes <= 1:
+            for shard in self.input_shards(1):
+                self.scan(utils.read_shard(shard))
+        else:
+            tasks = [(shard, self.hashtags_file) for shard in self.input_shards(processes)]
+            with Pool(processes) as pool:
+                for (partial_users_groups, total_parsed, total_skipped, metrics) in pool.imap_unordered(scan_shard, tasks):
+                    self.merge_users_groups(partial_users_groups)
+                    run.merge(metrics)
+                    self.tweet_reader.total_parsed += total_parsed
+                    self.tweet_reader.total_skipped += total_skipped
+        print(self.tweet_reader.report())
+
+        with instrumentation.timer("resolve_groups"):
+            self.resolve_users_groups()
+        instrumentation.finish_run()
+
+    # resolve_users_groups: solves the conflicts of the users that are in more than one group and writes the output files
+    def resolve_users_groups(self):
         # check users per hashtag group
         favoravel_users, contrario_users, incerto_users, favcont_users = set(), set(), \
                                                                          set(), set()
@@ -167,10 +222,11 @@ class ProcessingText:
             incerto_users.remove(u)
             del self.users_groups["incerto"][u]
 
-        favoravel_users = list(favoravel_users)
-        contrario_users = list(contrario_users)
-        incerto_users = list(incerto_users)
-        favcont_users = list(favcont_users)
+        # sorted, so that the output does not depend on the reading order (serial or parallel)
+        favoravel_users = sorted(favoravel_users)
+        contrario_users = sorted(contrario_users)
+        incerto_users = sorted(incerto_users)
+        favcont_users = sorted(favcont_users)
 
         # write to json files
         print("Writing to output files...")
@@ -188,6 +244,15 @@ class ProcessingText:
 
         print("FINISHED!")
 
+# scan_shard: counts the users of each group in a part of the database (runs in a worker process)
+def scan_shard(task):
+    (shard, hashtags_file) = task
+    with instrumentation.collect() as metrics:
+        pt = ProcessingText(shard[0], None, hashtags_file)
+        pt.reset_users_groups()
+        pt.scan(utils.read_shard(shard))
+    return (pt.users_groups, pt.tweet_reader.total_parsed, pt.tweet_reader.total_skipped, metrics.snapshot())
+
 ''' ------------------------------------------------------ 
     MAIN : calls the main class method!
     ------------------------------------------------------ 
@@ -196,4 +261,4 @@ if __name__ == "__main__":
     input_file = "/home/robertacoelineves/TwitterDatabases/TweetsFiltradosPublico/tweets_2016.gz"
     output_basic_filename = "/Users/robertacoeli/Documents/Mestrado/Pesquisa/Results/Twitter/Publico/PorGrupo_2017_07/TweetsPublico2016_CentralHashtagsOnly"
     pt = ProcessingText(input_file, output_basic_filename)
-    pt.run()
\ No newline at end of file
+    pt.run(processes=os.cpu_count())
\ No newline at end of file
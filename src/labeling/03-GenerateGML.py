@@ -1,62 +1,163 @@
 '''
 Generates the GML and Pajek files from the retweet network
 
-input: file "retweet_net.txt".
+input: file "retweet_net.txt" or the columnar edge store "retweet_net" (folder, see utils/edge_store.py).
 
-output: .gml and .net files. The output files will be placed in the same folder of the input file.
+output: .gml and .net files, and the binary graph store (".graph" folder, see utils/graph_store.py). The output files will
+be placed in the same folder of the input file. splitDailyEdges splits "retweet_net.txt" into the daily files of the
+networks (month folders), whose graphs are generated one by one.
 
+The edges are read into arrays and the weights are aggregated with a group-by (numpy.unique + bincount). The GML and Pajek
+files are written directly from the arrays (streaming). networkx is only used when a graph object is requested (toNetworkx).
+The time of each step (edges_read, graph_build, gml_write, pajek_write, store_write) is recorded in the metrics of the run
+(see utils/instrumentation.py).
 '''
 import networkx as nx
+import numpy as np
+from array import array
 from datetime import datetime
 import os
+import sys
 from bisect import bisect_left
 import json
 
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+from edge_store import EdgeStore
+import graph_store
+import instrumentation
+
+# number of lines written at once by the streaming writers
+WRITE_CHUNK = 100000
+
+# readEdgeArrays: ids of the users of each edge (userA: retweeted user; userB: user that retweeted)
+def readEdgeArrays(filename):
+    if os.path.isdir(filename):
+        store = EdgeStore(filename)
+        return (np.asarray(store["user_a_id"], dtype=np.int64), np.asarray(store["user_b_id"], dtype=np.int64))
+
+    # example of line of the input file:
+    # userA;userA_Id;userB;userB_Id;date_of_tweet;tweet_id;cleaned_tweet
+    userA, userB = array("q"), array("q")
+    with open(filename, "r", encoding="utf-8") as netfile:
+        for line in netfile:
+            edge = line.split(";", 4)
+            if edge[1] == "User A ID":  # header
+                continue
+            userA.append(int(edge[1]))
+            userB.append(int(edge[3]))
+    return (np.frombuffer(userA, dtype=np.int64), np.frombuffer(userB, dtype=np.int64))
+
+# aggregateEdges: weighted graph from the list of edges (the weight of an edge is its number of retweets)
+# --> nodes: ids in order of first appearance | source, target: positions of the nodes in "nodes" | weights
+# --> the order of nodes and edges is the same of a networkx DiGraph built edge by edge
+def aggregateEdges(userA, userB):
+    if len(userA) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return (empty, empty, empty, empty)
+
+    interleaved = np.empty(2 * len(userA), dtype=np.int64)
+    interleaved[0::2] = userA
+    interleaved[1::2] = userB
+    nodeIds, firstPosition, inverse = np.unique(interleaved, return_index=True, return_inverse=True)
+
+    # nodes in order of first appearance
+    order = np.argsort(firstPosition, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    nodes = nodeIds[order]
+    source = rank[inverse[0::2]]
+    target = rank[inverse[1::2]]
+
+    # group-by (source, target): weight = number of edges
+    totalNodes = len(nodes)
+    edgeKeys, edgeFirst, edgeInverse = np.unique(source * totalNodes + target, return_index=True, return_inverse=True)
+    weights = np.bincount(edgeInverse.ravel(), minlength=len(edgeKeys))
+    edgeSource = edgeKeys // totalNodes
+    edgeTarget = edgeKeys % totalNodes
+
+    # edges grouped by source (in node order), each group in order of first appearance
+    order = np.lexsort((edgeFirst, edgeSource))
+    return (nodes, edgeSource[order], edgeTarget[order], weights[order])
+
+# writePajek: streaming Pajek writer (same layout of networkx.write_pajek)
+def writePajek(netFilename, nodes, source, target, weights):
+    with open(netFilename, "w", encoding="utf-8") as netfile:
+        netfile.write("*vertices %d\n" % len(nodes))
+        for start in range(0, len(nodes), WRITE_CHUNK):
+            netfile.write("".join("%d %d 0.0 0.0 ellipse\n" % (i + 1, nodeId)
+                                  for (i, nodeId) in enumerate(nodes[start:start + WRITE_CHUNK].tolist(), start)))
+        netfile.write("*arcs\n")
+        for start in range(0, len(weights), WRITE_CHUNK):
+            end = start + WRITE_CHUNK
+            netfile.write("".join("%d %d %d\n" % (s + 1, t + 1, w)
+                                  for (s, t, w) in zip(source[start:end].tolist(), target[start:end].tolist(),
+                                                       weights[start:end].tolist())))
+
+# toNetworkx: networkx graph from the arrays (only when a graph object is needed)
+def toNetworkx(nodes, source, target, weights):
+    graph = nx.DiGraph()
+    labels = [str(nodeId) for nodeId in nodes.tolist()]
+    graph.add_nodes_from(labels)
+    graph.add_weighted_edges_from((labels[s], labels[t], w) for (s, t, w) in
+                                  zip(source.tolist(), target.tolist(), weights.tolist()))
+    return graph
+
 # Method to generate the GML
 def getRetweetNetworkGML(filename):
     outfolder = os.path.dirname(filename)
     newFilename = os.path.basename(filename).split(".")[0]
-    rowCount = 0
-    graph = nx.DiGraph()
 
-    # open "retweet_net.txt" and generates the graph from it.
-    netfile = open(filename, "r")
-    for line in netfile:
-        if (rowCount % 5000) == 0:
-            print("Reading line %d of file %s" % (rowCount, newFilename))
-        
-        # example of line of the input file:
-        # userA;userA_Id;userB;userB_Id;date_of_tweet;tweet_id;cleaned_tweet
-
-        edge = line.strip().split(";")
-        userAId = edge[1]
-        userBId = edge[3]
-
-        # Add the new nodes if they do not exist
-        if not graph.has_node(userAId):
-            graph.add_node(userAId)
-        if not graph.has_node(userBId):
-            graph.add_node(userBId)
-
-        # If the edge exists, updates it (add + 1 to its weight). Otherwise, creates a new edge having weight 1.
-        if graph.has_edge(userAId, userBId):
-            graph[userAId][userBId]['weight'] += 1
-        else:
-            graph.add_edge(userAId, userBId, weight=1)
-        rowCount += 1
-
-    netfile.close()
+    # open "retweet_net.txt" (or the edge store) and generates the graph from it.
+    print("Reading edges of %s" % newFilename)
+    with instrumentation.timer("edges_read"):
+        (userA, userB) = readEdgeArrays(filename)
+    with instrumentation.timer("graph_build"):
+        (nodes, source, target, weights) = aggregateEdges(userA, userB)
+    print("%d edges --> %d nodes, %d weighted edges" % (len(userA), len(nodes), len(weights)))
+    instrumentation.add("edges", len(userA))
+    instrumentation.add("graphs")
 
     # outputs the graph to a GML and a Pajek file
     print("Writing to the GML output file")
     gmlFilename = os.path.join(outfolder, "%s.gml" % newFilename)
-    nx.write_gml(graph, gmlFilename)
+    with instrumentation.timer("gml_write"):
+        graph_store.write_gml(gmlFilename, nodes, source, target, weights)
 
     print("Writing to the Pajek output file")
     netFilename = os.path.join(outfolder, "%s.net" % newFilename)
-    nx.write_pajek(graph, netFilename)
+    with instrumentation.timer("pajek_write"):
+        writePajek(netFilename, nodes, source, target, weights)
+
+    print("Writing to the graph store")
+    with instrumentation.timer("store_write"):
+        graph_store.write_store(os.path.join(outfolder, newFilename + graph_store.GRAPH_SUFFIX), nodes, source, target, weights)
+
+# splitDailyEdges: splits "retweet_net.txt" into the daily files of the networks ("YYYY_MM/YYYY_MM_DD_ComPosicao.txt")
+# --> edges per day
+def splitDailyEdges(filename, output_folder):
+    files = dict()
+    edges = dict()
+    with open(filename, "r", encoding="utf-8") as efile:
+        header = next(efile)
+        for line in efile:
+            day = line.split(";", 5)[4].replace("/", "_")
+            if day not in files:
+                month_folder = os.path.join(output_folder, day[:7])
+                if not os.path.exists(month_folder):
+                    os.makedirs(month_folder)
+                files[day] = open(os.path.join(month_folder, "%s_ComPosicao.txt" % day), "w", encoding="utf-8")
+                files[day].write(header)
+                edges[day] = 0
+            files[day].write(line)
+            edges[day] += 1
+    for dfile in files.values():
+        dfile.close()
+    return edges
 
 if __name__ == "__main__":
     filename = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/Deputados/" \
                "RetweetNetwork/retweet_net.txt"
-    getRetweetNetworkGML(filename)
\ No newline at end of file
+    instrumentation.start_run("GenerateGML", os.path.dirname(filename))
+    getRetweetNetworkGML(filename)
+    instrumentation.finish_run()
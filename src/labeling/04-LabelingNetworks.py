@@ -1,14 +1,25 @@
 ''' 
     Script to add the polarity data for the users that were labeled by the hashtags in the retweet networks
 
-    Here we regenerate the .gml files so that it contains the polarity/label for the users that were labeled by the hashtags. 
+    Here we label the users (nodes) of the retweet networks that were labeled by the hashtags.
     This is done in order to calculate the individual polarity for the "unlabeled" users afterwards.
+
+    The labels of all the nodes of a graph are found at once (vectorized membership test against the ids of each group)
+    and they are saved as a sidecar of the graph, instead of regenerating it:
+        - .gml file: "<file>.gml.polaridade.npz" (see utils/graph_store.py), next to a link to the .gml file;
+        - binary graph store (".graph" folder): a link to the store with the new "polaridade" column.
+    The month folders are processed in parallel.
 '''
-import networkx as nx
 from datetime import datetime
 import os
-from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 import json
+import sys
+import numpy as np
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import graph_store
 
 # output folder
 outfolder = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/Publico/Experimentos_Redes_Retweets_v2/" \
@@ -24,61 +35,82 @@ polarityFolder = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/" \
                  "TweetsPublico2016_CentralHashtagsOnly_%s.json"
 
 # we only consider the "extreme" positions ("favoravel" and "contrario")
+# --> a user found in more than one group gets the first of them
 polaridades = ["CONTRARIO", "FAVORAVEL"]
 
+# labels of the sidecars: code 0 = "None" (not labeled), code i = polaridades[i - 1]
+categorias = ["None"] + polaridades
+
+# ids of the users of each group (sorted int64 arrays; the json files have the ids as strings)
 polarityArray = dict()
-for pol in polaridades:
-    with open(polarityFolder % pol, "r") as pfile:
-        polarityArray[pol] = json.load(pfile)
-        polarityArray[pol].sort()
-
-# to optimize the search of users
-def binary_search(array_search, x, lo=0, hi=None):  # can't use a to specify default for hi
-    hi = hi if hi is not None else len(array_search)  # hi defaults to len(a)
-    pos = bisect_left(array_search, x, lo, hi)  # find insertion position
-    isfound = (pos if pos != hi and array_search[pos] == x else -1)
-    return (isfound, pos)  # don't walk off the end
-
-# find it the user was labeled by hashtag
-def buscarPolaridade(userId):
+
+# carregar_polaridades: reads the users of each group --> arquivo_polaridade: file name with "%s" in place of the group
+def carregar_polaridades(arquivo_polaridade=polarityFolder):
     for pol in polaridades:
-        (isfound, pos) = binary_search(polarityArray[pol], userId)
-        if isfound > 0:
-            return pol
-    return "None"
+        with open(arquivo_polaridade % pol, "r") as pfile:
+            polarityArray[pol] = np.unique(np.asarray(json.load(pfile), dtype=np.int64))
+
+# rotular_usuarios: labels of all the users at once --> codes of "categorias"
+def rotular_usuarios(ids_usuarios):
+    ids_usuarios = np.asarray(ids_usuarios, dtype=np.int64)
+    rotulos = np.zeros(len(ids_usuarios), dtype=np.int8)
+    # the groups are applied in reverse order, so that the first group of "polaridades" wins
+    for (codigo, pol) in reversed(list(enumerate(polaridades, 1))):
+        rotulos[np.isin(ids_usuarios, polarityArray[pol])] = codigo
+    return rotulos
 
 # add the "polarity"/label information for the users (nodes) that were labeled by the selected hashtags
 # this information is added to the graph in order to calculate the individual polarity for the "unlabeled" users afterwards
-def modificar_polaridades_grafo(arquivo_grafo):
-    grafo = nx.read_gml(arquivo_grafo)
-
-    for (id_usuario, props_usuario) in grafo.nodes(data=True):
-        polaridade_usuario = buscarPolaridade(int(id_usuario))
-        grafo.node[id_usuario]["polaridade"] = polaridade_usuario
-
-    return grafo
-
-# regenerate the .gml files containing the polarity/label for the users that were labeled by the hashtags
-def regerarGML(input_folder):
-    # for each .gml file in the input folder...
+# --> .gml file: the labels are saved in a sidecar next to a link to the graph (the graph is not rewritten)
+def rotular_grafo(arquivo_grafo, novo_arquivo):
+    rotulos = rotular_usuarios(graph_store.gml_node_ids(arquivo_grafo))
+    graph_store.link_file(arquivo_grafo, novo_arquivo)
+    graph_store.write_sidecar(novo_arquivo, "polaridade", rotulos, categorias)
+
+# --> graph store: the labels are a new column of a linked copy of the store
+def rotular_store(pasta_grafo, pasta_nova):
+    graph_store.link_store(pasta_grafo, pasta_nova)
+    rotulos = rotular_usuarios(graph_store.GraphStore(pasta_nova).nodes)
+    graph_store.set_attribute(pasta_nova, "polaridade", rotulos, categorias)
+
+# labels the graphs of a month folder
+def rotular_mes(pasta_mensal, pasta_mensal_nova):
+    if (not os.path.exists(pasta_mensal_nova)):
+        os.makedirs(pasta_mensal_nova)
+
+    for filename in sorted(os.listdir(pasta_mensal)):
+        completeFilename = os.path.join(pasta_mensal, filename)
+        nome_novo_arquivo = os.path.join(pasta_mensal_nova, filename)
+        if graph_store.is_store(completeFilename):
+            print("Processando {0}/{1}".format(os.path.basename(pasta_mensal), filename))
+            rotular_store(completeFilename, nome_novo_arquivo)
+        elif filename.endswith(".gml"):
+            print("Processando {0}/{1}".format(os.path.basename(pasta_mensal), filename))
+            rotular_grafo(completeFilename, nome_novo_arquivo)
+    return pasta_mensal_nova
+
+# label the graphs of each month folder of the input folder (one process per month)
+# --> the users of each group are read by each process (carregar_polaridades)
+def regerarGML(input_folder, processos=None, arquivo_polaridade=polarityFolder, output_folder=None):
+    output_folder = output_folder if output_folder is not None else outfolder
+    carregar_polaridades(arquivo_polaridade)
+    pastas_mensais = []
     for root, subdirs, files in os.walk(input_folder):
         for monthFolder in subdirs:
-            pasta_mensal_nova = os.path.join(outfolder, monthFolder)
-            if (not os.path.exists(pasta_mensal_nova)):
-                os.makedirs(pasta_mensal_nova)
-
-            for filename in os.listdir(os.path.join(root, monthFolder)):
-                print("Processando {0}/{1}".format(monthFolder, filename))
-                completeFilename = os.path.join(root, monthFolder, filename)
-                nome_novo_arquivo = os.path.join(pasta_mensal_nova, filename)
-                grafo_novo = modificar_polaridades_grafo(completeFilename)
-                nx.write_gml(grafo_novo, nome_novo_arquivo)
+            if graph_store.is_store(os.path.join(root, monthFolder)):
+                continue
+            pastas_mensais.append((os.path.join(root, monthFolder), os.path.join(output_folder, monthFolder)))
 
-            print("\n" * 3)
+    with ProcessPoolExecutor(max_workers=processos, initializer=carregar_polaridades,
+                             initargs=(arquivo_polaridade,)) as executor:
+        tarefas = [executor.submit(rotular_mes, pasta_mensal, pasta_mensal_nova)
+                   for (pasta_mensal, pasta_mensal_nova) in pastas_mensais]
+        for tarefa in tarefas:
+            print("Finalizado: %s" % tarefa.result())
 
     print("Finalizado!")
 
 ### MAIN
 if __name__ == "__main__":
     print("Iniciando...")
-    regerarGML(infolder)
\ No newline at end of file
+    regerarGML(infolder)
@@ -0,0 +1,209 @@
+'''
+Runs the pipeline from the labeling of the users to the polarization index, as a DAG of stages whose intermediate results
+are cached by the hash of their inputs (see utils/pipeline.py): only the stages whose inputs, parameters or code changed
+run again, and the stages of different months run concurrently.
+
+stages:
+    - hashtags: users of each group of hashtags ("labeling/01-FindingUsersHashtags.py") <-- corpus, hashtags file
+    - retweets: retweet network ("labeling/02-RetweetNetworks.py") <-- corpus
+    - split: daily files of the retweet network, one folder per month ("labeling/03-GenerateGML.py", splitDailyEdges)
+    - gml:<YYYY_MM>: graphs of the days of a month ("labeling/03-GenerateGML.py") <-- the daily files of the month
+    - labeling:<YYYY_MM>: labeled graphs of a month ("labeling/04-LabelingNetworks.py") <-- gml:<YYYY_MM>, hashtags
+    - totals: monthly and daily totals of the unlabeled users ("polarities/01-TotalsUnlabeledUsers.py") <-- all months
+    - polarities: individual polarities ("polarities/02-PolaritiesUnlabeledUsers.py") <-- totals
+    - kde: distributions of the polarities ("polarization/01-PolaritiesDistribution.py") <-- polarities
+    - index: monthly polarization index ("polarization/02-PolarizationIndex.py") <-- kde
+    - window: polarization index over sliding windows of days ("polarization/03-SlidingWindowIndex.py") <-- totals
+
+The months are only known once the retweet network is split, so the pipeline runs in two steps: the stages up to "split",
+then the stages of each month and the ones after them. The key of a month is the hash of its own daily files, so a change
+in the corpus only runs again the months whose edges changed (and the stages after them).
+
+The code of a stage is its script and the modules of utils/preprocessing it imports (directly or not): editing them also
+runs the stage again.
+
+input: configuration file (json, see "pipeline.json"): the corpus, the hashtags file, the work folder, the number of
+processes and the parameters of the stages. Relative paths are relative to the configuration file.
+
+output: the folders of the stages in the work folder ("<work folder>/<stage>/<key>"); the folders of the results (index and
+window) are printed at the end.
+'''
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import utils
+import graph_store
+from pipeline import Pipeline, Stage
+
+SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
+SRC_FOLDER = os.path.realpath(os.path.join(SCRIPT_FOLDER, ".."))
+
+# folders of the internal modules (sys.path of the scripts)
+MODULE_FOLDERS = [os.path.join(SRC_FOLDER, "utils"), os.path.join(SRC_FOLDER, "preprocessing")]
+
+# default parameters of the stages (the ones of the configuration file replace them)
+DEFAULT_PARAMS = {"kde": {"bandwidth": "loo", "density": "fft", "grid_points": 4096},
+                  "index": {"method": "exact"},
+                  "window": {"windows": [7, 30], "bandwidth": "loo"}}
+
+def script(path):
+    return utils.load_script(os.path.join(SRC_FOLDER, path))
+
+# codigo: a script and the internal modules it imports (directly or not) --> the code of a stage
+def codigo(path):
+    files, pending = [], [os.path.join(SRC_FOLDER, path)]
+    while len(pending) > 0:
+        filename = pending.pop()
+        if filename in files:
+            continue
+        files.append(filename)
+        with open(filename, "r", encoding="utf-8") as sfile:
+            for module in re.findall(r"^\s*(?:from|import)\s+(\w+)", sfile.read(), re.MULTILINE):
+                for folder in MODULE_FOLDERS:
+                    if os.path.exists(os.path.join(folder, module + ".py")):
+                        pending.append(os.path.join(folder, module + ".py"))
+    return sorted(files)
+
+# stage functions: (output_folder, inputs, deps, params) --> the outputs are written to output_folder
+def stage_hashtags(output_folder, inputs, deps, params):
+    pt = script("labeling/01-FindingUsersHashtags.py").ProcessingText(inputs["corpus"],
+                                                                      os.path.join(output_folder, "Usuarios"),
+                                                                      inputs["hashtags"])
+    pt.run(processes=params["processes"])
+
+def stage_retweets(output_folder, inputs, deps, params):
+    script("labeling/02-RetweetNetworks.py").ObterRedesRetweets(inputs["corpus"], output_folder).run_from_file()
+
+def stage_split(output_folder, inputs, deps, params):
+    edges = script("labeling/03-GenerateGML.py").splitDailyEdges(os.path.join(deps["retweets"], "retweet_net.txt"),
+                                                                  output_folder)
+    print("%d edges in %d days" % (sum(edges.values()), len(edges)))
+
+# stage_gml: the daily files are linked to the output folder, where the graphs are written (next to the input file)
+def stage_gml(output_folder, inputs, deps, params):
+    generate_gml = script("labeling/03-GenerateGML.py")
+    for filename in sorted(os.listdir(inputs["edges"])):
+        link = os.path.join(output_folder, filename)
+        graph_store.link_file(os.path.join(inputs["edges"], filename), link)
+        generate_gml.getRetweetNetworkGML(link)
+        os.remove(link)
+
+def stage_labeling(output_folder, inputs, deps, params):
+    labeling = script("labeling/04-LabelingNetworks.py")
+    favoravel = glob.glob(os.path.join(deps["hashtags"], "Usuarios_FAVORAVEL_*.json"))[0]
+    labeling.carregar_polaridades(favoravel.replace("_FAVORAVEL_", "_%s_"))
+    labeling.rotular_mes(deps["gml:" + params["month"]], output_folder)
+
+# stage_totals: the labeled months are gathered in a folder of links (the input of obterTotalMensal)
+def stage_totals(output_folder, inputs, deps, params):
+    networks_folder = os.path.join(output_folder, "redes")
+    os.makedirs(networks_folder)
+    for (name, folder) in deps.items():
+        os.symlink(folder, os.path.join(networks_folder, name.split(":")[1]))
+    script("polarities/01-TotalsUnlabeledUsers.py").obterTotalMensal(networks_folder, salvarDiario=True,
+                                                                     output_folder=output_folder)
+    for link in os.listdir(networks_folder):
+        os.unlink(os.path.join(networks_folder, link))
+    os.rmdir(networks_folder)
+
+def stage_polarities(output_folder, inputs, deps, params):
+    script("polarities/02-PolaritiesUnlabeledUsers.py").run(
+        os.path.join(deps["totals"], "ScatterData_UsuariosSemLabel_GranMensal.csv"), output_folder)
+
+def stage_kde(output_folder, inputs, deps, params):
+    script("polarization/01-PolaritiesDistribution.py").run(
+        os.path.join(deps["polarities"], "DiffPercentual_UsuariosSemLabel_GranMensal.npz"),
+        os.path.join(output_folder, "DadosKDE_GranMensal"), method=params["bandwidth"], processes=params["processes"],
+        density=params["density"], total_grid_points=params["grid_points"])
+
+def stage_index(output_folder, inputs, deps, params):
+    script("polarization/02-PolarizationIndex.py").run(os.path.join(deps["kde"], "DadosKDE_GranMensal.json"),
+                                                       os.path.join(output_folder, "Metricas_Polarizacao_GranMensal"),
+                                                       method=params["method"])
+
+def stage_window(output_folder, inputs, deps, params):
+    script("polarization/03-SlidingWindowIndex.py").run(os.path.join(deps["totals"], "TotaisDiarios_UsuariosSemLabel.npz"),
+                                                        output_folder, janelas=params["windows"],
+                                                        method=params["bandwidth"])
+
+# load_config: configuration file --> dict (paths relative to the file are made absolute)
+def load_config(filename):
+    with open(filename, "r") as cfile:
+        config = json.load(cfile)
+    folder = os.path.dirname(os.path.abspath(filename))
+    for field in ["corpus", "hashtags", "work_folder"]:
+        config[field] = os.path.join(folder, config[field])
+    config.setdefault("processes", None)
+    params = {stage: dict(defaults) for (stage, defaults) in DEFAULT_PARAMS.items()}
+    for (stage, stage_params) in config.get("params", {}).items():
+        params.setdefault(stage, dict()).update(stage_params)
+    config["params"] = params
+    return config
+
+# build_pipeline: the stages up to the split of the retweet network
+def build_pipeline(config):
+    pipeline = Pipeline(config["work_folder"], config["processes"])
+    processes = {"processes": config["processes"] or 1}
+    pipeline.add(Stage("hashtags", stage_hashtags, inputs={"corpus": config["corpus"], "hashtags": config["hashtags"]},
+                       code=codigo("labeling/01-FindingUsersHashtags.py"), options=processes))
+    pipeline.add(Stage("retweets", stage_retweets, inputs={"corpus": config["corpus"]},
+                       code=codigo("labeling/02-RetweetNetworks.py")))
+    pipeline.add(Stage("split", stage_split, deps=["retweets"], code=codigo("labeling/03-GenerateGML.py")))
+    return pipeline
+
+# add_months: the stages of each month (found in the output of "split") and the ones after them
+def add_months(pipeline, config):
+    split_folder = pipeline.output_folder("split")
+    months = sorted(month for month in os.listdir(split_folder) if os.path.isdir(os.path.join(split_folder, month)))
+    for month in months:
+        pipeline.add(Stage("gml:" + month, stage_gml, inputs={"edges": os.path.join(split_folder, month)},
+                           params={"month": month}, code=codigo("labeling/03-GenerateGML.py")))
+        pipeline.add(Stage("labeling:" + month, stage_labeling, deps=["gml:" + month, "hashtags"],
+                           params={"month": month}, code=codigo("labeling/04-LabelingNetworks.py")))
+
+    params = config["params"]
+    pipeline.add(Stage("totals", stage_totals, deps=["labeling:" + month for month in months],
+                       code=codigo("polarities/01-TotalsUnlabeledUsers.py")))
+    pipeline.add(Stage("polarities", stage_polarities, deps=["totals"],
+                       code=codigo("polarities/02-PolaritiesUnlabeledUsers.py")))
+    pipeline.add(Stage("kde", stage_kde, deps=["polarities"], params=params["kde"],
+                       code=codigo("polarization/01-PolaritiesDistribution.py"),
+                       options={"processes": config["processes"]}))
+    pipeline.add(Stage("index", stage_index, deps=["kde"], params=params["index"],
+                       code=codigo("polarization/02-PolarizationIndex.py")))
+    pipeline.add(Stage("window", stage_window, deps=["totals"], params=params["window"],
+                       code=codigo("polarization/03-SlidingWindowIndex.py")))
+    return months
+
+# run: runs the pipeline (force: stages that run again even if they are cached) --> {stage: output folder}
+def run(config, force=()):
+    pipeline = build_pipeline(config)
+    pipeline.run(targets=["hashtags", "split"], force=force)
+    first_stages = set(pipeline.stages)
+    months = add_months(pipeline, config)
+    print("%d months: %s" % (len(months), ", ".join(months)))
+    forced = [name for name in pipeline.stages if name not in first_stages and (name in force or name.split(":")[0] in force)]
+    return pipeline.run(force=forced)
+
+## MAIN
+if __name__ == "__main__":
+    configFile = os.path.join(SCRIPT_FOLDER, "pipeline.json")
+
+    parser = argparse.ArgumentParser(description="Runs the pipeline with cached intermediate results.")
+    parser.add_argument("--config", default=configFile, help="configuration file (json)")
+    parser.add_argument("--processes", type=int, default=None, help="stages run at once (replaces the configuration)")
+    parser.add_argument("--force", nargs="+", default=[], help="stages that run again (ex.: kde, gml or gml:2016_03)")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.processes is not None:
+        config["processes"] = args.processes
+    folders = run(config, force=args.force)
+    print("Polarization index: %s" % folders["index"])
+    print("Sliding windows: %s" % folders["window"])
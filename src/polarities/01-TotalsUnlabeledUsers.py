@@ -2,115 +2,143 @@
 Calculates the total of posts that an unlabeled user retweeted from each of labeled users of each group ("favoravel" and "contrario").
 
 input: gml files of the retweet networks containing the labeled users (nodes) with their polarities/labels and the unlabeled users (polarity = None).
+--> the polarities can also be in a sidecar of the .gml file ("<file>.gml.polaridade.npz", see "04-LabelingNetworks.py").
+--> binary graph stores (".graph" folders, see utils/graph_store.py) are also accepted.
+--> --diario also saves the totals of each day ("TotaisDiarios_UsuariosSemLabel.npz", see utils/daily_totals.py), used by
+    the sliding-window index ("polarization/03-SlidingWindowIndex.py").
 
-output: spreadsheet containing the total of retweets for each unlabeled user (total and percentage of retweets in "favoravel"/"coxinhas"; total and percentage of retweets in "contrario"/"petralhas") --> example: ScatterData_UsuariosSemLabel_GranMensal.xlsx (https://drive.google.com/drive/folders/1LivGb9Nddbl2FByLqq6yPezBHxRzfBpT?usp=sharing)
+output: csv file (streaming, see utils/scatter_data.py; the .xlsx spreadsheet is an optional export) containing the total of retweets for each unlabeled user (total and percentage of retweets in "favoravel"/"coxinhas"; total and percentage of retweets in "contrario"/"petralhas") --> example: ScatterData_UsuariosSemLabel_GranMensal.xlsx (https://drive.google.com/drive/folders/1LivGb9Nddbl2FByLqq6yPezBHxRzfBpT?usp=sharing)
 
 '''
 
 import os
 import re
-import openpyxl
-import networkx as nx
-
-# atualiza o total mensal (agrupa os totais de cada arquivo para um determinado mes)
-def updateTotalMensal(scatterMensal, scatterToInsert):
-    for (userToInsert, userProps) in scatterToInsert.items():
-        if (userToInsert in scatterMensal):
-            for (prop, propValue) in userProps.items():
-                scatterMensal[userToInsert][prop] += propValue
-        else:
-            scatterMensal[userToInsert] = userProps.copy()
-
-    return scatterMensal
-
-# obtem os totais para usuarios unlabeled (arquivo diario)
-def obterTotaisUsuarios(graph):
-    totalDados = dict()
-
-    # for each node (user), checks its edges
-    for (user1, userProperty) in graph.nodes(data=True):
-        if (userProperty["polaridade"] != "None"):
-            continue
-
-        # se não for um usuário marcado (se for um usuario sem label), prossegue a análise
-        totalRetweetsMarcados = 0 # total de retweets em usuarios com label (usuarios "marcados")
-        numRetweetsCoxinhas = 0 # total de retweets em usuarios "coxinhas" (pro-impeachment)
-        numRetweetsPetralhas = 0 # total de retweets em usuarios "petralhas" (anti-impeachment)
-
-        ########################### CALCULO DE TOTAIS (IMPORTANTE) ############################
-        # tomo os usuarios predecessores, porque o grafo esta estruturado
-        # de forma que os nós recebem as ligações (são um "nó-fim") se
-        # tiverem retweetado alguém
-        # logo, os predecessores do user1 são aqueles usuários que foram
-        # retweetados pelo user1
-        #######################################################################################
-        for user2 in graph.predecessors(user1):
-            user2Polaridade = graph.node[user2]["polaridade"].lower()
-            if user2Polaridade == "none":
-                continue
-
-            edgeUser2 = graph.edge[user2][user1]
-            if "weight" in edgeUser2:
-                retweetsUser2 = int(edgeUser2["weight"])
-            else:
-                retweetsUser2 = int(edgeUser2[0]["weight"])
-            totalRetweetsMarcados += retweetsUser2
-            if (user2Polaridade == "contrario"):
-                numRetweetsPetralhas += retweetsUser2
-            else:
-                numRetweetsCoxinhas += retweetsUser2
-
-        # ao final, verifica se existiram retweets de usuarios marcados
-        # e adiciona ao dict
-        if (totalRetweetsMarcados > 0):
-            totalDados[user1] = dict()
-            totalDados[user1]["NumRetweetsCoxinhas"] = numRetweetsCoxinhas
-            totalDados[user1]["PercRetweetsCoxinhas"] = numRetweetsCoxinhas / totalRetweetsMarcados
-            totalDados[user1]["NumRetweetsPetralhas"] = numRetweetsPetralhas
-            totalDados[user1]["PercRetweetsPetralhas"] = numRetweetsPetralhas / totalRetweetsMarcados
-
-    return totalDados
+import sys
+import argparse
+import numpy as np
+from scipy import sparse
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import graph_store
+import scatter_data
+import daily_totals
+import instrumentation
+
+# campos dos totais de cada usuario
+CAMPOS = ["NumRetweetsCoxinhas", "PercRetweetsCoxinhas", "NumRetweetsPetralhas", "PercRetweetsPetralhas"]
+
+# le um grafo diario (graph store ou .gml, com as polaridades no proprio arquivo ou no sidecar)
+# --> (ids dos usuarios, origem, destino e peso das arestas, codigos das polaridades, categorias)
+def lerGrafoDiario(arquivo_grafo):
+    if graph_store.is_store(arquivo_grafo):
+        store = graph_store.GraphStore(arquivo_grafo)
+        (origem, destino, pesos) = store.edges()
+        return (np.asarray(store.nodes), origem, destino, pesos,
+                np.asarray(store.attribute("polaridade")), store.categories("polaridade"))
+
+    (nodes, origem, destino, pesos, atributos) = graph_store.read_gml(arquivo_grafo)
+    if os.path.exists(graph_store.sidecar_name(arquivo_grafo, "polaridade")):
+        (codigos, categorias) = graph_store.read_sidecar(arquivo_grafo, "polaridade")
+    else:
+        (codigos, categorias) = graph_store.encode_attribute(atributos["polaridade"])
+    return (nodes, origem, destino, pesos, codigos, categorias)
+
+# obtem os totais para usuarios unlabeled (arquivo diario) com dois produtos matriz esparsa-vetor
+# --> A[u2, u1] = numero de retweets de u1 em u2 (u2 e predecessor de u1); coxinhas/petralhas: vetores indicadores
+# --> totais de cada usuario u1: A^T * coxinhas e A^T * petralhas
+def obterTotaisEsparsos(nodes, origem, destino, pesos, codigos, categorias):
+    rotulos = np.asarray([categoria.lower() for categoria in categorias])[np.asarray(codigos, dtype=np.int64)]
+    semLabel = (rotulos == "none")
+    petralhas = (rotulos == "contrario")
+    coxinhas = ~semLabel & ~petralhas
+
+    totalUsuarios = len(nodes)
+    adjacencia = sparse.csr_matrix((np.asarray(pesos).astype(np.int64), (origem, destino)),
+                                   shape=(totalUsuarios, totalUsuarios))
+    numRetweetsCoxinhas = adjacencia.T @ coxinhas.astype(np.int64)
+    numRetweetsPetralhas = adjacencia.T @ petralhas.astype(np.int64)
+    totalRetweetsMarcados = numRetweetsCoxinhas + numRetweetsPetralhas
+
+    # apenas usuarios sem label que retweetaram usuarios marcados
+    selecionados = semLabel & (totalRetweetsMarcados > 0)
+    total = totalRetweetsMarcados[selecionados]
+    return {"ids": np.asarray(nodes, dtype=np.int64)[selecionados],
+            "NumRetweetsCoxinhas": numRetweetsCoxinhas[selecionados],
+            "PercRetweetsCoxinhas": numRetweetsCoxinhas[selecionados] / total,
+            "NumRetweetsPetralhas": numRetweetsPetralhas[selecionados],
+            "PercRetweetsPetralhas": numRetweetsPetralhas[selecionados] / total}
+
+# agrega os totais diarios de um mes (soma agrupada por usuario)
+# --> os usuarios ficam na ordem da primeira aparicao, e os dias sao somados na ordem da lista
+def somarTotaisMensais(totaisDias):
+    if len(totaisDias) == 0:
+        return {campo: np.zeros(0) for campo in ["ids"] + CAMPOS}
+
+    ids = np.concatenate([totais["ids"] for totais in totaisDias])
+    (idsUnicos, primeiraPosicao, inverso) = np.unique(ids, return_index=True, return_inverse=True)
+    ordem = np.argsort(primeiraPosicao, kind="stable")
+    posicao = np.empty(len(ordem), dtype=np.int64)
+    posicao[ordem] = np.arange(len(ordem))
+    linhas = posicao[inverso.ravel()]
+
+    totaisMes = {"ids": idsUnicos[ordem]}
+    for campo in CAMPOS:
+        soma = np.bincount(linhas, weights=np.concatenate([totais[campo] for totais in totaisDias]),
+                           minlength=len(ordem))
+        totaisMes[campo] = soma.astype(np.int64) if campo.startswith("Num") else soma
+    return totaisMes
 
 # agrega os totais de cada mes para os arquivos .gml de grafos, os quais foram gerados com periodicidade mensal
 # --> calcula os totais e percentuais de retweets dos usuarios unlabeled por mes
-def obterTotalMensal(input_folder):
-    outfolder = os.path.dirname(input_folder)
+# --> as linhas de cada mes sao escritas assim que o mes termina (csv, ver utils/scatter_data.py); xlsx: exportacao opcional
+# --> salvarDiario: tambem salva os totais de cada dia (contagens pro/anti por usuario, ver utils/daily_totals.py)
+# --> output_folder: pasta dos arquivos de saida (padrao: a pasta que contem input_folder)
+def obterTotalMensal(input_folder, exportarXlsx=False, salvarDiario=False, output_folder=None):
+    outfolder = output_folder if output_folder is not None else os.path.dirname(input_folder)
     outfilename = os.path.join(outfolder, "ScatterData_UsuariosSemLabel_GranMensal")
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.cell(row=1, column=1, value="Period")
-    ws.cell(row=1, column=2, value="User Id")
-    ws.cell(row=1, column=3, value="Number of Retweets - Favoravel (Coxinhas)")
-    ws.cell(row=1, column=4, value="Percent of Retweets - Favoravel (Coxinhas)")
-    ws.cell(row=1, column=5, value="Number of Retweets - Contrario (Petralhas)")
-    ws.cell(row=1, column=6, value="Percent of Retweets - Contrario (Petralhas)")
-    rowNumber = 2
+    scatterWriter = scatter_data.ScatterDataWriter(outfilename + ".csv")
+    run = instrumentation.start_run("TotalsUnlabeledUsers", outfolder, instrumentation.SAMPLE_INTERVAL)
+    run.gauge("rows", lambda: scatterWriter.total_rows)
+    diarioWriter = daily_totals.DailyTotalsWriter() if salvarDiario else None
 
     # for each .gml file...
     for root, subdirs, files in os.walk(input_folder):
         for monthFolder in subdirs:
+            if graph_store.is_store(os.path.join(root, monthFolder)):
+                continue
             yearMonth = monthFolder.strip().split("_")
             completeDate = "%s/%s/01" % (yearMonth[0], yearMonth[1])
-            totalDadosMes = dict()
+            totaisDias = []
             for filename in os.listdir(os.path.join(root, monthFolder)):
-                if "ComPosicao.gml" in filename:
-                    completeFilename = os.path.join(root, monthFolder, filename)
+                completeFilename = os.path.join(root, monthFolder, filename)
+                if filename.endswith("ComPosicao.gml") and graph_store.is_store(graph_store.store_name(completeFilename)):
+                    continue # o mesmo grafo tambem foi salvo como graph store
+                if filename.endswith("ComPosicao.gml") or filename.endswith("ComPosicao" + graph_store.GRAPH_SUFFIX):
                     print("Lendo arquivo %s" % completeFilename)
-                    graph = nx.read_gml(completeFilename)
-                    totalDadosDia = obterTotaisUsuarios(graph) # obtem o total de retweets de cada usuario para cada dia
-                    totalDadosMes = updateTotalMensal(totalDadosMes, totalDadosDia) # agrega os dados para verificar os totais por mes
-
-            for (userId, userProps) in totalDadosMes.items():
-                ws.cell(row=rowNumber, column=1, value=completeDate)
-                ws.cell(row=rowNumber, column=2, value=userId)
-                ws.cell(row=rowNumber, column=3, value=userProps["NumRetweetsCoxinhas"])
-                ws.cell(row=rowNumber, column=4, value=userProps["PercRetweetsCoxinhas"])
-                ws.cell(row=rowNumber, column=5, value=userProps["NumRetweetsPetralhas"])
-                ws.cell(row=rowNumber, column=6, value=userProps["PercRetweetsPetralhas"])
-                rowNumber += 1
-
-    wb.save(outfilename + ".xlsx")
+                    with instrumentation.timer("graph_read"):
+                        grafo = lerGrafoDiario(completeFilename)
+                    with instrumentation.timer("totals"):
+                        totaisDias.append(obterTotaisEsparsos(*grafo)) # obtem o total de retweets de cada usuario para cada dia
+                    instrumentation.add("graphs")
+                    if diarioWriter is not None:
+                        dia = "/".join(filename.strip().split("_")[:3]) # ex.: 2016_03_01_ComPosicao.gml --> 2016/03/01
+                        diarioWriter.add_day(dia, totaisDias[-1]["ids"], totaisDias[-1]["NumRetweetsCoxinhas"],
+                                             totaisDias[-1]["NumRetweetsPetralhas"])
+            with instrumentation.timer("totals"):
+                totaisMes = somarTotaisMensais(totaisDias) # agrega os dados para verificar os totais por mes
+            with instrumentation.timer("scatter_write"):
+                scatterWriter.write_month(completeDate, totaisMes["ids"], *[totaisMes[campo] for campo in CAMPOS])
+
+    scatterWriter.close()
+    print("%d linhas escritas em %s.csv" % (scatterWriter.total_rows, outfilename))
+    if exportarXlsx:
+        print("Exportando %s" % scatter_data.export_xlsx(outfilename + ".csv"))
+    if diarioWriter is not None:
+        diarioFilename = os.path.join(outfolder, "TotaisDiarios_UsuariosSemLabel.npz")
+        tabela = diarioWriter.save(diarioFilename)
+        print("%d dias (%d linhas) salvos em %s" % (len(tabela.days), len(tabela), diarioFilename))
+    instrumentation.finish_run()
     print("Finished!")
 
 ## MAIN
@@ -118,4 +146,11 @@ if __name__ == "__main__":
     # folder containing the .gml files (retweet networks)
     input_folder = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/Publico/" \
                  "Experimentos_Redes_Retweets_v2/Arquivos_Redes/RedesRetweets_Atualizadas_Maio2018"
-    obterTotalMensal(input_folder)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Totals of retweets of the unlabeled users in labeled users.")
+    parser.add_argument("--input", default=input_folder, help="folder of the retweet networks (month folders)")
+    parser.add_argument("--xlsx", action="store_true", help="also exports the .xlsx spreadsheet")
+    parser.add_argument("--diario", action="store_true", help="also saves the totals of each day")
+    args = parser.parse_args()
+
+    obterTotalMensal(args.input, exportarXlsx=args.xlsx, salvarDiario=args.diario)
\ No newline at end of file
@@ -1,34 +1,61 @@
 '''
     Get the best distribution of the individual polarities for each month. The distribution is used to compute the polarization index.
 
-    input: "DiffPercentual_UsuariosSemLabel_GranMensal.json" (google drive: https://drive.google.com/drive/folders/1LivGb9Nddbl2FByLqq6yPezBHxRzfBpT?usp=sharing)
+    input: "DiffPercentual_UsuariosSemLabel_GranMensal.npz" (columnar table, see utils/polarity_table.py) or the old
+    "DiffPercentual_UsuariosSemLabel_GranMensal.json" (google drive: https://drive.google.com/drive/folders/1LivGb9Nddbl2FByLqq6yPezBHxRzfBpT?usp=sharing)
 
     output: json file containing the distributions of individual polarities for each month ("DadosKDE_GranMensal.json" - google drive, same link above)
+
+    bandwidth selection (--bandwidth): "gridsearch" (GridSearchCV on a sample of 1000 users, the reference) or the fast
+    selectors of utils/kde.py, which use all the users: "loo" (leave-one-out likelihood, default), "isj", "silverman", "scott".
+    The months are processed in parallel (--processes).
+
+    density (--density): "fft" (default; linear binning + FFT convolution on a grid of at least --grid-points points and
+    a step <= bandwidth / 10, see utils/kde.py) or "exact" (sklearn score_samples on a grid of 10 points per user, the reference). --check-density stores the error of
+    the fft density against the exact one (computed at 200 grid points) in the output.
+
+    metrics: the time of loading, bandwidth selection and density of each month (also in the worker processes) is
+    written to "metrics_PolaritiesDistribution_<date>.json" in the output folder (see utils/instrumentation.py).
 '''
 from sklearn.model_selection import GridSearchCV
-from sklearn.neighbors.kde import KernelDensity
+from sklearn.neighbors import KernelDensity
 import argparse
 import numpy as np
 import json
-import timeit
 import traceback, sys
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import polarity_table
+import kde
+import instrumentation
 
 # Constantes
 sample_size = 1000
+grid_points = 4096          # pontos do grid da densidade "fft"
+check_points = 200          # pontos do grid usados para verificar o erro da densidade "fft"
 
 # Obtém dicionário do arquivo
 def get_dictionary(filename):
     print("Loading data...")
-    start = timeit.default_timer()
+    with instrumentation.timer("load"):
+        with open(filename, "r") as jfile:
+            data_dict = json.load(jfile)
 
-    with open(filename, "r") as jfile:
-        data_dict = json.load(jfile)
+    return data_dict
 
-    stop = timeit.default_timer()
-    print("Time to load: {0} s".format(stop - start))
+# Obtém os conjuntos de dados (periodo, array de polaridades individuais) do arquivo (tabela npz ou json)
+def get_data_sets(filename):
+    if os.path.splitext(filename)[1] == ".npz":
+        print("Loading data...")
+        with instrumentation.timer("load"):
+            table = polarity_table.load(filename)
+        return [(key, table.column(key, "diff")) for key in table.periods]
 
-    return data_dict
+    data_dict = get_dictionary(filename)
+    return [(key, np.array(get_data_array(val.items(), "diff"))) for (key, val) in data_dict.items()]
 
 # Obtém array contendo um tipo de valor do conjunto de dados de usuários
 def get_data_array(user_dict, val_type):
@@ -53,82 +80,142 @@ def find_best_bandwidth(x):
     grid.fit(x[:, None])
     return grid.best_params_["bandwidth"]
 
-# Obtém bandwidth para cada conjunto de dados (cada conjunto de polaridades a cada mês)
-def run(filename, output_filename):
-    print("Obter bandwith para conjunto de dados...")
-    data_dict = get_dictionary(filename)
-    result_dict = dict()
-
-    conjunto_dados = data_dict.items()
-    total_dados = len(conjunto_dados)
-    count = 0
-
-    for key, val in conjunto_dados:
-        count += 1
-        try:
-            start = timeit.default_timer()
-
-            print("Processing %s ... %d of %d" % (key, count, total_dados))
-            if key not in result_dict:
-                result_dict[key] = dict()
-
-            uvals = val.items()
-            total_usuarios = len(uvals)
-            diff_array = get_data_array(uvals, "diff")
+# Obtém bandwidth e distribuicao de um conjunto de dados (polaridades de um mês)
+def process_data_set(diff_array, method="loo", density="fft", total_grid_points=grid_points, check_density=False):
+    total_usuarios = len(diff_array)
+    with instrumentation.timer("kde_bandwidth"):
+        if method == "gridsearch":
             if (sample_size > total_usuarios):
-                diff_array_sample = np.array(diff_array.copy())
+                diff_array_sample = diff_array.copy()
             else:
                 diff_array_sample = np.random.choice(diff_array, size=sample_size, replace=False)
             bandwidth = find_best_bandwidth(diff_array_sample)
-            val_min = min(diff_array)
-            val_max = max(diff_array)
-
-            if (val_min < 0):
-                val_min_scale = 1.2*val_min
-            else:
-                val_min_scale = 0.8*val_min
-
-            if (val_max > 0):
-                val_max_scale = 1.2*val_max
-            else:
-                val_max_scale = 0.8*val_max
+        else:
+            bandwidth = kde.bandwidth(diff_array, method)
+    val_min = diff_array.min()
+    val_max = diff_array.max()
+
+    if (val_min < 0):
+        val_min_scale = 1.2*val_min
+    else:
+        val_min_scale = 0.8*val_min
+
+    if (val_max > 0):
+        val_max_scale = 1.2*val_max
+    else:
+        val_max_scale = 0.8*val_max
+
+    result = {"bandwidth": bandwidth,
+              "bandwidth_method": method,
+              "total_usuarios": total_usuarios,
+              "diff_array": diff_array.tolist()}
+
+    if density == "exact":
+        diff_grid = np.linspace(val_min_scale, val_max_scale, total_usuarios * 10)
+        with instrumentation.timer("kde_density"):
+            pdf = compute_kernel(diff_array, diff_grid, bandwidth)
+    else:
+        # step <= bandwidth / 10 (more points than total_grid_points for a small bandwidth)
+        diff_grid = np.linspace(val_min_scale, val_max_scale,
+                                kde.grid_size(val_min_scale, val_max_scale, bandwidth, total_grid_points))
+        with instrumentation.timer("kde_density"):
+            pdf = kde.binned_density(diff_array, diff_grid, bandwidth)
+        if check_density:
+            with instrumentation.timer("kde_check"):
+                (result["density_error"], result["density_error_relative"]) = \
+                    kde.density_error(diff_array, diff_grid, bandwidth, check_points)
+
+    result["density"] = density
+    result["grid_min"] = val_min_scale
+    result["grid_max"] = val_max_scale
+    result["pdf_array"] = pdf.tolist()
+    return result
+
+# Processa um conjunto de dados, medindo o tempo --> (resultado ou None, metricas do processamento)
+def process_timed(diff_array, options):
+    with instrumentation.collect() as metrics:
+        try:
+            with instrumentation.timer("process_data_set"):
+                result = process_data_set(diff_array, **options)
+        except Exception:
+            traceback.print_exc()
+            result = None
+    return (result, metrics.snapshot())
 
-            diff_grid = np.linspace(val_min_scale, val_max_scale, total_usuarios * 10)
-            pdf = compute_kernel(np.array(diff_array), diff_grid, bandwidth)
+# Obtém bandwidth para cada conjunto de dados (cada conjunto de polaridades a cada mês)
+# --> processes: meses processados em paralelo (1: em serie)
+def run(filename, output_filename, method="loo", processes=None, density="fft", total_grid_points=grid_points,
+        check_density=False):
+    print("Obter bandwith para conjunto de dados...")
+    run = instrumentation.start_run("PolaritiesDistribution", os.path.dirname(output_filename) or None)
+    conjunto_dados = get_data_sets(filename)
+    result_dict = dict()
 
-            # Adiciona ao dicionario
-            result_dict[key]["bandwidth"] = bandwidth
-            result_dict[key]["total_usuarios"] = total_usuarios
-            result_dict[key]["diff_array"] = diff_array
-            result_dict[key]["pdf_array"] = pdf.tolist()
-
-            # Tempo para rodar
-            stop = timeit.default_timer()
-            print("Time elapsed: {0} s".format(stop - start))
-        except:
+    total_dados = len(conjunto_dados)
+    keys = [key for (key, _) in conjunto_dados]
+    arrays = [diff_array for (_, diff_array) in conjunto_dados]
+    options = [{"method": method, "density": density, "total_grid_points": total_grid_points,
+                "check_density": check_density}] * total_dados
+
+    if processes == 1:
+        results = map(process_timed, arrays, options)
+        executor = None
+    else:
+        # each process gets its own random seed (gridsearch samples)
+        executor = ProcessPoolExecutor(max_workers=processes, initializer=np.random.seed)
+        results = executor.map(process_timed, arrays, options)
+
+    for (count, (key, (result, metrics))) in enumerate(zip(keys, results), 1):
+        run.merge(metrics)
+        run.add("users", len(arrays[count - 1]))
+        print("Processing %s ... %d of %d" % (key, count, total_dados))
+        if result is None:
             error_file = open(output_filename + "_ERROR.txt", "a")
             error_file.write("Error on key %s\n" % key)
             error_file.close()
+        else:
+            # Adiciona ao dicionario
+            result_dict[key] = result
+
+        # Tempo para rodar
+        print("Time elapsed: {0} s".format(metrics["timers"]["process_data_set"][0]))
+
+    if executor is not None:
+        executor.shutdown()
 
     # Resumo dos Dados
     print("Total: %d data sets" % total_dados)
 
     # Salva no arquivo
     print("Saving to JSON file...")
-    with open(output_filename + ".json", "w") as rfile:
-        json.dump(result_dict, rfile)
+    with instrumentation.timer("save"):
+        with open(output_filename + ".json", "w") as rfile:
+            json.dump(result_dict, rfile)
 
+    instrumentation.finish_run()
     print("Finished!")
 
 # MAIN
 if __name__ == "__main__":
     # file names
     rootfolder = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/Publico/Metrica_Polarizacao_Maio2018/PercentualTweetsPorPolaridade"
-    filename = os.path.join(rootfolder, "DiffPercentual_UsuariosSemLabel_GranMensal.json")
+    filename = os.path.join(rootfolder, "DiffPercentual_UsuariosSemLabel_GranMensal.npz")
 
     output_folder = os.path.join(rootfolder, "KDE")
     if (not os.path.exists(output_folder)):
         os.makedirs(output_folder)
     output_filename = os.path.join(output_folder, "DadosKDE_GranMensal")
 
-    run(filename, output_filename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Distribution (KDE) of the individual polarities of each month.")
+    parser.add_argument("--input", default=filename, help="table (npz) or json file of the individual polarities")
+    parser.add_argument("--output", default=output_filename, help="output file name (without extension)")
+    parser.add_argument("--bandwidth", choices=["gridsearch"] + sorted(kde.SELECTORS), default="loo",
+                        help="bandwidth selector")
+    parser.add_argument("--processes", type=int, default=None, help="months processed in parallel")
+    parser.add_argument("--density", choices=["fft", "exact"], default="fft", help="density estimator")
+    parser.add_argument("--grid-points", type=int, default=grid_points,
+                        help="least number of points of the grid of the fft density")
+    parser.add_argument("--check-density", action="store_true", help="stores the error of the fft density")
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.bandwidth, args.processes, args.density, args.grid_points, args.check_density)
\ No newline at end of file
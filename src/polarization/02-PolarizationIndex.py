@@ -4,15 +4,27 @@
     input: file containing the distribution of the individual polarities --> ex.: "DadosKDE_GranMensal.json" (google drive: https://drive.google.com/drive/folders/1LivGb9Nddbl2FByLqq6yPezBHxRzfBpT?usp=sharing)
 
     output: csv and json files containing the polarization metrics for each month --> ex.: "Metricas_Polarizacao_GranMensal.json" and "Metricas_Polarizacao_GranMensal.csv" (google drive, same link above)
+
+    method (--method): "exact" (default) computes the integrals of the KDE (a mixture of gaussians) in closed form (normal
+    cdf/pdf, see kde.mixture_integrals), for all the months in one batch; "quad" is the reference (numeric integration
+    of the sklearn KDE). --check computes both and reports the largest difference of each metric.
 '''
 
 from scipy.integrate import quad
-from sklearn.neighbors.kde import KernelDensity
+from sklearn.neighbors import KernelDensity
+import argparse
 import numpy as np
 import os
+import sys
 import json
 import csv
 
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import kde
+
+METRICS = ["pop_neg", "pop_pos", "diff_pops", "gc_neg", "gc_pos", "dist_gc", "pol_index"]
+
 # Obtém o dicionário com os conjuntos de dados
 def get_dictionary(filename):
     with open(filename, "r") as jfile:
@@ -25,56 +37,99 @@ def compute_kernel(x, bandwidth):
     kde_skl.fit(x[:, np.newaxis])
     return kde_skl
 
-# Computa os valores
-def run(filename, output_filename):
-    print("Loading data...")
-    data_dict = get_dictionary(filename)
+# Computa as metricas de um mes via integracao numerica (quad) do KDE do sklearn --> referencia
+def compute_metrics_quad(diff_array, bandwidth):
+    x_min = min(diff_array)
+    x_max = max(diff_array)
 
-    total_sets = len(data_dict.items())
-    count = 0
+    pdf = compute_kernel(diff_array, bandwidth)
 
-    result_dict = dict()
+    def kde_func(x):
+        return np.exp(pdf.score_samples(np.atleast_2d(x)))[0]
 
-    print("Computing values...")
-    for key, vals in data_dict.items():
-        count += 1
-        print("Reading %s --> %d of %f items" % (key, count, total_sets))
+    def expect_kde(x):
+        return np.exp(pdf.score_samples(np.atleast_2d(x)))[0] * x
 
-        bandwidth = vals["bandwidth"]
-        diff_array = np.array(vals["diff_array"])
+    pop_neg, err = quad(kde_func, -1, 0) # densidade de individuos da populacao negativa -> A-
+    pop_pos, err = quad(kde_func, 0, 1) # densidade de individuos da populacao positiva -> A+
+    diff_pops = abs(pop_pos - pop_neg) # diferenca de densidade -> delta A
 
-        x_min = min(diff_array)
-        x_max = max(diff_array)
+    exp_neg, err = quad(expect_kde, -1, 0) # esperanca de polaridade para pop negativa
+    gc_neg = exp_neg/pop_neg               # centro de gravidade da pop negativa
+    exp_pos, err = quad(expect_kde, 0, 1) # esperanca de polaridade para pop positiva
+    gc_pos = exp_pos/pop_pos             # centro de gravidade da pop positiva
 
-        pdf = compute_kernel(diff_array, bandwidth)
+    dist_gc = abs(gc_pos - gc_neg) / abs(x_max - x_min) # distancia entre os centros de gravidade
 
-        def kde_func(x):
-            return np.exp(pdf.score_samples(x))
+    pol_index = (1 - diff_pops) * dist_gc       # polarization index
 
-        def expect_kde(x):
-            return np.exp(pdf.score_samples(x)) * x
+    return {"pop_neg": pop_neg, "pop_pos": pop_pos, "diff_pops": diff_pops, "gc_neg": gc_neg, "gc_pos": gc_pos,
+            "dist_gc": dist_gc, "pol_index": pol_index}
 
-        pop_neg, err = quad(kde_func, -1, 0) # densidade de individuos da populacao negativa -> A-
-        pop_pos, err = quad(kde_func, 0, 1) # densidade de individuos da populacao positiva -> A+
-        diff_pops = abs(pop_pos - pop_neg) # diferenca de densidade -> delta A
+# Computa as metricas de todos os meses de uma vez (integrais do KDE em forma fechada) --> {metrica: array (um valor por mes)}
+# --> um mes sem dados tem todas as metricas NaN
+def compute_metrics_exact(diff_arrays, bandwidths):
+    sizes = np.array([len(diff_array) for diff_array in diff_arrays])
+    x = np.concatenate(diff_arrays)
+    meses = np.repeat(np.arange(len(diff_arrays)), sizes)
 
-        exp_neg, err = quad(expect_kde, -1, 0) # esperanca de polaridade para pop negativa
-        gc_neg = exp_neg/pop_neg               # centro de gravidade da pop negativa
-        exp_pos, err = quad(expect_kde, 0, 1) # esperanca de polaridade para pop positiva
-        gc_pos = exp_pos/pop_pos             # centro de gravidade da pop positiva
+    pop_neg, exp_neg = kde.mixture_integrals(x, meses, bandwidths, -1, 0, len(diff_arrays))
+    pop_pos, exp_pos = kde.mixture_integrals(x, meses, bandwidths, 0, 1, len(diff_arrays))
+    diff_pops = np.abs(pop_pos - pop_neg)
+    gc_neg = exp_neg / pop_neg
+    gc_pos = exp_pos / pop_pos
 
-        dist_gc = abs(gc_pos - gc_neg) / abs(x_max - x_min) # distancia entre os centros de gravidade
+    # minimo e maximo de cada mes (reduceat so nos meses com dados: um inicio repetido devolveria o elemento seguinte)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    cheios = sizes > 0
+    x_min = np.full(len(diff_arrays), np.nan)
+    x_max = np.full(len(diff_arrays), np.nan)
+    if cheios.any():
+        x_min[cheios] = np.minimum.reduceat(x, starts[cheios])
+        x_max[cheios] = np.maximum.reduceat(x, starts[cheios])
+    dist_gc = np.abs(gc_pos - gc_neg) / np.abs(x_max - x_min)
+    pol_index = (1 - diff_pops) * dist_gc
 
-        pol_index = (1 - diff_pops) * dist_gc       # polarization index
+    return {"pop_neg": pop_neg, "pop_pos": pop_pos, "diff_pops": diff_pops, "gc_neg": gc_neg, "gc_pos": gc_pos,
+            "dist_gc": dist_gc, "pol_index": pol_index}
 
-        result_dict[key] = dict()
-        result_dict[key]["pop_neg"] = pop_neg
-        result_dict[key]["pop_pos"] = pop_pos
-        result_dict[key]["diff_pops"] = diff_pops
-        result_dict[key]["gc_neg"] = gc_neg
-        result_dict[key]["gc_pos"] = gc_pos
-        result_dict[key]["dist_gc"] = dist_gc
-        result_dict[key]["pol_index"] = pol_index
+# Computa os valores
+# --> method: "exact" (forma fechada, todos os meses de uma vez) ou "quad" (integracao numerica, referencia)
+# --> check: computa pelos dois metodos e mostra a maior diferenca de cada metrica (os valores salvos sao os de "method")
+# --> os meses sem dados (diff_array vazio) sao ignorados
+def run(filename, output_filename, method="exact", check=False):
+    print("Loading data...")
+    data_dict = get_dictionary(filename)
+
+    keys = [key for key in data_dict.keys() if len(data_dict[key]["diff_array"]) > 0]
+    for key in data_dict.keys():
+        if len(data_dict[key]["diff_array"]) == 0:
+            print("Skipping %s: no data" % key)
+    bandwidths = np.array([data_dict[key]["bandwidth"] for key in keys], dtype=np.float64)
+    diff_arrays = [np.array(data_dict[key]["diff_array"], dtype=np.float64) for key in keys]
+    total_sets = len(keys)
+
+    print("Computing values...")
+    exact_dict, quad_dict = dict(), dict()
+    if method == "exact" or check:
+        metrics = compute_metrics_exact(diff_arrays, bandwidths) if total_sets > 0 else {}
+        for (i, key) in enumerate(keys):
+            exact_dict[key] = {name: float(metrics[name][i]) for name in METRICS}
+
+    if method == "quad" or check:
+        for (count, key) in enumerate(keys, 1):
+            print("Reading %s --> %d of %d items" % (key, count, total_sets))
+            quad_dict[key] = compute_metrics_quad(diff_arrays[count - 1], bandwidths[count - 1])
+
+    if check:
+        for key in keys:
+            print(key)
+            for name in METRICS:
+                erro = abs(exact_dict[key][name] - quad_dict[key][name])
+                print("  %s: exact = %.12g, quad = %.12g, diff = %.3g" %
+                      (name, exact_dict[key][name], quad_dict[key][name], erro))
+
+    result_dict = exact_dict if method == "exact" else quad_dict
 
     # Salva no JSON
     print("Saving to JSON file...")
@@ -106,4 +161,11 @@ if __name__ == "__main__":
 
     output_filename = os.path.join(rootfolder, "Metricas_Polarizacao_GranMensal.json")
 
-    run(filename, output_filename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Polarization index and related metrics of each month.")
+    parser.add_argument("--input", default=filename, help="json file of the distributions (DadosKDE)")
+    parser.add_argument("--output", default=output_filename, help="output file name (without extension)")
+    parser.add_argument("--method", choices=["exact", "quad"], default="exact", help="integration of the KDE")
+    parser.add_argument("--check", action="store_true", help="compares the exact and quad methods")
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.method, args.check)
\ No newline at end of file
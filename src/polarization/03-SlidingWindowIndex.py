@@ -0,0 +1,120 @@
+'''
+    Computes the polarization index over sliding windows of days (ex.: the daily index of the last 7 or 30 days)
+
+    input: totals of each day of the unlabeled users ("TotaisDiarios_UsuariosSemLabel.npz", written by
+    "polarities/01-TotalsUnlabeledUsers.py --diario", see utils/daily_totals.py)
+
+    output: one time series per window length --> "Metricas_Polarizacao_Janela<N>Dias.json" and ".csv" (one row per window,
+    identified by its last day). A window with less than two distinct polarities (ex.: a single user) has null metrics.
+
+    The windows are formed incrementally from the daily counts (no graph is read again). For each window, the individual
+    polarities are (pro - anti) / (pro + anti) of the users in the window (the same values of the monthly pipeline),
+    the bandwidth is chosen by the selectors of utils/kde.py (--bandwidth) and the metrics are computed by the exact
+    engine of "02-PolarizationIndex.py" (a block of windows at a time).
+'''
+import argparse
+import numpy as np
+import os
+import sys
+import json
+import csv
+import timeit
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import utils
+import kde
+import daily_totals
+
+SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
+polarization_index = utils.load_script(os.path.join(SCRIPT_FOLDER, "02-PolarizationIndex.py"))
+
+# Constantes
+janelas_padrao = [7, 30]    # tamanhos das janelas (dias)
+bloco = 64                  # janelas processadas de uma vez pelo engine exato
+
+# valor numerico para os arquivos de saida (None/null no lugar de NaN ou infinito, que nao sao json validos)
+def valor(x):
+    x = float(x)
+    return x if np.isfinite(x) else None
+
+# Computa as metricas de um bloco de janelas --> lista de dicionarios (uma linha por janela)
+# --> uma janela com menos de duas polaridades distintas (ex.: um unico usuario) nao tem KDE (bandwidth 0 ou NaN) nem
+#     amplitude (x_max - x_min = 0): ela aparece na serie com as metricas nulas
+def processar_bloco(janelas, method):
+    diff_arrays = [(pro - anti) / (pro + anti) for (_, _, _, pro, anti) in janelas]
+    bandwidths = np.full(len(janelas), np.nan)
+    validas = []
+    for (i, diff_array) in enumerate(diff_arrays):
+        if len(np.unique(diff_array)) >= 2:
+            bandwidths[i] = kde.bandwidth(diff_array, method)
+            if np.isfinite(bandwidths[i]) and bandwidths[i] > 0:
+                validas.append(i)
+    metrics = polarization_index.compute_metrics_exact([diff_arrays[i] for i in validas], bandwidths[validas]) \
+        if len(validas) > 0 else {}
+    posicao = {i: j for (j, i) in enumerate(validas)}
+
+    linhas = []
+    for (i, (inicio, fim, usuarios, _, _)) in enumerate(janelas):
+        linha = {"key": fim, "start": inicio, "total_usuarios": len(usuarios), "bandwidth": valor(bandwidths[i])}
+        for name in polarization_index.METRICS:
+            linha[name] = valor(metrics[name][posicao[i]]) if i in posicao else None
+        linhas.append(linha)
+    return linhas
+
+# Serie temporal de uma janela --> lista de linhas (janelas sem usuarios sao ignoradas)
+def serie_janela(tabela, tamanho, method="loo"):
+    linhas = []
+    pendentes = []
+    for janela in daily_totals.sliding_windows(tabela, tamanho):
+        if len(janela[2]) == 0:
+            continue
+        pendentes.append(janela)
+        if len(pendentes) == bloco:
+            linhas += processar_bloco(pendentes, method)
+            pendentes = []
+    if len(pendentes) > 0:
+        linhas += processar_bloco(pendentes, method)
+    return linhas
+
+# Computa a serie temporal de cada tamanho de janela e salva (json e csv)
+def run(filename, output_folder, janelas=janelas_padrao, method="loo"):
+    print("Loading data...")
+    tabela = daily_totals.load(filename)
+    print("%d days, %d rows" % (len(tabela.days), len(tabela)))
+
+    for tamanho in janelas:
+        print("Computing the %d-day windows..." % tamanho)
+        start = timeit.default_timer()
+        linhas = serie_janela(tabela, tamanho, method)
+        print("%d windows. Time elapsed: %f s" % (len(linhas), timeit.default_timer() - start))
+
+        output_filename = os.path.join(output_folder, "Metricas_Polarizacao_Janela%dDias" % tamanho)
+        with open(output_filename + ".json", "w") as jfile:
+            json.dump({linha["key"]: {k: v for (k, v) in linha.items() if k != "key"} for linha in linhas}, jfile,
+                      allow_nan=False)
+
+        with open(output_filename + ".csv", "w", newline="") as csvfile:
+            fieldnames = ["key", "start", "total_usuarios", "bandwidth"] + polarization_index.METRICS
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(linhas)
+
+    print("Finished!")
+
+
+if __name__ == "__main__":
+    rootfolder = "/home/robertacoeli/Documents/Pesquisa/Results/Twitter/Publico/Experimentos_Redes_Retweets_v2/Arquivos_Redes"
+    filename = os.path.join(rootfolder, "TotaisDiarios_UsuariosSemLabel.npz")
+
+    parser = argparse.ArgumentParser(description="Polarization index over sliding windows of days.")
+    parser.add_argument("--input", default=filename, help="totals of each day (npz)")
+    parser.add_argument("--output", default=rootfolder, help="output folder")
+    parser.add_argument("--windows", type=int, nargs="+", default=janelas_padrao, help="window lengths (days)")
+    parser.add_argument("--bandwidth", choices=sorted(kde.SELECTORS), default="loo", help="bandwidth selector")
+    args = parser.parse_args()
+
+    if (not os.path.exists(args.output)):
+        os.makedirs(args.output)
+
+    run(args.input, args.output, args.windows, args.bandwidth)
@@ -19,6 +19,20 @@ punctuation_translator = str.maketrans({key: " " for key in string.punctuation})
 # repeated_letters_pattern: regular expression to remove repeated letters from text
 repeated_letters_pattern = re.compile(r"(.)\1{1,}", re.DOTALL)
 
+# precompiled patterns: compiled once at import instead of going through the regex cache on every call
+extra_spacing_pattern = re.compile("[\n\t\r ]+")
+money_pattern = re.compile(r"R?\$")
+numbers_pattern = re.compile(r"(?:\d*\.)?\d+")
+urls_patterns = [re.compile(r"[-a-zA-Z0-9@:%_\+.~#?&//=]{2,256}\.[a-z]{2,4}\b(\/[-a-zA-Z0-9@:%_\+.~#?&//=]*)?"),
+                 re.compile(r"\b[http(s)?:%_\+.~#?&//=]{2,256}[\S]*"),
+                 re.compile(r"[http(s)?:%_\+.~#?&//=]{2,256}(\.|:|\/)")]
+hashtags_pattern = re.compile(r"(?:\#+[\w_]+[\w\'_\-]*[\w_]+)")
+mentions_pattern = re.compile(r'(?:@[\w_]+)')
+via_pattern = re.compile(r"(\b[vV]ia\b)+")
+rt_pattern = re.compile(r"(\b[Rr][tT]\b)+")
+laughter_pattern = re.compile(r"\b(kk|rs|ha|hau|hua|hue)+")
+incomplete_pattern = re.compile(r"(\w)*[(\.)]{2,}")
+
 # stop_words: load stop words' set
 stop_words = set()
 for line in open(os.path.join(dir_path, "stopwords_ptbr"), "r", encoding="utf-8"):
@@ -59,39 +73,37 @@ def remove_punctuation(text):
 
 # remove_numbers: remove numbers from text
 def remove_numbers(text):
-    numbers_money = re.sub(r"R?\$", " dinheiro ", text)
-    return re.sub(r"(?:\d*\.)?\d+", "", numbers_money)
+    numbers_money = money_pattern.sub(" dinheiro ", text)
+    return numbers_pattern.sub("", numbers_money)
 
 # remove_urls: remove urls from text
 def remove_urls(text):
-    no_urls_text = re.sub(
-        r"[-a-zA-Z0-9@:%_\+.~#?&//=]{2,256}\.[a-z]{2,4}\b(\/[-a-zA-Z0-9@:%_\+.~#?&//=]*)?",
-        "", text)
-    no_urls_text = re.sub(r"\b[http(s)?:%_\+.~#?&//=]{2,256}[\S]*", "", no_urls_text)
-    return re.sub(
-        r"[http(s)?:%_\+.~#?&//=]{2,256}(\.|:|\/)", "", no_urls_text)
+    no_urls_text = urls_patterns[0].sub("", text)
+    no_urls_text = urls_patterns[1].sub("", no_urls_text)
+    return urls_patterns[2].sub("", no_urls_text)
 
 def remove_twitter_elements(text):
-    cleaned_text = re.sub(r"(?:\#+[\w_]+[\w\'_\-]*[\w_]+)", " ", text) # remove hashtags
-    cleaned_text = re.sub(r'(?:@[\w_]+)', " ", cleaned_text) # remove mentions
-    cleaned_text = re.sub(r"(\b[vV]ia\b)+", "", cleaned_text) # remove "via"
-    cleaned_text = re.sub(r"(\b[Rr][tT]\b)+", "", cleaned_text)  # remove RT
-    cleaned_text = re.sub(r"\b(kk|rs|ha|hau|hua|hue)+", "risadas", cleaned_text)  # substitui risadas
+    cleaned_text = hashtags_pattern.sub(" ", text) # remove hashtags
+    cleaned_text = mentions_pattern.sub(" ", cleaned_text) # remove mentions
+    cleaned_text = via_pattern.sub("", cleaned_text) # remove "via"
+    cleaned_text = rt_pattern.sub("", cleaned_text)  # remove RT
+    cleaned_text = laughter_pattern.sub("risadas", cleaned_text)  # substitui risadas
     return cleaned_text
 
 def remove_incomplete(text):
-    return re.sub(r"(\w)*[(\.)]{2,}", "", text)
+    return incomplete_pattern.sub("", text)
 
 # remove_extra_spacing: remove additional spacing in text
 def remove_extra_spacing(text):
-    return re.sub("[\n\t\r ]+", " ", text)
+    return extra_spacing_pattern.sub(" ", text)
 
 # remove_stop_words: remove stop words from text
 def remove_stop_words(text_tokens):
     return [term for term in text_tokens if (term not in stop_words) and (len(term) > 1)]
 
-# preprocess_text: sequence of steps to preprocess text
-def preprocess_text(text):
+# preprocess_text_reference: sequence of steps to preprocess text (one pass per step)
+# --> reference for the fused engine below (see check_equivalence)
+def preprocess_text_reference(text):
     # proc_text = remove_twitter_elements(text)
     proc_text = remove_extra_spacing(text)
     proc_text = remove_urls(proc_text)
@@ -107,4 +119,78 @@ def preprocess_text(text):
     if stemming_allowed:
         proc_tokens = [stemmer.stem(tt) for tt in proc_tokens]
     proc_text = " ".join(proc_tokens)
-    return (proc_text, proc_tokens)
\ No newline at end of file
+    return (proc_text, proc_tokens)
+
+########################## FUSED ENGINE ##########################
+# The same steps of preprocess_text_reference, with the compatible passes combined:
+# - numbers and money ("R$") are replaced in a single regex pass;
+# - the two punctuation translations (and the "lower" calls) become a single translation (the text is already lowercase);
+# - hashtags and mentions are not searched: "#" and "@" were already removed with the punctuation;
+# - "via", "RT" and the laughter ("risadas") are replaced in a single regex pass;
+# - tokenization: the text has no punctuation at this point, so the Treebank tokenizer (word_tokenize) only splits
+#   on whitespace and some contractions ("cannot" -> "can not", "gonna" -> "gon na", ...). Texts with any other
+#   character fall back to word_tokenize;
+# - abbreviations and stop words are processed in a single pass over the tokens.
+
+numbers_money_pattern = re.compile(r"R?\$|(?:\d*\.)?\d+")
+twitter_words_pattern = re.compile(r"(\bvia\b|\brt\b)|\b(?:kk|rs|ha|hau|hua|hue)+")
+fast_tokenizer_pattern = re.compile(r"[a-z0-9 ]*")
+fused_punctuation_translator = str.maketrans({key: (None if key in "-_" else " ") for key in string.punctuation})
+
+# contractions split by the Treebank tokenizer in a text without punctuation
+treebank_contractions = {"cannot": ["can", "not"], "gimme": ["gim", "me"], "gonna": ["gon", "na"],
+                         "gotta": ["got", "ta"], "lemme": ["lem", "me"], "wanna": ["wan", "na"]}
+
+def replace_numbers_money(match):
+    return " dinheiro " if match.group().endswith("$") else ""
+
+def replace_twitter_words(match):
+    return "" if match.group(1) is not None else "risadas"
+
+# tokenize: fast path for texts having only lowercase letters, digits and spaces (same output of word_tokenize)
+def tokenize(text):
+    if fast_tokenizer_pattern.fullmatch(text) is None:
+        return word_tokenize(text)
+    tokens = []
+    for token in text.split():
+        if token in treebank_contractions:
+            tokens.extend(treebank_contractions[token])
+        else:
+            tokens.append(token)
+    return tokens
+
+# preprocess_text: fused and precompiled version of preprocess_text_reference
+def preprocess_text(text):
+    proc_text = extra_spacing_pattern.sub(" ", text)
+    proc_text = remove_urls(proc_text)
+    proc_text = numbers_money_pattern.sub(replace_numbers_money, proc_text)
+    proc_text = unidecode(proc_text).lower()
+    proc_text = incomplete_pattern.sub("", proc_text)
+    proc_text = proc_text.translate(fused_punctuation_translator)
+    proc_text = repeated_letters_pattern.sub(r"\1\1", proc_text)
+    proc_text = twitter_words_pattern.sub(replace_twitter_words, proc_text)
+
+    proc_tokens = []
+    for tt in tokenize(proc_text):
+        tt = abbv_dict.get(tt, tt)
+        if (tt not in stop_words) and (len(tt) > 1):
+            proc_tokens.append(tt)
+    if stemming_allowed:
+        proc_tokens = [stemmer.stem(tt) for tt in proc_tokens]
+    proc_text = " ".join(proc_tokens)
+    return (proc_text, proc_tokens)
+
+# preprocess_many: preprocess a batch of texts (repeated texts of the batch are processed only once)
+def preprocess_many(texts):
+    processed = dict()
+    results = []
+    for text in texts:
+        if text not in processed:
+            processed[text] = preprocess_text(text)
+        results.append(processed[text])
+    return results
+
+# check_equivalence: compares the fused engine with the reference sequence of steps on a sample of texts
+# --> returns the texts whose outputs differ
+def check_equivalence(texts):
+    return [text for text in texts if preprocess_text(text) != preprocess_text_reference(text)]
@@ -0,0 +1,329 @@
+'''
+Near-real-time polarization index of a live feed of tweets (asyncio).
+
+input: tweets (one json per line, the same format of the database) from a file that is being written ("tail -f", --file)
+or from local socket connections (--port; ex.: "cat tweets.json | nc localhost 9999").
+
+output: one record per publication, appended to a json lines file (--output) --> counts of tweets and users, the
+polarization metrics of the unlabeled users (see "polarization/02-PolarizationIndex.py") and the latency.
+
+The steps of the batch pipeline are updated incrementally for each tweet:
+    - labels: the counters of hashtag groups of the author (see "labeling/01-FindingUsersHashtags.py") and its label,
+      resolved with the same rules of resolve_users_groups applied to the user alone;
+    - retweets: the number of retweets of each user in each author (the weighted edges of the retweet network);
+    - totals: the retweets of each user in "favoravel" and "contrario" authors (see "polarities/01-TotalsUnlabeledUsers.py").
+      When the label of an author changes, the retweets in it are moved between the totals.
+Every --interval seconds, the individual polarities of the unlabeled users are computed from the totals and the index is
+published (bandwidth: utils/kde.py; metrics: exact engine of "02-PolarizationIndex.py").
+
+latency: time from the arrival of a tweet (line read) to the publication of the first index that includes it. The
+publication of each record reports the largest and the mean latency of the tweets it includes. The queue between the
+reader and the consumer is bounded (--queue-size) and the readers and the consumer give the control back to the event
+loop every "batch_size" tweets (a put in a queue that is not full does not), so the latency stays close to --interval
+plus the time to compute the index.
+'''
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+# internal modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+import utils
+import kde
+from hashtag_matcher import HashtagMatcher, FAVORAVEL, CONTRARIO
+from tweet_reader import TweetReader, HASHTAGS, RETWEETS, LABELING_FIELDS, RETWEET_FIELDS
+
+SCRIPT_FOLDER = os.path.dirname(os.path.realpath(__file__))
+polarization_index = utils.load_script(os.path.join(SCRIPT_FOLDER, "..", "polarization", "02-PolarizationIndex.py"))
+
+# labels (same codes of the sidecars of "labeling/04-LabelingNetworks.py")
+NONE, LABEL_CONTRARIO, LABEL_FAVORAVEL = 0, 1, 2
+LABELS = ["None", "CONTRARIO", "FAVORAVEL"]
+
+# hashtag counters of each user (columns)
+COUNT_FAVORAVEL, COUNT_CONTRARIO, COUNT_FAVCONT = 0, 1, 2
+
+# tweets read or processed before giving the control back to the event loop
+batch_size = 1000
+
+# resolve_label: label of a user from its counters (rules of resolve_users_groups for a single user)
+# --> tweets with both "favoravel" and "contrario" hashtags are counted as "favcont"
+def resolve_label(cf, cc, cfc):
+    if cf > 0 and cc > 0:
+        if ((cfc > cf) and (cfc > cc)) or (cf == cc):
+            return NONE
+        return LABEL_FAVORAVEL if cf > cc else LABEL_CONTRARIO
+    if cf > 0:
+        return LABEL_FAVORAVEL
+    if cc > 0:
+        return LABEL_CONTRARIO
+    return NONE
+
+class PolarizationState:
+
+    def __init__(self, hashtag_matcher, capacity=1024):
+        self.hashtag_matcher = hashtag_matcher
+        self.tweet_reader = TweetReader(LABELING_FIELDS + [f for f in RETWEET_FIELDS if f not in LABELING_FIELDS],
+                                        [HASHTAGS, RETWEETS])
+        self.users = dict()                                          # user id (str) -> index
+        self.hashtags = np.zeros((capacity, 3), dtype=np.int64)     # hashtag counters of each user
+        self.labels = np.zeros(capacity, dtype=np.int8)
+        self.pro = np.zeros(capacity, dtype=np.int64)                # retweets in "favoravel" authors
+        self.anti = np.zeros(capacity, dtype=np.int64)               # retweets in "contrario" authors
+        self.retweeters = dict()                                     # author -> {retweeter: number of retweets}
+        self.total_tweets = 0
+        self.total_retweets = 0
+
+    # user: index of a user (the arrays grow when needed)
+    def user(self, user_id):
+        index = self.users.get(user_id)
+        if index is None:
+            index = len(self.users)
+            self.users[user_id] = index
+            if index == len(self.labels):
+                self.hashtags = np.concatenate([self.hashtags, np.zeros_like(self.hashtags)])
+                self.labels = np.concatenate([self.labels, np.zeros_like(self.labels)])
+                self.pro = np.concatenate([self.pro, np.zeros_like(self.pro)])
+                self.anti = np.concatenate([self.anti, np.zeros_like(self.anti)])
+        return index
+
+    # add_retweets: adds (sign = 1) or removes (sign = -1) the retweets in an author to the totals of the label
+    def add_retweets(self, label, retweeters, sign):
+        totals = self.pro if label == LABEL_FAVORAVEL else self.anti
+        for (retweeter, count) in retweeters.items():
+            totals[retweeter] += sign * count
+
+    # update_label: resolves the label of a user again; the retweets in it are moved to the totals of the new label
+    def update_label(self, author):
+        label = resolve_label(*self.hashtags[author].tolist())
+        if label != self.labels[author]:
+            retweeters = self.retweeters.get(author, {})
+            if self.labels[author] != NONE:
+                self.add_retweets(self.labels[author], retweeters, -1)
+            if label != NONE:
+                self.add_retweets(label, retweeters, 1)
+            self.labels[author] = label
+
+    # process_line: updates the state with a line of the feed (bytes)
+    def process_line(self, line):
+        self.total_tweets += 1
+        tweet = self.tweet_reader.decode(line)
+        if tweet is not None:
+            self.process_tweet(tweet)
+
+    def process_tweet(self, tweet):
+        hashtags = [htg["text"] for htg in tweet.get("entities", {}).get("hashtags", [])]
+        if len(hashtags) > 0:
+            mask = self.hashtag_matcher.match(hashtags)
+            column = None
+            if mask & FAVORAVEL and mask & CONTRARIO:
+                column = COUNT_FAVCONT
+            elif mask & FAVORAVEL:
+                column = COUNT_FAVORAVEL
+            elif mask & CONTRARIO:
+                column = COUNT_CONTRARIO
+            if column is not None:
+                author = self.user(tweet["user"]["id_str"])
+                self.hashtags[author, column] += 1
+                self.update_label(author)
+
+        if "retweeted_status" in tweet:
+            self.total_retweets += 1
+            author = self.user(tweet["retweeted_status"]["user"]["id_str"])
+            retweeter = self.user(tweet["user"]["id_str"])
+            retweeters = self.retweeters.setdefault(author, dict())
+            retweeters[retweeter] = retweeters.get(retweeter, 0) + 1
+            if self.labels[author] == LABEL_FAVORAVEL:
+                self.pro[retweeter] += 1
+            elif self.labels[author] == LABEL_CONTRARIO:
+                self.anti[retweeter] += 1
+
+    # polarities: individual polarities of the unlabeled users that retweeted labeled ones
+    def polarities(self):
+        total_users = len(self.users)
+        pro, anti = self.pro[:total_users], self.anti[:total_users]
+        selected = (self.labels[:total_users] == NONE) & ((pro + anti) > 0)
+        return (pro[selected] - anti[selected]) / (pro[selected] + anti[selected])
+
+    # snapshot: counts and polarization metrics of the current state
+    def snapshot(self, method="loo"):
+        diff_array = self.polarities()
+        labels = self.labels[:len(self.users)]
+        record = {"tweets": self.total_tweets, "retweets": self.total_retweets, "users": len(self.users),
+                  "labeled": {LABELS[code]: int(np.count_nonzero(labels == code)) for code in [LABEL_FAVORAVEL, LABEL_CONTRARIO]},
+                  "total_usuarios": len(diff_array)}
+        if len(diff_array) < 2:
+            return record
+        bandwidth = kde.bandwidth(diff_array, method)
+        metrics = polarization_index.compute_metrics_exact([diff_array], np.array([bandwidth]))
+        record["bandwidth"] = bandwidth
+        for name in polarization_index.METRICS:
+            record[name] = float(metrics[name][0])
+        return record
+
+class StreamingPolarization:
+
+    def __init__(self, state, output_filename, interval=10.0, queue_size=10000, method="loo", max_latency=None):
+        self.state = state
+        self.output_filename = output_filename
+        self.interval = interval
+        self.queue_size = queue_size
+        self.method = method
+        self.max_latency = max_latency
+        self.queue = None
+        self.finished = None
+
+        # arrival times of the tweets processed since the last publication (oldest, sum and count)
+        self.oldest_arrival = None
+        self.sum_arrival = 0.0
+        self.pending = 0
+
+    # read_file: follows a file that is being written (as "tail -f"); stop_at_eof: stops at the end of the file
+    async def read_file(self, filename, from_start=True, stop_at_eof=False, poll=0.2):
+        loop = asyncio.get_running_loop()
+        with open(filename, "rb") as ffile:
+            if not from_start:
+                ffile.seek(0, os.SEEK_END)
+            partial = b""
+            read = 0
+            while True:
+                line = ffile.readline()
+                if line == b"":
+                    if stop_at_eof:
+                        break
+                    await asyncio.sleep(poll)
+                    continue
+                if not line.endswith(b"\n"):
+                    partial += line # the line is still being written
+                    continue
+                await self.queue.put((loop.time(), partial + line))
+                partial = b""
+                read += 1
+                if read % batch_size == 0:
+                    await asyncio.sleep(0)
+        if len(partial.strip()) > 0:
+            await self.queue.put((loop.time(), partial))
+        await self.queue.put(None)
+
+    # handle_connection: reads the lines of a socket connection
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        read = 0
+        while True:
+            line = await reader.readline()
+            if line == b"":
+                break
+            if len(line.strip()) > 0:
+                await self.queue.put((loop.time(), line))
+                read += 1
+                if read % batch_size == 0:
+                    await asyncio.sleep(0)
+        writer.close()
+
+    # consume: updates the state with the tweets of the queue
+    async def consume(self):
+        processed = 0
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                break
+            (arrival, line) = item
+            try:
+                self.state.process_line(line)
+            except (ValueError, KeyError, TypeError) as error:
+                print("[ERROR] Invalid tweet: %s" % error)
+            if self.oldest_arrival is None:
+                self.oldest_arrival = arrival
+            self.sum_arrival += arrival
+            self.pending += 1
+            processed += 1
+            if processed % batch_size == 0:
+                await asyncio.sleep(0)
+        self.finished.set()
+
+    # publish: computes the index and appends the record to the output file
+    def publish(self):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        record = self.state.snapshot(self.method)
+        now = loop.time()
+        record["time"] = datetime.now().isoformat(timespec="seconds")
+        record["compute_time"] = time.perf_counter() - start
+        record["new_tweets"] = self.pending
+        record["latency_max"] = now - self.oldest_arrival if self.pending > 0 else None
+        record["latency_mean"] = now - self.sum_arrival / self.pending if self.pending > 0 else None
+        record["queue"] = self.queue.qsize()
+        self.oldest_arrival, self.sum_arrival, self.pending = None, 0.0, 0
+
+        with open(self.output_filename, "a") as ofile:
+            ofile.write(json.dumps(record) + "\n")
+        print("[%s] %d tweets, %d unlabeled users, pol_index = %s, latency = %s s" %
+              (record["time"], record["tweets"], record["total_usuarios"], record.get("pol_index"),
+               "-" if record["latency_max"] is None else "%.3f" % record["latency_max"]))
+        if self.max_latency is not None and record["latency_max"] is not None and record["latency_max"] > self.max_latency:
+            print("[WARNING] latency %.3f s > %.3f s" % (record["latency_max"], self.max_latency))
+        return record
+
+    # publisher: publishes every "interval" seconds (and once more when the feed ends)
+    async def publisher(self):
+        loop = asyncio.get_running_loop()
+        next_time = loop.time() + self.interval
+        while not self.finished.is_set():
+            try:
+                await asyncio.wait_for(self.finished.wait(), max(0.0, next_time - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+            self.publish()
+            next_time += self.interval
+            # a slow publication does not cause a burst of publications
+            next_time = max(next_time, loop.time())
+
+    # run: reads a file (filename) or listens on a local port
+    async def run(self, filename=None, host="127.0.0.1", port=None, from_start=True, stop_at_eof=False):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.finished = asyncio.Event()
+        consumer = asyncio.create_task(self.consume())
+        publisher = asyncio.create_task(self.publisher())
+        if filename is not None:
+            await self.read_file(filename, from_start, stop_at_eof)
+            await asyncio.gather(consumer, publisher)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print("Listening on %s:%d" % (host, port))
+            async with server:
+                await server.serve_forever()
+
+# MAIN
+if __name__ == "__main__":
+    hashtagsFile = os.path.join(SCRIPT_FOLDER, "..", "labeling", "hashtags_groups.txt")
+    outputFile = os.path.join(os.getcwd(), "Polarizacao_TempoReal.jsonl")
+
+    parser = argparse.ArgumentParser(description="Near-real-time polarization index of a live feed of tweets.")
+    parser.add_argument("--file", default=None, help="file of tweets that is being written (followed as tail -f)")
+    parser.add_argument("--port", type=int, default=None, help="local port that receives the tweets (one per line)")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the socket")
+    parser.add_argument("--from-end", action="store_true", help="skips the tweets already in the file")
+    parser.add_argument("--stop-at-eof", action="store_true", help="stops at the end of the file")
+    parser.add_argument("--output", default=outputFile, help="json lines file of the publications")
+    parser.add_argument("--hashtags", default=hashtagsFile, help="file of the hashtags of each group")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between publications")
+    parser.add_argument("--queue-size", type=int, default=10000, help="tweets waiting to be processed")
+    parser.add_argument("--bandwidth", choices=sorted(kde.SELECTORS), default="loo", help="bandwidth selector")
+    parser.add_argument("--max-latency", type=float, default=None, help="warns when the latency is larger (s)")
+    args = parser.parse_args()
+
+    if (args.file is None) == (args.port is None):
+        parser.error("one of --file or --port is required")
+
+    state = PolarizationState(HashtagMatcher.from_file(args.hashtags))
+    streaming = StreamingPolarization(state, args.output, args.interval, args.queue_size, args.bandwidth,
+                                      args.max_latency)
+    try:
+        asyncio.run(streaming.run(args.file, args.host, args.port, not args.from_end, args.stop_at_eof))
+    except KeyboardInterrupt:
+        print("Finished!")
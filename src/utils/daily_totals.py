@@ -0,0 +1,105 @@
+'''
+daily_totals.py: per-day totals of retweets of the unlabeled users in labeled users (sufficient statistics of the windows)
+
+The file is a .npz ("TotaisDiarios_UsuariosSemLabel.npz") with parallel arrays:
+    - days (str, "YYYY/MM/DD"): the days, in order
+    - offsets (int64): the rows of days[i] are offsets[i]:offsets[i + 1]
+    - user_ids, pro, anti (int64): the user and its number of retweets in pro-impeachment ("favoravel"/"coxinhas") and
+      anti-impeachment ("contrario"/"petralhas") users on the day
+
+The counts are additive: the totals of any period (a month, a window of days) are the sums of the totals of its days, and
+the individual polarity of a user in the period is (pro - anti) / (pro + anti), the same value of the monthly pipeline.
+sliding_windows forms the windows incrementally (the day that enters is added and the day that leaves is subtracted).
+
+Written by "polarities/01-TotalsUnlabeledUsers.py" (--diario) and read by "polarization/03-SlidingWindowIndex.py".
+'''
+import numpy as np
+
+COLUMNS = ["user_ids", "pro", "anti"]
+
+class DailyTotals:
+
+    def __init__(self, days, offsets, user_ids, pro, anti):
+        self.days = list(days)
+        self.offsets = offsets
+        self.columns = {"user_ids": user_ids, "pro": pro, "anti": anti}
+
+    def __len__(self):
+        return len(self.columns["user_ids"])
+
+    # rows: slice of the rows of a day
+    def rows(self, day):
+        i = self.days.index(day)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    # column: values of a column for a day (ex.: totals.column("2016/03/01", "pro"))
+    def column(self, day, name):
+        return self.columns[name][self.rows(day)]
+
+    def save(self, filename):
+        np.savez(filename, days=np.asarray(self.days, dtype=str), offsets=self.offsets, **self.columns)
+
+# DailyTotalsWriter: collects the totals of each day (in any order) --> to_table sorts the days
+class DailyTotalsWriter:
+
+    def __init__(self):
+        self.days = dict()
+
+    # add_day: totals of a day (a day read twice, ex. from two files, is summed by sliding_windows)
+    def add_day(self, day, user_ids, pro, anti):
+        self.days.setdefault(day, []).append((np.asarray(user_ids, dtype=np.int64), np.asarray(pro, dtype=np.int64),
+                                              np.asarray(anti, dtype=np.int64)))
+
+    def to_table(self):
+        days = sorted(self.days)
+        columns = [[part[c] for day in days for part in self.days[day]] for c in range(len(COLUMNS))]
+        offsets = np.zeros(len(days) + 1, dtype=np.int64)
+        np.cumsum([sum(len(part[0]) for part in self.days[day]) for day in days], out=offsets[1:])
+        return DailyTotals(days, offsets, *[np.concatenate(column) if len(column) > 0 else np.zeros(0, dtype=np.int64)
+                                            for column in columns])
+
+    def save(self, filename):
+        table = self.to_table()
+        table.save(filename)
+        return table
+
+# load: loads a table saved with DailyTotals.save
+def load(filename):
+    with np.load(filename) as table:
+        return DailyTotals(table["days"].tolist(), table["offsets"], *[table[name] for name in COLUMNS])
+
+def to_date(day):
+    return np.datetime64(day.replace("/", "-"), "D")
+
+def to_day(date):
+    return str(date).replace("-", "/")
+
+# sliding_windows: totals of the users in each window of "length" consecutive (calendar) days, one window per day
+# --> (first day, last day, user ids, pro, anti); only the users with retweets in labeled users in the window
+# --> the running totals are updated incrementally: each day is added once and subtracted once
+def sliding_windows(table, length):
+    if len(table.days) == 0:
+        return
+    (users, user_index) = np.unique(table.columns["user_ids"], return_inverse=True)
+    user_index = user_index.ravel()
+    pro = np.zeros(len(users), dtype=np.int64)
+    anti = np.zeros(len(users), dtype=np.int64)
+
+    rows_by_date = {to_date(day): table.rows(day) for day in table.days}
+    first = min(rows_by_date)
+    total_days = int((max(rows_by_date) - first) / np.timedelta64(1, "D")) + 1
+
+    def update(date, sign):
+        rows = rows_by_date.get(date)
+        if rows is not None:
+            np.add.at(pro, user_index[rows], sign * table.columns["pro"][rows])
+            np.add.at(anti, user_index[rows], sign * table.columns["anti"][rows])
+
+    for k in range(total_days):
+        end = first + np.timedelta64(k, "D")
+        update(end, 1)
+        if k >= length:
+            update(end - np.timedelta64(length, "D"), -1)
+        if k >= length - 1:
+            active = np.flatnonzero((pro + anti) > 0)
+            yield (to_day(end - np.timedelta64(length - 1, "D")), to_day(end), users[active], pro[active], anti[active])
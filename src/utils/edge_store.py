@@ -0,0 +1,167 @@
+'''
+edge_store.py: compact columnar format for the edges of the retweet network (alternative to "retweet_net.txt")
+
+A store is a folder containing:
+    - one binary file per column (written in chunks during the scan, read with memory mapping):
+        user_a_id (int64): retweeted user | user_b_id (int64): user that retweeted | day (int32): days since 1970-01-01
+        tweet_id (int64): id of the retweet | text_id (int32): line of the text in "texts.txt"
+        name_a_id, name_b_id (int32): lines of the screen names of the users in "screen_names.txt"
+    - "texts.txt": the cleaned texts, deduplicated (one per line)
+    - "screen_names.txt": the screen names, deduplicated (one per line)
+    - "meta.json": number of rows, types of the columns and byte order
+
+The semicolon text format ("retweet_net.txt") can still be exported from a store (see export_text).
+'''
+from array import array
+from datetime import date, timedelta
+import numpy as np
+import json
+import os
+import sys
+
+COLUMNS = [("user_a_id", "q", "i8"), ("user_b_id", "q", "i8"), ("day", "i", "i4"),
+           ("tweet_id", "q", "i8"), ("text_id", "i", "i4"), ("name_a_id", "i", "i4"), ("name_b_id", "i", "i4")]
+EPOCH = date(1970, 1, 1)
+TEXT_HEADER = "User A;User A ID;User B;User B ID;Date;Tweet ID;Original Tweet Text\n"
+
+# day_number: days since 1970-01-01 (int32 column "day")
+def day_number(date_decoded):
+    return (date_decoded.date() - EPOCH).days if hasattr(date_decoded, "date") else (date_decoded - EPOCH).days
+
+# day_date: inverse of day_number
+def day_date(day):
+    return EPOCH + timedelta(days=int(day))
+
+class EdgeStoreWriter:
+
+    def __init__(self, folder, chunk_size=65536, state=None):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.buffers = {name: array(typecode) for (name, typecode, _) in COLUMNS}
+        self.rows = 0
+        self.text_ids = dict()
+        self.name_ids = dict()
+
+        # resuming (see ObterRedesRetweets checkpoints): discards what was written after the saved state
+        if state is not None:
+            self.restore(state)
+            mode = "ab"
+        else:
+            mode = "wb"
+        self.column_files = {name: open(os.path.join(folder, name + ".bin"), mode) for (name, _, _) in COLUMNS}
+        self.texts_file = open(os.path.join(folder, "texts.txt"), mode[0], encoding="utf-8", newline="\n")
+        self.names_file = open(os.path.join(folder, "screen_names.txt"), mode[0], encoding="utf-8", newline="\n")
+
+    # side_table_id: line of a value in a deduplicated side table (the value is added if it is new)
+    def side_table_id(self, ids, side_file, value):
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = len(ids)
+            ids[value] = value_id
+            side_file.write(value.replace("\n", " ") + "\n")
+        return value_id
+
+    # add: buffers a new edge (the buffers are written to the files every "chunk_size" edges)
+    def add(self, user_a, user_a_id, user_b, user_b_id, day, tweet_id, text):
+        self.buffers["user_a_id"].append(user_a_id)
+        self.buffers["user_b_id"].append(user_b_id)
+        self.buffers["day"].append(day)
+        self.buffers["tweet_id"].append(tweet_id)
+        self.buffers["text_id"].append(self.side_table_id(self.text_ids, self.texts_file, text))
+        self.buffers["name_a_id"].append(self.side_table_id(self.name_ids, self.names_file, user_a))
+        self.buffers["name_b_id"].append(self.side_table_id(self.name_ids, self.names_file, user_b))
+        if len(self.buffers["day"]) >= self.chunk_size:
+            self.write_chunk()
+
+    # write_chunk: appends the buffered edges to the column files
+    def write_chunk(self):
+        for (name, typecode, _) in COLUMNS:
+            self.buffers[name].tofile(self.column_files[name])
+        self.rows += len(self.buffers["day"])
+        self.buffers = {name: array(typecode) for (name, typecode, _) in COLUMNS}
+
+    # flush: writes everything to disk and returns the state of the store (used by the checkpoints)
+    def flush(self):
+        self.write_chunk()
+        for dfile in list(self.column_files.values()) + [self.texts_file, self.names_file]:
+            dfile.flush()
+            os.fsync(dfile.fileno())
+        self.write_meta()
+        return {"rows": self.rows,
+                "texts_offset": self.texts_file.buffer.tell(), "texts": len(self.text_ids),
+                "names_offset": self.names_file.buffer.tell(), "names": len(self.name_ids)}
+
+    # restore: truncates the files to a saved state and reloads the side tables
+    def restore(self, state):
+        self.rows = state["rows"]
+        for (name, typecode, _) in COLUMNS:
+            os.truncate(os.path.join(self.folder, name + ".bin"), self.rows * array(typecode).itemsize)
+        for (filename, ids, offset) in [("texts.txt", self.text_ids, state["texts_offset"]),
+                                        ("screen_names.txt", self.name_ids, state["names_offset"])]:
+            os.truncate(os.path.join(self.folder, filename), offset)
+            with open(os.path.join(self.folder, filename), "r", encoding="utf-8", newline="\n") as sfile:
+                for (value_id, line) in enumerate(sfile):
+                    ids[line[:-1]] = value_id
+
+    def write_meta(self):
+        meta = {"rows": self.rows, "byteorder": sys.byteorder,
+                "columns": {name: dtype for (name, _, dtype) in COLUMNS}}
+        with open(os.path.join(self.folder, "meta.json"), "w") as mfile:
+            json.dump(meta, mfile)
+
+    def close(self):
+        self.flush()
+        for dfile in list(self.column_files.values()) + [self.texts_file, self.names_file]:
+            dfile.close()
+
+class EdgeStore:
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "meta.json"), "r") as mfile:
+            self.meta = json.load(mfile)
+        byteorder = "<" if self.meta["byteorder"] == "little" else ">"
+
+        # zero-copy access: the columns are memory mapped
+        self.columns = dict()
+        for (name, dtype) in self.meta["columns"].items():
+            if self.meta["rows"] == 0:
+                self.columns[name] = np.zeros(0, dtype=byteorder + dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(folder, name + ".bin"), dtype=byteorder + dtype,
+                                               mode="r", shape=(self.meta["rows"],))
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    # side_table: the values of a deduplicated side table (index = id of the value)
+    def side_table(self, filename):
+        with open(os.path.join(self.folder, filename), "r", encoding="utf-8", newline="\n") as sfile:
+            return [line[:-1] for line in sfile]
+
+    # texts: the deduplicated texts (index = text_id)
+    def texts(self):
+        return self.side_table("texts.txt")
+
+    # screen_names: the deduplicated screen names (index = name_a_id / name_b_id)
+    def screen_names(self):
+        return self.side_table("screen_names.txt")
+
+# export_text: writes the store in the semicolon text format ("retweet_net.txt")
+def export_text(folder, output_file):
+    store = EdgeStore(folder)
+    texts = store.texts()
+    names = store.screen_names()
+    with open(output_file, "w", encoding="utf-8", newline="\n") as ofile:
+        ofile.write(TEXT_HEADER)
+        for i in range(len(store)):
+            ofile.write("%s;%d;%s;%d;%s;%d;%s\n" % (names[store["name_a_id"][i]], store["user_a_id"][i],
+                                                    names[store["name_b_id"][i]], store["user_b_id"][i],
+                                                    day_date(store["day"][i]).strftime("%Y/%m/%d"),
+                                                    int(store["tweet_id"][i]), texts[store["text_id"][i]]))
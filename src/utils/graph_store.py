@@ -0,0 +1,319 @@
+'''
+graph_store.py: compact binary format for the (weighted, directed) retweet networks --> alternative to the .gml files
+
+A store is a folder (ex.: "2016_03_01_ComPosicao.graph") containing:
+    - "nodes.npy" (int64): ids of the users (node i = user nodes[i])
+    - CSR adjacency of the out-edges (retweeted user --> user that retweeted):
+        "indptr.npy" (int64): edges of node i are indptr[i]:indptr[i + 1]
+        "indices.npy" (int64): targets of the edges | "weights.npy" (int64 or float64): weights of the edges
+    - one column per node attribute ("attr_<name>.npy"). Text attributes (ex.: "polaridade") are categorical:
+      the column keeps int32 codes and the categories are kept in "meta.json"
+    - "meta.json": number of nodes and edges, and the attributes
+
+A node attribute of a .gml file can also be kept in a sidecar ("<file>.gml.<name>.npz", see write_sidecar), so that the
+graph does not need to be rewritten to add it.
+
+The arrays are loaded with memory mapping, so opening a store takes milliseconds. GML is kept as the interchange
+format (see gml_to_store and store_to_gml).
+
+usage:
+    python graph_store.py to-store 2016_03_01_ComPosicao.gml
+    python graph_store.py to-gml 2016_03_01_ComPosicao.graph
+'''
+import argparse
+import json
+import os
+import re
+import shutil
+import numpy as np
+
+GRAPH_SUFFIX = ".graph"
+WRITE_CHUNK = 100000
+
+# arrays of the structure of the graph (shared by the copies of a store, see link_store)
+STRUCTURE = ["nodes.npy", "indptr.npy", "indices.npy", "weights.npy"]
+
+# is_store: checks if a path is a graph store
+def is_store(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json")) and \
+        os.path.exists(os.path.join(path, "indptr.npy"))
+
+# store_name: name of the store of a .gml file (ex.: "x.gml" --> "x.graph")
+def store_name(gml_file):
+    return os.path.splitext(gml_file)[0] + GRAPH_SUFFIX
+
+# load_array: memory mapped .npy file (empty arrays cannot be mapped)
+def load_array(filename):
+    try:
+        return np.load(filename, mmap_mode="r")
+    except ValueError:
+        return np.load(filename)
+
+# encode_attribute: column of an attribute --> (values or codes, categories or None)
+def encode_attribute(values):
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        return (values, None)
+    categories, codes = np.unique(values.astype(str), return_inverse=True)
+    return (codes.astype(np.int32).ravel(), categories.tolist())
+
+# write_store: writes the graph --> source, target: positions of the nodes of each edge in "nodes"
+# --> the edges keep their order inside each source node
+def write_store(folder, nodes, source, target, weights, attributes=None):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    nodes = np.asarray(nodes, dtype=np.int64)
+    source = np.asarray(source, dtype=np.int64)
+    order = np.argsort(source, kind="stable")
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=len(nodes)), out=indptr[1:])
+    weights = np.asarray(weights)
+    weights = weights.astype(np.int64) if weights.dtype.kind in "biu" else weights.astype(np.float64)
+
+    np.save(os.path.join(folder, "nodes.npy"), nodes)
+    np.save(os.path.join(folder, "indptr.npy"), indptr)
+    np.save(os.path.join(folder, "indices.npy"), np.asarray(target, dtype=np.int64)[order])
+    np.save(os.path.join(folder, "weights.npy"), weights[order])
+    meta = {"nodes": len(nodes), "edges": len(source), "directed": True, "attributes": dict()}
+    with open(os.path.join(folder, "meta.json"), "w") as mfile:
+        json.dump(meta, mfile)
+
+    for (name, values) in (attributes or dict()).items():
+        set_attribute(folder, name, values)
+
+# set_attribute: adds (or replaces) a node attribute of a store
+# --> values can also be given as codes of a list of categories
+def set_attribute(folder, name, values, categories=None):
+    with open(os.path.join(folder, "meta.json"), "r") as mfile:
+        meta = json.load(mfile)
+    if categories is None:
+        (column, categories) = encode_attribute(values)
+    else:
+        column = np.asarray(values)
+    if len(column) != meta["nodes"]:
+        raise ValueError("attribute %s has %d values (graph has %d nodes)" % (name, len(column), meta["nodes"]))
+    np.save(os.path.join(folder, "attr_%s.npy" % name), column)
+    meta["attributes"][name] = {"categories": categories}
+    with open(os.path.join(folder, "meta.json"), "w") as mfile:
+        json.dump(meta, mfile)
+
+# link_file: hard link of a file (copy, if the file system does not support it)
+def link_file(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+# link_store: copy of a store whose structure arrays are hard links (the attributes and "meta.json" are real copies)
+def link_store(folder, new_folder):
+    if os.path.exists(new_folder):
+        shutil.rmtree(new_folder)
+    os.makedirs(new_folder)
+    for filename in os.listdir(folder):
+        if filename in STRUCTURE:
+            link_file(os.path.join(folder, filename), os.path.join(new_folder, filename))
+        else:
+            shutil.copy2(os.path.join(folder, filename), os.path.join(new_folder, filename))
+
+# sidecars: a node attribute saved next to a graph file ("<graph>.<name>.npz"), in the node order of the graph
+def sidecar_name(graph_file, name):
+    return "%s.%s.npz" % (graph_file, name)
+
+def write_sidecar(graph_file, name, values, categories=None):
+    if categories is None:
+        (values, categories) = encode_attribute(values)
+    np.savez(sidecar_name(graph_file, name), codes=np.asarray(values),
+             categories=np.asarray(categories if categories is not None else [], dtype=str))
+
+# read_sidecar: (codes, categories) of a sidecar --> categories is None for numeric attributes
+def read_sidecar(graph_file, name):
+    with np.load(sidecar_name(graph_file, name)) as sidecar:
+        categories = sidecar["categories"].tolist()
+        return (sidecar["codes"], categories if len(categories) > 0 else None)
+
+class GraphStore:
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "meta.json"), "r") as mfile:
+            self.meta = json.load(mfile)
+        self.nodes = load_array(os.path.join(folder, "nodes.npy"))
+        self.indptr = load_array(os.path.join(folder, "indptr.npy"))
+        self.indices = load_array(os.path.join(folder, "indices.npy"))
+        self.weights = load_array(os.path.join(folder, "weights.npy"))
+
+    def __len__(self):
+        return self.meta["nodes"]
+
+    def total_edges(self):
+        return self.meta["edges"]
+
+    def attribute_names(self):
+        return list(self.meta["attributes"].keys())
+
+    # attribute: column of a node attribute (codes, for a categorical attribute)
+    def attribute(self, name):
+        return load_array(os.path.join(self.folder, "attr_%s.npy" % name))
+
+    # categories: categories of a categorical attribute (None for numeric attributes)
+    def categories(self, name):
+        return self.meta["attributes"][name]["categories"]
+
+    # attribute_values: decoded values of a node attribute
+    def attribute_values(self, name):
+        column = self.attribute(name)
+        categories = self.categories(name)
+        if categories is None:
+            return column
+        return np.asarray(categories, dtype=object)[column]
+
+    # edges: (source, target, weights) of all the edges
+    def edges(self):
+        source = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+        return (source, np.asarray(self.indices), np.asarray(self.weights))
+
+    # in_edges: CSR of the in-edges (predecessors) --> (indptr, sources, weights)
+    def in_edges(self):
+        (source, target, weights) = self.edges()
+        order = np.argsort(target, kind="stable")
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(target, minlength=len(self)), out=indptr[1:])
+        return (indptr, source[order], weights[order])
+
+    # to_networkx: networkx graph (node keys are the ids as strings, as in the .gml files)
+    def to_networkx(self):
+        import networkx as nx
+        graph = nx.DiGraph()
+        labels = [str(nodeId) for nodeId in self.nodes.tolist()]
+        columns = {name: self.attribute_values(name).tolist() for name in self.attribute_names()}
+        graph.add_nodes_from((label, {name: column[i] for (name, column) in columns.items()})
+                             for (i, label) in enumerate(labels))
+        (source, target, weights) = self.edges()
+        graph.add_weighted_edges_from((labels[s], labels[t], w) for (s, t, w) in
+                                      zip(source.tolist(), target.tolist(), weights.tolist()))
+        return graph
+
+# gml_value: value of an attribute in the GML file
+def gml_value(value):
+    if isinstance(value, str):
+        return "\"%s\"" % value
+    if isinstance(value, float):
+        return repr(value)
+    return "%d" % value
+
+# write_gml: streaming GML writer (same layout of networkx.write_gml for a DiGraph) --> attributes: node columns
+def write_gml(gml_file, nodes, source, target, weights, attributes=None):
+    attributes = [(name, np.asarray(values).tolist()) for (name, values) in (attributes or dict()).items()]
+    weights = np.asarray(weights)
+    weight_format = "%d" if weights.dtype.kind in "biu" else "%r"
+    with open(gml_file, "w", encoding="utf-8") as gfile:
+        gfile.write("graph [\n  directed 1\n")
+        for start in range(0, len(nodes), WRITE_CHUNK):
+            end = start + WRITE_CHUNK
+            gfile.write("".join("  node [\n    id %d\n    label \"%d\"\n%s  ]\n" %
+                                (i, nodeId, "".join("    %s %s\n" % (name, gml_value(values[i]))
+                                                    for (name, values) in attributes))
+                                for (i, nodeId) in enumerate(np.asarray(nodes[start:end]).tolist(), start)))
+        edge_format = "  edge [\n    source %d\n    target %d\n    weight " + weight_format + "\n  ]\n"
+        for start in range(0, len(weights), WRITE_CHUNK):
+            end = start + WRITE_CHUNK
+            gfile.write("".join(edge_format % edge for edge in zip(np.asarray(source[start:end]).tolist(),
+                                                                    np.asarray(target[start:end]).tolist(),
+                                                                    weights[start:end].tolist())))
+        gfile.write("]\n")
+
+# store_to_gml: converts a store to a .gml file
+def store_to_gml(folder, gml_file):
+    store = GraphStore(folder)
+    (source, target, weights) = store.edges()
+    attributes = {name: store.attribute_values(name) for name in store.attribute_names()}
+    write_gml(gml_file, store.nodes, source, target, weights, attributes)
+
+# GML tokens: brackets, quoted strings and other words (keys and numbers)
+GML_TOKENS = re.compile(r'\[|\]|"[^"]*"|[^\s\[\]"]+')
+
+# read_gml_blocks: streaming parser of the GML blocks "node [...]" and "edge [...]" --> yields (kind, dict of scalar values)
+def read_gml_blocks(gml_file):
+    stack, key, block = [], None, None
+    with open(gml_file, "r", encoding="utf-8") as gfile:
+        for line in gfile:
+            for token in GML_TOKENS.findall(line):
+                if token == "[":
+                    stack.append(key)
+                    if len(stack) == 2 and key in ("node", "edge"):
+                        block = dict()
+                    key = None
+                elif token == "]":
+                    kind = stack.pop()
+                    if len(stack) == 1 and block is not None:
+                        yield (kind, block)
+                        block = None
+                elif key is None:
+                    key = token
+                else:
+                    if block is not None and len(stack) == 2:
+                        block[key] = gml_token_value(token)
+                    key = None
+
+# gml_token_value: value of a GML token (string, int or float)
+def gml_token_value(token):
+    if token.startswith("\""):
+        return token[1:-1]
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+# gml_node_ids: ids of the nodes of a .gml file (labels), in the order of the file
+def gml_node_ids(gml_file):
+    return np.asarray([int(block["label"]) for (kind, block) in read_gml_blocks(gml_file) if kind == "node"],
+                      dtype=np.int64)
+
+# read_gml: arrays of a .gml file (nodes labeled with the user ids) --> (nodes, source, target, weights, attributes)
+# --> scalar node attributes are kept; the only edge attribute kept is "weight" (1 if it does not exist)
+def read_gml(gml_file):
+    nodes, positions, attributes = [], dict(), dict()
+    source, target, weights = [], [], []
+    for (kind, block) in read_gml_blocks(gml_file):
+        if kind == "node":
+            positions[block.pop("id")] = len(nodes)
+            nodes.append(int(block.pop("label")))
+            for (name, value) in block.items():
+                attributes.setdefault(name, [None] * (len(nodes) - 1)).append(value)
+            for column in attributes.values():
+                if len(column) < len(nodes):
+                    column.append(None)
+        else:
+            source.append(block["source"])
+            target.append(block["target"])
+            weights.append(block.get("weight", 1))
+
+    source = np.asarray([positions[s] for s in source], dtype=np.int64)
+    target = np.asarray([positions[t] for t in target], dtype=np.int64)
+    attributes = {name: np.asarray(["None" if value is None else value for value in column])
+                  for (name, column) in attributes.items()}
+    return (np.asarray(nodes, dtype=np.int64), source, target, np.asarray(weights), attributes)
+
+# gml_to_store: converts a .gml file to a store
+def gml_to_store(gml_file, folder=None):
+    folder = folder if folder is not None else store_name(gml_file)
+    (nodes, source, target, weights, attributes) = read_gml(gml_file)
+    write_store(folder, nodes, source, target, weights, attributes)
+    return folder
+
+# MAIN
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts retweet networks between GML and the binary graph store")
+    parser.add_argument("command", choices=["to-store", "to-gml"])
+    parser.add_argument("input")
+    parser.add_argument("output", nargs="?", default=None)
+    args = parser.parse_args()
+
+    if args.command == "to-store":
+        print("Store: %s" % gml_to_store(args.input, args.output))
+    else:
+        output = args.output if args.output is not None else os.path.splitext(args.input)[0] + ".gml"
+        store_to_gml(args.input, output)
+        print("GML: %s" % output)
@@ -0,0 +1,245 @@
+'''
+gzip_index.py: indexed access to the compressed database of tweets (.gz)
+
+The index is built once (a full pass over the file) and saved next to the .gz file ("<file>.gz.idx.json"). It contains
+seek points (checkpoints): the compressed offset of a gzip member that starts at the beginning of a line, its
+uncompressed offset, its line number and the date of its first tweet. From a checkpoint, the file can be
+decompressed without reading anything before it, so that:
+    - workers can read different ranges in parallel (see "shards" and utils.read_shard);
+    - a time range (ex.: a single month) can be read directly (see "read_dates"), as the database is chronological.
+
+Seek points only exist at gzip member boundaries (zlib cannot restart in the middle of a deflate stream). A database
+with a single member can be converted once with "rechunk": the output is still a standard .gz file (readable by
+gzip.open and by every script), split into members of whole lines.
+
+usage:
+    python gzip_index.py rechunk tweets_2016.gz tweets_2016_indexed.gz
+    python gzip_index.py build tweets_2016_indexed.gz
+'''
+from datetime import datetime
+import dateutil.parser as dateparser
+import argparse
+import gzip
+import json
+import os
+import zlib
+
+# gzip members (wbits = 16 + 15)
+GZIP_WBITS = 31
+READ_SIZE = 1 << 20
+
+# index_filename: the index is saved next to the .gz file
+def index_filename(gz_file):
+    return gz_file + ".idx.json"
+
+# tweet_date: date of a line (tweet) of the database (None if it cannot be found)
+def tweet_date(line):
+    try:
+        created_at = json.loads(line.decode('utf-8')).get("created_at")
+        if isinstance(created_at, str):
+            return datetime.strptime(created_at, "%a %b %d %H:%M:%S +0000 %Y")
+        if isinstance(created_at, dict) and "$date" in created_at:
+            if isinstance(created_at["$date"], str):
+                return dateparser.parse(created_at["$date"]).replace(tzinfo=None)
+            return datetime.fromtimestamp(created_at["$date"] / 1000)
+    except (ValueError, OverflowError):
+        pass
+    return None
+
+# iter_members: decompresses the gzip members that start in [start, end) --> yields (compressed offset of the member, data)
+def iter_members(gz_file, start=0, end=None):
+    with open(gz_file, "rb") as gfile:
+        gfile.seek(start)
+        offset = start
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        member_offset = offset
+        while end is None or member_offset < end:
+            data = gfile.read(READ_SIZE)
+            if not data:
+                break
+            offset += len(data)
+            while data:
+                yield (member_offset, decompressor.decompress(data))
+                if decompressor.eof:
+                    data = decompressor.unused_data
+                    member_offset = offset - len(data)
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+                    if end is not None and member_offset >= end:
+                        return
+                    # skip padding (zeros) at the end of the file
+                    if data.strip(b"\x00") == b"" and gfile.peek(1) == b"":
+                        return
+                else:
+                    data = b""
+
+# read_range: reads the lines (bytes) of the members that start in [start, end) --> start must be a checkpoint
+def read_range(gz_file, start=0, end=None):
+    pending = b""
+    for (_, data) in iter_members(gz_file, start, end):
+        if not data:
+            continue
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+# build_index: one pass over the file, creating a checkpoint every "span" uncompressed bytes (at member boundaries)
+def build_index(gz_file, span=64 * 1024 * 1024):
+    checkpoints = []
+    uncompressed_offset, line_number = 0, 0
+    last_offset = None
+    at_line_start = True
+    new_checkpoint = None
+    pending_first_line = b""
+
+    for (member_offset, data) in iter_members(gz_file):
+        # a new member that starts at the beginning of a line is a possible checkpoint
+        if member_offset != last_offset:
+            last_offset = member_offset
+            if at_line_start and (len(checkpoints) == 0 or
+                                  uncompressed_offset - checkpoints[-1]["uncompressed_offset"] >= span):
+                new_checkpoint = {"compressed_offset": member_offset, "uncompressed_offset": uncompressed_offset,
+                                  "line": line_number, "first_date": None}
+                checkpoints.append(new_checkpoint)
+                pending_first_line = b""
+
+        if not data:
+            continue
+
+        # date of the first tweet of the checkpoint
+        if new_checkpoint is not None:
+            pending_first_line += data
+            if b"\n" in pending_first_line:
+                first_date = tweet_date(pending_first_line.split(b"\n", 1)[0])
+                new_checkpoint["first_date"] = first_date.isoformat() if first_date is not None else None
+                new_checkpoint = None
+                pending_first_line = b""
+
+        uncompressed_offset += len(data)
+        line_number += data.count(b"\n")
+        at_line_start = data.endswith(b"\n")
+
+    index = {"file_size": os.path.getsize(gz_file), "uncompressed_size": uncompressed_offset,
+             "lines": line_number, "checkpoints": checkpoints}
+    with open(index_filename(gz_file), "w") as ifile:
+        json.dump(index, ifile)
+    return index
+
+# load_index: loads the index of the file (None if it does not exist or is outdated)
+def load_index(gz_file):
+    if not os.path.exists(index_filename(gz_file)):
+        return None
+    with open(index_filename(gz_file), "r") as ifile:
+        index = json.load(ifile)
+    if index["file_size"] != os.path.getsize(gz_file):
+        return None
+    return index
+
+# shards: splits the file into "parts" ranges of checkpoints --> (file, compressed start, compressed end), see utils.read_shard
+def shards(gz_file, parts, index=None):
+    index = index if index is not None else load_index(gz_file)
+    if index is None or len(index["checkpoints"]) == 0:
+        return [(gz_file, None, None)]
+
+    checkpoints = index["checkpoints"]
+    total = index["uncompressed_size"]
+    boundaries = [0]
+    for part in range(1, parts):
+        target = total * part / parts
+        # first checkpoint at or after the target (uncompressed) position
+        for i in range(boundaries[-1] + 1, len(checkpoints)):
+            if checkpoints[i]["uncompressed_offset"] >= target:
+                boundaries.append(i)
+                break
+    boundaries = sorted(set(boundaries))
+
+    file_shards = []
+    for (i, boundary) in enumerate(boundaries):
+        start = checkpoints[boundary]["compressed_offset"]
+        end = checkpoints[boundaries[i + 1]]["compressed_offset"] if i + 1 < len(boundaries) else index["file_size"]
+        file_shards.append((gz_file, start, end))
+    return file_shards
+
+# read_from_offset: reads the lines from an uncompressed offset (the beginning of a line), starting at the closest checkpoint
+def read_from_offset(gz_file, offset, index=None):
+    index = index if index is not None else load_index(gz_file)
+    if index is None:
+        with gzip.open(gz_file, "rb") as gfile:
+            gfile.seek(offset) # decompresses everything before the offset
+            for line in gfile:
+                yield line
+        return
+
+    start, start_offset = 0, 0
+    for checkpoint in index["checkpoints"]:
+        if checkpoint["uncompressed_offset"] <= offset:
+            start, start_offset = checkpoint["compressed_offset"], checkpoint["uncompressed_offset"]
+    for line in read_range(gz_file, start):
+        if start_offset >= offset:
+            yield line
+        start_offset += len(line)
+
+# read_dates: reads only the tweets of [start_date, end_date) --> ex.: a single month (the database must be chronological)
+def read_dates(gz_file, start_date, end_date=None, index=None):
+    index = index if index is not None else load_index(gz_file)
+    checkpoints = index["checkpoints"] if index is not None else []
+
+    # last checkpoint whose first tweet is before the start date / first checkpoint that starts at or after the end date
+    start, end = 0, None
+    for checkpoint in checkpoints:
+        if checkpoint["first_date"] is None:
+            continue
+        first_date = datetime.fromisoformat(checkpoint["first_date"])
+        if first_date < start_date:
+            start = checkpoint["compressed_offset"]
+        if end_date is not None and first_date >= end_date:
+            end = checkpoint["compressed_offset"]
+            break
+
+    for line in read_range(gz_file, start, end):
+        date = tweet_date(line)
+        if date is None:
+            continue
+        if date < start_date:
+            continue
+        if end_date is not None and date >= end_date:
+            break
+        yield line
+
+# rechunk: rewrites the database as a .gz file having one member every "member_size" uncompressed bytes (whole lines)
+def rechunk(gz_file, output_file, member_size=16 * 1024 * 1024, compresslevel=6):
+    with gzip.open(gz_file, "rb") as infile, open(output_file, "wb") as outfile:
+        chunk, chunk_size = [], 0
+        for line in infile:
+            chunk.append(line)
+            chunk_size += len(line)
+            if chunk_size >= member_size:
+                outfile.write(gzip.compress(b"".join(chunk), compresslevel))
+                chunk, chunk_size = [], 0
+        if chunk:
+            outfile.write(gzip.compress(b"".join(chunk), compresslevel))
+
+# MAIN
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexed access to the compressed database of tweets")
+    subparsers = parser.add_subparsers(dest="command")
+    build_parser = subparsers.add_parser("build", help="builds the index of a .gz file")
+    build_parser.add_argument("gz_file")
+    build_parser.add_argument("--span", type=int, default=64 * 1024 * 1024, help="uncompressed bytes between checkpoints")
+    rechunk_parser = subparsers.add_parser("rechunk", help="rewrites a .gz file as several members (and indexes it)")
+    rechunk_parser.add_argument("gz_file")
+    rechunk_parser.add_argument("output_file")
+    rechunk_parser.add_argument("--member-size", type=int, default=16 * 1024 * 1024)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_index(args.gz_file, args.span)
+        print("%d checkpoints, %d lines" % (len(index["checkpoints"]), index["lines"]))
+    elif args.command == "rechunk":
+        rechunk(args.gz_file, args.output_file, args.member_size)
+        index = build_index(args.output_file, args.member_size)
+        print("%d checkpoints, %d lines" % (len(index["checkpoints"]), index["lines"]))
+    else:
+        parser.print_help()
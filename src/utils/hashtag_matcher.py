@@ -0,0 +1,108 @@
+'''
+hashtag_matcher.py: finds the hashtag groups (favoravel, contrario, incerto) of a tweet in a single pass
+
+The groups are read from "hashtags_groups.txt" (see folder "files"). A hashtag belongs to a group if any of the
+group's hashtags is a substring of the hashtag after "unidecode(htg).lower()" -- the same rule used by
+ProcessingText.check_special_feature.
+'''
+from functools import lru_cache
+from unidecode import unidecode
+import re
+
+# optional: pyahocorasick builds a real automaton; otherwise one compiled alternation per group is used
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# group order and bit of each group in the memberships mask
+GROUPS = ["favoravel", "contrario", "incerto"]
+FAVORAVEL, CONTRARIO, INCERTO = 1, 2, 4
+GROUP_BITS = {"favoravel": FAVORAVEL, "contrario": CONTRARIO, "incerto": INCERTO}
+
+# load_hashtags_groups: reads the file containing the hashtags of each group
+def load_hashtags_groups(filename):
+    hashtags_groups = {group: [] for group in GROUPS}
+    group_mode = ""
+    with open(filename, "r") as hgfile:
+        for line in hgfile:
+            l = line.strip()
+            if l == "::favoravel::":
+                group_mode = "favoravel"
+            elif l == "::contrario::":
+                group_mode = "contrario"
+            elif l == "::incerto::":
+                group_mode = "incerto"
+            else:
+                hashtags_groups[group_mode].append(l)
+    return hashtags_groups
+
+class HashtagMatcher:
+
+    def __init__(self, hashtags_groups, cache_size=2 ** 18):
+        self.hashtags_groups = hashtags_groups
+
+        # an empty pattern is a substring of every hashtag (an empty line in the groups' file)
+        self.empty_mask = 0
+        for group, patterns in hashtags_groups.items():
+            if "" in patterns:
+                self.empty_mask |= GROUP_BITS[group]
+
+        if ahocorasick is not None:
+            # each pattern keeps the mask of all the groups it belongs to
+            self.automaton = ahocorasick.Automaton()
+            pattern_masks = dict()
+            for group, patterns in hashtags_groups.items():
+                for pattern in patterns:
+                    if pattern != "":
+                        pattern_masks[pattern] = pattern_masks.get(pattern, 0) | GROUP_BITS[group]
+            for pattern, mask in pattern_masks.items():
+                self.automaton.add_word(pattern, mask)
+            if len(pattern_masks) > 0:
+                self.automaton.make_automaton()
+            else:
+                self.automaton = None
+            self.group_patterns = None
+        else:
+            self.automaton = None
+            self.group_patterns = [(GROUP_BITS[group], re.compile("|".join(re.escape(p) for p in patterns if p != "")))
+                                   for group, patterns in hashtags_groups.items()
+                                   if any(p != "" for p in patterns)]
+
+        # bounded cache: raw hashtag -> memberships mask (includes the normalization)
+        self.hashtag_mask = lru_cache(maxsize=cache_size)(self._hashtag_mask)
+
+    @classmethod
+    def from_file(cls, filename, cache_size=2 ** 18):
+        return cls(load_hashtags_groups(filename), cache_size)
+
+    # _hashtag_mask: memberships of a single hashtag (not cached)
+    def _hashtag_mask(self, htg):
+        htg_proc = unidecode(htg).lower()
+        mask = self.empty_mask
+        if self.automaton is not None:
+            for _, pattern_mask in self.automaton.iter(htg_proc):
+                mask |= pattern_mask
+        else:
+            for bit, pattern in self.group_patterns:
+                if (mask & bit == 0) and pattern.search(htg_proc) is not None:
+                    mask |= bit
+        return mask
+
+    # match: memberships mask of all the hashtags of a tweet
+    def match(self, hashtags):
+        mask = 0
+        for htg in hashtags:
+            mask |= self.hashtag_mask(htg)
+            if mask == FAVORAVEL | CONTRARIO | INCERTO:
+                break
+        return mask
+
+    # match_groups: the same as "match", but as booleans (contains_favoravel, contains_contrario, contains_incerto)
+    def match_groups(self, hashtags):
+        mask = self.match(hashtags)
+        return (mask & FAVORAVEL > 0, mask & CONTRARIO > 0, mask & INCERTO > 0)
+
+    # cache_info: hits and misses of the normalized hashtags' cache
+    def cache_info(self):
+        return self.hashtag_mask.cache_info()
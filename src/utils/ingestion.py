@@ -0,0 +1,95 @@
+'''
+ingestion.py: reads each tweet of the database only once and feeds it to several stages
+
+Each stage is a per-tweet consumer (ex.: the hashtag labeling of "01-FindingUsersHashtags.py" and the retweet
+edges of "02-RetweetNetworks.py"). The tweet is decompressed and decoded once and shared by all the stages.
+A line is only decoded if any stage needs it (see the "prefilters" and "fields" of each stage and tweet_reader.py).
+A stage can also drop a tweet (process returns False): the stages after it get skip() instead (ex.: PortugueseFilterStage).
+'''
+from tweet_reader import TweetReader
+import utils
+
+# TweetStage: interface of a stage that consumes the decoded tweets
+class TweetStage:
+    # fields and prefilters needed by the stage (None: all fields / all lines) --> see tweet_reader.py
+    fields = None
+    prefilters = None
+
+    # start: called before the first tweet is read
+    def start(self):
+        pass
+
+    # process: called for each decoded tweet --> False drops the tweet for the next stages
+    def process(self, tweet):
+        raise NotImplementedError
+
+    # skip: called for each line that was not decoded (no stage needed it)
+    def skip(self):
+        pass
+
+    # finish: called after the last tweet is read (ex.: to write the output files)
+    def finish(self):
+        pass
+
+class FusedIngestion:
+
+    def __init__(self, stages=None):
+        self.stages = list(stages) if stages is not None else []
+        self.tweet_reader = self.build_reader()
+
+    # add_stage: plugs a new consumer into the stream of tweets
+    def add_stage(self, stage):
+        self.stages.append(stage)
+        self.tweet_reader = self.build_reader()
+        return self
+
+    # build_reader: a line is decoded if any stage needs it, keeping the fields of all the stages
+    def build_reader(self):
+        fields, prefilters = [], []
+        for stage in self.stages:
+            if fields is not None:
+                fields = None if stage.fields is None else fields + [f for f in stage.fields if f not in fields]
+            if prefilters is not None:
+                prefilters = None if stage.prefilters is None else prefilters + [p for p in stage.prefilters if p not in prefilters]
+        return TweetReader(fields, prefilters)
+
+    # run: reads the lines (bytes) once and feeds every stage with the decoded tweet
+    def run(self, lines):
+        for stage in self.stages:
+            stage.start()
+
+        for line in lines:
+            tweet = self.tweet_reader.decode(line)
+            if tweet is None:
+                for stage in self.stages:
+                    stage.skip()
+                continue
+            for (i, stage) in enumerate(self.stages):
+                if stage.process(tweet) is False:
+                    for next_stage in self.stages[i + 1:]:
+                        next_stage.skip()
+                    break
+
+        for stage in self.stages:
+            stage.finish()
+
+# PortugueseFilterStage: drops the tweets that are not in portuguese (stopwords, see utils.StopwordIndex)
+# --> it must be the first stage; it does not make any other line be decoded (no prefilters of its own)
+class PortugueseFilterStage(TweetStage):
+    fields = ["text"]
+    prefilters = []
+
+    def __init__(self, stopword_index=None):
+        self.stopword_index = stopword_index if stopword_index is not None else utils.STOPWORD_INDEX
+        self.total_kept = 0
+        self.total_dropped = 0
+
+    def process(self, tweet):
+        if self.stopword_index.is_portuguese(tweet.get("text") or ""):
+            self.total_kept += 1
+            return True
+        self.total_dropped += 1
+        return False
+
+    def finish(self):
+        print("Portuguese filter: %d tweets kept, %d dropped" % (self.total_kept, self.total_dropped))
@@ -0,0 +1,301 @@
+'''
+instrumentation.py: metrics of a run --> named timers and counters of the hot sections, and a periodic sampler of the
+throughput and the memory, written to structured files (json/csv) at the end of the run
+
+Usage (the sections are timed in the modules themselves; the script that runs the stage starts and finishes the run):
+
+    run = instrumentation.start_run("RetweetNetworks", output_folder, sample_interval=10)
+    run.gauge("tweets", lambda: self.total_tweets)          # read by the sampler (no cost per tweet)
+    with instrumentation.timer("preprocessing"):
+        ...
+    instrumentation.add("cache_misses")
+    instrumentation.finish_run()
+
+There is always an active run (a default one, not written), so the timers of the modules can be used by any script.
+The timers measure wall time (time.perf_counter); a timer nested in another of the same name is not counted twice.
+They are not thread-safe: they are meant for the main thread of each process. The metrics of worker processes are
+collected with "collect" (a new run while a task runs) and added to the run of the parent with "merge".
+
+files (prefix "metrics_<name>_<date>_<pid>-<run number>" in the output folder, so that runs of the same second do not
+overwrite each other):
+    - .json: timers (seconds, calls, share of the wall time), counters, gauges and samples
+    - _timers.csv: one row per timer
+    - _samples.csv: one row per sample (elapsed time, RSS, peak RSS, value and rate of each counter/gauge); the rows are
+      written as the samples are taken, so the file shows the progress of a long run (the file is rewritten with a new
+      header when a counter first appears after the first sample)
+'''
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+import csv
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+# optional: resource is not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# rss_mb: current resident set size (MB), None where it is not available (only Linux)
+def rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as sfile:
+            return int(sfile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024.0 ** 2
+    except (OSError, ValueError, IndexError):
+        return None
+
+# peak_rss_mb: largest resident set size of the process (MB)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 ** 2 if sys.platform == "darwin" else 1024.0)
+
+class Timer:
+    __slots__ = ["seconds", "calls", "depth", "start"]
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.depth = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        if self.depth == 0:
+            self.start = time.perf_counter()
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            self.seconds += time.perf_counter() - self.start
+            self.calls += 1
+        return False
+
+# number of the runs of the process (part of the names of the files)
+_run_numbers = itertools.count(1)
+
+class Metrics:
+
+    def __init__(self, name="run", output_folder=None):
+        self.name = name
+        self.output_folder = output_folder
+        self.started = time.time()
+        self.start_time = time.perf_counter()
+        self.timers = OrderedDict()
+        self.counters = OrderedDict()
+        self.gauges = OrderedDict()
+        self.samples = []
+        self.sampler = None
+        self.stop_event = threading.Event()
+        self.samples_file = None
+        self.samples_fields = None
+        self.lock = threading.Lock() # the counters are read by the sampler thread
+        self.prefix = None
+        if output_folder is not None:
+            self.prefix = os.path.join(output_folder, "metrics_%s_%s_%d-%d" % (name, time.strftime("%Y%m%d_%H%M%S"),
+                                                                               os.getpid(), next(_run_numbers)))
+
+    # timer: context manager of a named timer
+    def timer(self, name):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = Timer()
+        return timer
+
+    # add: increments a counter
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # gauge: a value that is read when a sample is taken (ex.: the counter of tweets of a class)
+    def gauge(self, name, function):
+        self.gauges[name] = function
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    # values: counters and gauges
+    def values(self):
+        with self.lock:
+            values = OrderedDict(self.counters)
+        for (name, function) in list(self.gauges.items()):
+            try:
+                values[name] = function()
+            except Exception:
+                values[name] = None
+        return values
+
+    # sample: records the memory and the counters (and their rates since the previous sample)
+    def sample(self):
+        elapsed = self.elapsed()
+        sample = OrderedDict([("elapsed", elapsed), ("rss_mb", rss_mb()), ("peak_rss_mb", peak_rss_mb())])
+        previous = self.samples[-1] if len(self.samples) > 0 else {"elapsed": 0.0}
+        interval = elapsed - previous["elapsed"]
+        for (name, value) in self.values().items():
+            sample[name] = value
+            previous_value = previous.get(name, 0) or 0
+            sample[name + "_per_second"] = (value - previous_value) / interval \
+                if value is not None and interval > 0 else None
+        self.samples.append(sample)
+        self.write_sample(sample)
+        return sample
+
+    # write_sample: appends a row to the samples' csv --> a new field (ex.: a counter added after the first sample) makes
+    # the file be rewritten with all the samples and the new header
+    def write_sample(self, sample):
+        if self.prefix is None:
+            return
+        if self.samples_fields is None or any(field not in self.samples_fields for field in sample):
+            fields = list(self.samples_fields or [])
+            for row in self.samples:
+                fields += [field for field in row if field not in fields]
+            if self.samples_file is not None:
+                self.samples_file.close()
+            self.samples_file = open(self.prefix + "_samples.csv", "w", newline="")
+            self.samples_fields = fields
+            self.samples_writer = csv.DictWriter(self.samples_file, fieldnames=fields)
+            self.samples_writer.writeheader()
+            self.samples_writer.writerows(self.samples[:-1])
+        self.samples_writer.writerow(sample)
+        self.samples_file.flush()
+
+    # start_sampler: takes a sample every "interval" seconds (background thread)
+    def start_sampler(self, interval):
+        def sample_periodically():
+            while not self.stop_event.wait(interval):
+                self.sample()
+        self.sampler = threading.Thread(target=sample_periodically, name="metrics-sampler", daemon=True)
+        self.sampler.start()
+
+    def stop_sampler(self):
+        if self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+            self.sampler = None
+
+    # snapshot: timers and counters (picklable; see merge)
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {"timers": {name: (timer.seconds, timer.calls) for (name, timer) in self.timers.items()},
+                "counters": counters}
+
+    # merge: adds the timers and counters of a snapshot (ex.: of a worker process)
+    def merge(self, snapshot):
+        for (name, (seconds, calls)) in snapshot["timers"].items():
+            timer = self.timer(name)
+            timer.seconds += seconds
+            timer.calls += calls
+        for (name, value) in snapshot["counters"].items():
+            self.add(name, value)
+
+    # summary: all the metrics of the run --> the share of a timer is its time over the wall time (the timers of
+    # worker processes and nested timers can add up to more than 100%)
+    def summary(self):
+        wall = self.elapsed()
+        timers = OrderedDict()
+        for (name, timer) in sorted(self.timers.items(), key=lambda item: -item[1].seconds):
+            timers[name] = {"seconds": timer.seconds, "calls": timer.calls,
+                            "share": timer.seconds / wall if wall > 0 else None}
+        return OrderedDict([("name", self.name), ("started", time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started))),
+                            ("wall_seconds", wall), ("peak_rss_mb", peak_rss_mb()), ("timers", timers),
+                            ("values", self.values()), ("samples", self.samples)])
+
+    # report: table of the timers
+    def report(self):
+        summary = self.summary()
+        lines = ["%s: %.3f s (peak RSS: %s MB)" % (self.name, summary["wall_seconds"], summary["peak_rss_mb"])]
+        for (name, timer) in summary["timers"].items():
+            lines.append("    %-24s %10.3f s %6.1f%% %10d calls" % (name, timer["seconds"], 100 * (timer["share"] or 0),
+                                                                    timer["calls"]))
+        for (name, value) in summary["values"].items():
+            lines.append("    %-24s %s" % (name, value))
+        return "\n".join(lines)
+
+    # write: json file and timers' csv --> prefix of the files (None if the run has no output folder)
+    def write(self):
+        if self.prefix is None:
+            return None
+        summary = self.summary()
+        with open(self.prefix + ".json", "w") as jfile:
+            json.dump(summary, jfile, indent=1)
+        with open(self.prefix + "_timers.csv", "w", newline="") as tfile:
+            writer = csv.writer(tfile)
+            writer.writerow(["timer", "seconds", "calls", "share"])
+            for (name, timer) in summary["timers"].items():
+                writer.writerow([name, timer["seconds"], timer["calls"], timer["share"]])
+        return self.prefix
+
+    def close(self):
+        self.stop_sampler()
+        if self.samples_file is not None:
+            self.samples_file.close()
+            self.samples_file = None
+
+# seconds between the samples of the scripts' runs
+SAMPLE_INTERVAL = 10
+
+# active run of the process
+_active = Metrics()
+
+def active():
+    return _active
+
+# start_run: starts a new run (the metrics of the previous one are discarded)
+# --> sample_interval: seconds between the samples (None: only a sample at the end)
+def start_run(name, output_folder=None, sample_interval=None):
+    global _active
+    _active.close()
+    _active = Metrics(name, output_folder)
+    if sample_interval is not None:
+        _active.start_sampler(sample_interval)
+    return _active
+
+# finish_run: takes the last sample, writes the files and prints the report --> the finished run
+def finish_run(verbose=True):
+    global _active
+    finished = _active
+    finished.stop_sampler()
+    finished.sample()
+    prefix = finished.write()
+    finished.close()
+    if verbose:
+        print(finished.report())
+        if prefix is not None:
+            print("Metrics written to %s.json" % prefix)
+    _active = Metrics()
+    return finished
+
+# timer, add: timer and counter of the active run
+def timer(name):
+    return _active.timer(name)
+
+def add(name, value=1):
+    _active.add(name, value)
+
+# timed: decorator that times each call of a function
+def timed(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with _active.timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# collect: runs a block with a new active run (ex.: a task of a worker process) --> the metrics of the block
+@contextmanager
+def collect(name="task"):
+    global _active
+    previous = _active
+    _active = Metrics(name)
+    try:
+        yield _active
+    finally:
+        _active = previous
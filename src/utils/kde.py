@@ -0,0 +1,217 @@
+'''
+kde.py: fast bandwidth selection for the (gaussian) KDE of the individual polarities
+
+Selectors that use all the data (instead of a sample of 1000 users):
+    - silverman, scott: rules of thumb (normal reference)
+    - isj: Improved Sheather-Jones (Botev et al., 2010), a plug-in selector computed on a binned DCT of the data. On
+      point masses (the users with polarity exactly -1 or 1) its fixed point collapses to a bandwidth smaller than the
+      step of its grid: silverman is used instead (with a warning)
+    - loo: leave-one-out log-likelihood of each candidate bandwidth (same criterion as the cross-validation of
+      GridSearchCV(KernelDensity)), computed on binned data for all the candidates at once with FFT convolutions
+
+The GridSearchCV selector is kept in "polarization/01-PolaritiesDistribution.py" as the reference.
+
+Density on a regular grid (binned_density): the data is linearly binned on the grid and convolved with the sampled
+kernel (FFT), so the cost is O(n + m log m) instead of O(n * m) for n users and m grid points. The error against the
+exact KDE is O((delta / h)^2) for a grid step delta (see density_error): with delta <= h / 10 it stays below 0.1% of the
+peak of the density, so grid_size adds points to the grid when the bandwidth is small.
+
+Integrals of the KDE (mixture_integrals): a gaussian KDE is a mixture of n gaussians, so its mass and first moment over
+[a, b] have closed forms (normal cdf/pdf), computed for all the months at once.
+'''
+import numpy as np
+from scipy.fft import dct, rfft, irfft, next_fast_len
+from scipy.optimize import brentq
+from scipy.signal import fftconvolve
+from scipy.special import ndtr
+
+# candidate bandwidths (the same of the grid search)
+CANDIDATES = np.linspace(0.1, 1.0, 30)
+
+# the gaussian kernel is truncated at KERNEL_SUPPORT bandwidths (exp(-32) ~ 1e-14)
+KERNEL_SUPPORT = 8
+
+# grid of binned_density: step <= bandwidth / GRID_RESOLUTION, with at most MAX_GRID_POINTS points
+GRID_RESOLUTION = 10
+MAX_GRID_POINTS = 2 ** 20
+
+# linear_binning: weights of the points on a regular grid (each point is split between its two closest grid points)
+def linear_binning(x, grid_min, grid_max, grid_points):
+    counts = np.zeros(grid_points)
+    if grid_max == grid_min:
+        counts[0] = len(x)
+        return counts
+    position = (np.asarray(x, dtype=np.float64) - grid_min) / (grid_max - grid_min) * (grid_points - 1)
+    left = np.clip(np.floor(position).astype(np.int64), 0, grid_points - 2)
+    fraction = position - left
+    counts += np.bincount(left, weights=1 - fraction, minlength=grid_points)
+    counts += np.bincount(left + 1, weights=fraction, minlength=grid_points)
+    return counts
+
+def silverman(x):
+    x = np.asarray(x, dtype=np.float64)
+    iqr = np.subtract(*np.percentile(x, [75, 25]))
+    spread = min(x.std(ddof=1), iqr / 1.349) if iqr > 0 else x.std(ddof=1)
+    return 0.9 * spread * len(x) ** (-0.2)
+
+def scott(x):
+    x = np.asarray(x, dtype=np.float64)
+    return 1.059 * x.std(ddof=1) * len(x) ** (-0.2)
+
+# isj_fixed_point: t - xi*gamma^[l](t) (Botev et al., 2010, eq. 29-30), whose root is the squared bandwidth (scaled)
+def isj_fixed_point(t, n, i_squared, a_squared, ell=7):
+    f = 2 * np.pi ** (2 * ell) * np.sum(i_squared ** ell * a_squared * np.exp(-i_squared * np.pi ** 2 * t))
+    if f <= 0:
+        return -1
+    for s in range(ell - 1, 1, -1):
+        k0 = np.prod(np.arange(1, 2 * s, 2, dtype=np.float64)) / np.sqrt(2 * np.pi)
+        const = (1 + (1 / 2) ** (s + 1 / 2)) / 3
+        time = (2 * const * k0 / (n * f)) ** (2 / (3 + 2 * s))
+        f = 2 * np.pi ** (2 * s) * np.sum(i_squared ** s * a_squared * np.exp(-i_squared * np.pi ** 2 * time))
+    return t - (2 * n * np.sqrt(np.pi) * f) ** (-2 / 5)
+
+def isj(x, grid_points=2 ** 10):
+    x = np.asarray(x, dtype=np.float64)
+    data_range = x.max() - x.min()
+    if data_range == 0:
+        return silverman(x)
+    grid_min, grid_max = x.min() - data_range / 2, x.max() + data_range / 2
+    binned = linear_binning(x, grid_min, grid_max, grid_points)
+    a = dct(binned / binned.sum(), type=2)
+    i_squared = np.arange(1, grid_points, dtype=np.float64) ** 2
+    a_squared = a[1:] ** 2 / 4
+
+    n = len(np.unique(x))
+    tolerance = 10e-12 + 0.01 * (max(min(1050, n), 50) - 50) / 1000
+    while tolerance < 1:
+        try:
+            t_star = brentq(isj_fixed_point, 0, tolerance, args=(n, i_squared, a_squared))
+            if t_star > 0:
+                break
+        except ValueError:
+            pass
+        tolerance *= 2
+    else:
+        # no root: the data is too far from a continuous distribution
+        return silverman(x)
+
+    h = np.sqrt(t_star) * (grid_max - grid_min)
+    delta = (grid_max - grid_min) / (grid_points - 1)
+    if h < delta:
+        # collapsed on point masses: the bandwidth is below the resolution of the binned data
+        print("[WARNING] isj bandwidth %.2g < grid step %.2g (point masses in the data), using silverman" % (h, delta))
+        return silverman(x)
+    return h
+
+# loo_log_likelihood: leave-one-out log-likelihood of each candidate bandwidth (binned data, one FFT pass)
+# --> density at the point i without it: (sum_j K_h(x_i - x_j) - K_h(0)) / (n - 1)
+def loo_log_likelihood(x, candidates=CANDIDATES, grid_points=2 ** 12):
+    x = np.asarray(x, dtype=np.float64)
+    candidates = np.asarray(candidates, dtype=np.float64)
+    n = len(x)
+    grid_min, grid_max = x.min(), x.max()
+    counts = linear_binning(x, grid_min, grid_max, grid_points)
+    delta = (grid_max - grid_min) / (grid_points - 1)
+
+    # kernels of all the candidates (rows), in the circular order of the convolution (zero-padded: no wrap around)
+    length = next_fast_len(2 * grid_points - 1)
+    offsets = np.zeros(length)
+    offsets[:grid_points] = np.arange(grid_points) * delta
+    offsets[length - grid_points + 1:] = -np.arange(grid_points - 1, 0, -1) * delta
+    support = np.zeros(length, dtype=bool)
+    support[:grid_points] = True
+    support[length - grid_points + 1:] = True
+    h = candidates[:, np.newaxis]
+    kernels = np.where(support, np.exp(-0.5 * (offsets / h) ** 2) / (h * np.sqrt(2 * np.pi)), 0.0)
+
+    sums = irfft(rfft(counts, n=length)[np.newaxis, :] * rfft(kernels, axis=1), n=length, axis=1)[:, :grid_points]
+    densities = (sums - kernels[:, :1]) / (n - 1)
+    densities = np.maximum(densities, np.finfo(np.float64).tiny)
+    return (counts[np.newaxis, :] * np.log(densities)).sum(axis=1)
+
+def loo(x, candidates=CANDIDATES):
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) < 2 or x.max() == x.min():
+        return float(np.asarray(candidates)[0])
+    return float(np.asarray(candidates)[np.argmax(loo_log_likelihood(x, candidates))])
+
+SELECTORS = {"silverman": silverman, "scott": scott, "isj": isj, "loo": loo}
+
+# bandwidth: bandwidth of the data by one of the selectors
+def bandwidth(x, method="loo"):
+    return float(SELECTORS[method](x))
+
+# grid_size: points of a regular grid over [grid_min, grid_max] whose step is <= bandwidth / GRID_RESOLUTION
+# --> grid_points: the least number of points (the grid of a large bandwidth is not reduced)
+def grid_size(grid_min, grid_max, bandwidth, grid_points=2 ** 12):
+    if not bandwidth > 0 or not grid_max > grid_min:
+        return grid_points
+    needed = int(np.ceil(GRID_RESOLUTION * (grid_max - grid_min) / bandwidth)) + 1
+    if needed > MAX_GRID_POINTS:
+        print("[WARNING] bandwidth %.2g needs %d grid points, using %d (step > bandwidth / %d)" %
+              (bandwidth, needed, MAX_GRID_POINTS, GRID_RESOLUTION))
+        needed = MAX_GRID_POINTS
+    return max(grid_points, needed)
+
+# binned_density: gaussian KDE of the data evaluated on a regular grid (linspace), by linear binning + FFT convolution
+def binned_density(x, grid, bandwidth):
+    x = np.asarray(x, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    if len(grid) < 2 or grid[-1] == grid[0]:
+        return np.exp(-0.5 * ((grid[:, np.newaxis] - x) / bandwidth) ** 2).sum(axis=1) / \
+            (len(x) * bandwidth * np.sqrt(2 * np.pi))
+    delta = (grid[-1] - grid[0]) / (len(grid) - 1)
+
+    # the binning grid has the same step of the grid and is extended (if needed) to contain all the data
+    before = max(0, int(np.ceil((grid[0] - x.min()) / delta)))
+    after = max(0, int(np.ceil((x.max() - grid[-1]) / delta)))
+    grid_points = len(grid) + before + after
+    counts = linear_binning(x, grid[0] - before * delta, grid[-1] + after * delta, grid_points)
+
+    half_width = min(grid_points - 1, int(np.ceil(KERNEL_SUPPORT * bandwidth / delta)))
+    offsets = np.arange(-half_width, half_width + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = fftconvolve(counts, kernel, mode="same") / len(x)
+    return np.maximum(density[before:before + len(grid)], 0.0)
+
+# exact_density: gaussian KDE evaluated point by point (same values of sklearn's KernelDensity.score_samples)
+def exact_density(x, grid, bandwidth, chunk_size=1000):
+    x = np.asarray(x, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    density = np.empty(len(grid))
+    for start in range(0, len(grid), chunk_size):
+        points = grid[start:start + chunk_size, np.newaxis]
+        density[start:start + chunk_size] = np.exp(-0.5 * ((points - x) / bandwidth) ** 2).sum(axis=1)
+    return density / (len(x) * bandwidth * np.sqrt(2 * np.pi))
+
+# density_error: error of binned_density against the exact KDE --> (max absolute error, max error / peak of the density)
+# --> sample_points: the exact KDE is only computed at this number of grid points (evenly spaced), to bound its cost
+# --> the peak is taken from the binned density on the whole grid (the sampled points can miss it); None if it is 0
+def density_error(x, grid, bandwidth, sample_points=None):
+    grid = np.asarray(grid, dtype=np.float64)
+    points = np.arange(len(grid))
+    if sample_points is not None and sample_points < len(grid):
+        points = np.unique(np.linspace(0, len(grid) - 1, sample_points).astype(np.int64))
+    exact = exact_density(x, grid[points], bandwidth)
+    binned = binned_density(x, grid, bandwidth)
+    error = float(np.abs(binned[points] - exact).max())
+    peak = max(float(binned.max()), float(exact.max()))
+    return (error, error / peak if peak > 0 else None)
+
+# mixture_integrals: mass and first moment of the KDE of each group of points over [a, b]
+# --> x: points of all the groups | groups: group (0..total_groups - 1) of each point | bandwidths: bandwidth of each group
+# --> for a point xi, with alpha = (a - xi) / h and beta = (b - xi) / h:
+#     mass = Phi(beta) - Phi(alpha) and moment = xi * (Phi(beta) - Phi(alpha)) + h * (phi(alpha) - phi(beta))
+# --> the integrals of the KDE are the means of these values over the points of the group
+def mixture_integrals(x, groups, bandwidths, a, b, total_groups=None):
+    x = np.asarray(x, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    total_groups = total_groups if total_groups is not None else int(groups.max()) + 1
+    h = np.asarray(bandwidths, dtype=np.float64)[groups]
+    alpha = (a - x) / h
+    beta = (b - x) / h
+    mass = ndtr(beta) - ndtr(alpha)
+    moment = x * mass + h * (np.exp(-0.5 * alpha ** 2) - np.exp(-0.5 * beta ** 2)) / np.sqrt(2 * np.pi)
+    sizes = np.bincount(groups, minlength=total_groups)
+    return (np.bincount(groups, weights=mass, minlength=total_groups) / sizes,
+            np.bincount(groups, weights=moment, minlength=total_groups) / sizes)
@@ -0,0 +1,188 @@
+'''
+pipeline.py: runs the stages of the pipeline as a DAG, with the intermediate results cached by the hash of their inputs
+
+A stage declares:
+    - inputs: files or folders that are not produced by the pipeline (ex.: the corpus, the hashtags of each group);
+    - deps: the stages whose outputs it reads (the function receives their output folders);
+    - params: its configuration (json values);
+    - code: the source files it runs (a change in the code is a change of the stage);
+    - options: settings that do not change its outputs (ex.: number of processes), not part of the key.
+
+The key of a stage is the sha256 of its name, params, code, inputs (content) and the keys of its deps, so a stage only
+runs again when something it depends on has changed. Its output folder is "<work folder>/<stage>/<key[:16]>": the
+results of other configurations are kept (going back to a previous configuration does not run anything). A stage runs
+in a temporary folder that is renamed when it finishes, so an interrupted stage is never taken as done.
+
+The stages whose deps are done run concurrently (one process each, up to "processes"). The hashes of the input files are
+kept in "<work folder>/hashes.json" by (path, size, modification time), so a large corpus is only read once.
+'''
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+
+import utils
+
+DONE_FILE = "_DONE.json"
+HASHES_FILE = "hashes.json"
+CHUNK_SIZE = 2 ** 20
+
+class Stage:
+
+    # function(output_folder, inputs, deps, params): writes the outputs of the stage to output_folder
+    # --> inputs: {name: path}, deps: {stage name: output folder}, params: params and options of the stage
+    def __init__(self, name, function, inputs=None, deps=None, params=None, code=None, options=None):
+        self.name = name
+        self.function = function
+        self.inputs = dict(inputs) if inputs is not None else dict()
+        self.deps = list(deps) if deps is not None else []
+        self.params = dict(params) if params is not None else dict()
+        self.code = list(code) if code is not None else []
+        self.options = dict(options) if options is not None else dict()
+
+class StageError(Exception):
+    pass
+
+# run_stage: runs a stage in its temporary folder (in a worker process) --> elapsed time
+def run_stage(function, output_folder, inputs, deps, params):
+    os.chdir(output_folder) # files written to the current folder stay with the outputs of the stage
+    start = time.perf_counter()
+    try:
+        function(output_folder, inputs, deps, params)
+    except Exception:
+        raise StageError(traceback.format_exc())
+    return time.perf_counter() - start
+
+class Pipeline:
+
+    def __init__(self, work_folder, processes=None):
+        self.work_folder = os.path.abspath(work_folder)
+        if not os.path.exists(self.work_folder):
+            os.makedirs(self.work_folder)
+        self.processes = processes
+        self.stages = dict()
+        self.keys = dict()
+        self.hashes_filename = os.path.join(self.work_folder, HASHES_FILE)
+        self.hashes = dict()
+        if os.path.exists(self.hashes_filename):
+            with open(self.hashes_filename, "r") as hfile:
+                self.hashes = json.load(hfile)
+
+    def add(self, stage):
+        self.stages[stage.name] = stage
+        return stage
+
+    # file_hash: sha256 of a file (cached by path, size and modification time)
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        status = os.stat(path)
+        fingerprint = "%s|%d|%d" % (path, status.st_size, status.st_mtime_ns)
+        if fingerprint not in self.hashes:
+            sha = hashlib.sha256()
+            with open(path, "rb") as ffile:
+                for chunk in iter(lambda: ffile.read(CHUNK_SIZE), b""):
+                    sha.update(chunk)
+            self.hashes[fingerprint] = sha.hexdigest()
+        return self.hashes[fingerprint]
+
+    # content_hash: hash of a file or of a folder (names and contents of its files)
+    def content_hash(self, path):
+        if not os.path.isdir(path):
+            return self.file_hash(path)
+        sha = hashlib.sha256()
+        for (root, subdirs, files) in os.walk(path):
+            subdirs.sort()
+            for filename in sorted(files):
+                complete_filename = os.path.join(root, filename)
+                sha.update(os.path.relpath(complete_filename, path).encode("utf-8"))
+                sha.update(self.file_hash(complete_filename).encode("ascii"))
+        return sha.hexdigest()
+
+    # key: hash of everything a stage depends on (the keys of its deps must be known)
+    def key(self, name):
+        if name not in self.keys:
+            stage = self.stages[name]
+            description = {"name": name, "params": stage.params,
+                           "code": {path: self.content_hash(path) for path in stage.code},
+                           "inputs": {input_name: self.content_hash(path) for (input_name, path) in stage.inputs.items()},
+                           "deps": {dep: self.key(dep) for dep in stage.deps}}
+            self.keys[name] = hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+        return self.keys[name]
+
+    def output_folder(self, name):
+        return os.path.join(self.work_folder, name.replace(":", "_"), self.key(name)[:16])
+
+    def is_done(self, name):
+        return os.path.exists(os.path.join(self.output_folder(name), DONE_FILE))
+
+    # required: the stages needed by the targets (all the stages if there are no targets)
+    def required(self, targets=None):
+        if targets is None:
+            return set(self.stages)
+        required, pending = set(), list(targets)
+        while len(pending) > 0:
+            name = pending.pop()
+            if name not in required:
+                required.add(name)
+                pending.extend(self.stages[name].deps)
+        return required
+
+    # run: runs the stages that are not done (and their deps) --> {stage: output folder}
+    # --> force: stages that run again even if they are done
+    def run(self, targets=None, force=()):
+        required = self.required(targets)
+        for name in required:
+            self.key(name)
+        utils.write_json_atomic(self.hashes, self.hashes_filename)
+
+        pending = set(name for name in required if name in force or not self.is_done(name))
+        for name in sorted(required - pending):
+            print("[cached] %s --> %s" % (name, self.output_folder(name)))
+
+        running = dict()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                ready = [name for name in sorted(pending) if all(dep not in pending and dep not in running.values()
+                                                                  for dep in self.stages[name].deps)]
+                for name in ready:
+                    pending.remove(name)
+                    running[self.submit(executor, name)] = name
+                if len(running) == 0:
+                    raise StageError("cycle among the stages %s" % sorted(pending))
+
+                (done, _) = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    self.finish(name, future.result())
+
+        return {name: self.output_folder(name) for name in required}
+
+    # submit: starts a stage in a temporary folder
+    def submit(self, executor, name):
+        stage = self.stages[name]
+        temporary_folder = self.output_folder(name) + ".tmp"
+        if os.path.exists(temporary_folder):
+            shutil.rmtree(temporary_folder)
+        os.makedirs(temporary_folder)
+        print("[running] %s" % name)
+        return executor.submit(run_stage, stage.function, temporary_folder, stage.inputs,
+                               {dep: self.output_folder(dep) for dep in stage.deps}, dict(stage.params, **stage.options))
+
+    # finish: marks a stage as done and moves its outputs to the output folder
+    def finish(self, name, elapsed):
+        stage = self.stages[name]
+        output_folder = self.output_folder(name)
+        temporary_folder = output_folder + ".tmp"
+        done = {"stage": name, "key": self.key(name), "params": stage.params, "inputs": stage.inputs,
+                "deps": {dep: self.output_folder(dep) for dep in stage.deps}, "seconds": elapsed,
+                "finished": time.strftime("%Y-%m-%d %H:%M:%S")}
+        utils.write_json_atomic(done, os.path.join(temporary_folder, DONE_FILE))
+        if os.path.exists(output_folder):
+            shutil.rmtree(output_folder)
+        os.rename(temporary_folder, output_folder)
+        print("[done] %s (%.1f s) --> %s" % (name, elapsed, output_folder))
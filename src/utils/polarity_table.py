@@ -0,0 +1,120 @@
+'''
+polarity_table.py: columnar table of the individual polarities of the unlabeled users, per period (month)
+
+The table is a .npz file ("DiffPercentual_UsuariosSemLabel_GranMensal.npz") with parallel arrays:
+    - periods (str): the periods, in order of first appearance in the ScatterData file
+    - offsets (int64): the rows of periods[i] are offsets[i]:offsets[i + 1]
+    - user_ids (int64), pro, anti, diff (float64): the user, the shares of retweets in pro-impeachment ("favoravel")
+      and anti-impeachment ("contrario") users, and the individual polarity (diff = pro - anti)
+
+The values are kept at full precision (the json/csv exports keep the old "%.2f"/"%.5f" strings).
+Written by "polarities/02-PolaritiesUnlabeledUsers.py" and loaded by "polarization/01-PolaritiesDistribution.py".
+'''
+import json
+import numpy as np
+
+import scatter_data
+
+COLUMNS = ["user_ids", "pro", "anti", "diff"]
+TITLES = {"pro": "Pro-Impeachment Retweets (%)", "anti": "Anti-Impeachment Retweets (%)",
+          "diff": "Percentual Difference"}
+FORMATS = {"pro": "%.2f", "anti": "%.2f", "diff": "%.5f"}
+CSV_HEADER = "Period;User Id;Pro-Impeachment Retweets (%);Anti-Impeachment Retweets (%);Percentual Difference\n"
+
+class PolarityTable:
+
+    def __init__(self, periods, offsets, user_ids, pro, anti, diff):
+        self.periods = list(periods)
+        self.offsets = offsets
+        self.columns = {"user_ids": user_ids, "pro": pro, "anti": anti, "diff": diff}
+
+    def __len__(self):
+        return len(self.columns["user_ids"])
+
+    # rows: slice of the rows of a period
+    def rows(self, period):
+        i = self.periods.index(period)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    # column: values of a column for a period (ex.: table.column("2016/03/01", "diff"))
+    def column(self, period, name):
+        return self.columns[name][self.rows(period)]
+
+    # items: (period, {column: values}) for each period
+    def items(self):
+        for period in self.periods:
+            rows = self.rows(period)
+            yield (period, {name: values[rows] for (name, values) in self.columns.items()})
+
+    def save(self, filename):
+        np.savez(filename, periods=np.asarray(self.periods, dtype=str), offsets=self.offsets, **self.columns)
+
+    # export_json: same layout of the old json file --> {period: {user_id: {"pro"|"anti"|"diff": {"title", "value"}}}}
+    # --> written period by period
+    def export_json(self, filename):
+        with open(filename, "w") as jfile:
+            jfile.write("{")
+            for (i, (period, columns)) in enumerate(self.items()):
+                users = dict()
+                for (user_id, pro, anti, diff) in zip(*[columns[name].tolist() for name in COLUMNS]):
+                    users[str(user_id)] = {name: {"title": TITLES[name], "value": FORMATS[name] % value}
+                                           for (name, value) in [("pro", pro), ("anti", anti), ("diff", diff)]}
+                jfile.write("%s%s: %s" % (", " if i > 0 else "", json.dumps(period), json.dumps(users)))
+            jfile.write("}")
+
+    # export_csv: same layout of the old csv file (periods in sorted order)
+    def export_csv(self, filename):
+        total_lines = 1
+        with open(filename, "w") as tfile:
+            tfile.write(CSV_HEADER)
+            for period in sorted(self.periods):
+                columns = [self.column(period, name).tolist() for name in COLUMNS]
+                tfile.write("".join("%s;%d;%.2f;%.2f;%.5f\n" % ((period,) + row) for row in zip(*columns)))
+                total_lines += len(columns[0])
+        return total_lines
+
+# load: loads a table saved with PolarityTable.save
+def load(filename):
+    with np.load(filename) as table:
+        return PolarityTable(table["periods"].tolist(), table["offsets"],
+                             *[table[name] for name in COLUMNS])
+
+# from_scatter_data: computes the table from the ScatterData file (csv or xlsx), read in chunks
+# --> rows without retweets in labeled users (total = 0) are discarded
+def from_scatter_data(filename, chunk_size=scatter_data.CHUNK_SIZE):
+    periods, user_ids, retweets_fav, retweets_cont = [], [], [], []
+    for chunk in scatter_data.read_chunks(filename, chunk_size):
+        columns = list(zip(*chunk))
+        periods.append(np.asarray(columns[0], dtype=str))
+        user_ids.append(np.asarray(columns[1]).astype(np.int64))
+        retweets_fav.append(np.asarray(columns[2]).astype(np.int64))
+        retweets_cont.append(np.asarray(columns[4]).astype(np.int64))
+    if len(periods) == 0:
+        return PolarityTable([], np.zeros(1, dtype=np.int64), *[np.zeros(0)] * 4)
+
+    periods = np.concatenate(periods)
+    user_ids = np.concatenate(user_ids)
+    retweets_fav = np.concatenate(retweets_fav)
+    retweets_cont = np.concatenate(retweets_cont)
+
+    # shares of retweets and individual polarity (vectorized)
+    total_retweets = retweets_fav + retweets_cont
+    valid = total_retweets > 0
+    if not valid.all():
+        print("%d rows without retweets in labeled users were discarded" % np.count_nonzero(~valid))
+    pro = retweets_fav[valid] / total_retweets[valid]
+    anti = retweets_cont[valid] / total_retweets[valid]
+    diff = pro - anti
+    periods = periods[valid]
+    user_ids = user_ids[valid]
+
+    # rows grouped by period (periods in order of first appearance; rows keep their order)
+    (unique_periods, first_row, period_index) = np.unique(periods, return_index=True, return_inverse=True)
+    order = np.argsort(first_row, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    period_rank = rank[period_index.ravel()]
+    rows = np.argsort(period_rank, kind="stable")
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(period_rank, minlength=len(order)), out=offsets[1:])
+    return PolarityTable(unique_periods[order].tolist(), offsets, user_ids[rows], pro[rows], anti[rows], diff[rows])
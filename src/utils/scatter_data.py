@@ -0,0 +1,93 @@
+'''
+scatter_data.py: streaming format of the ScatterData file (totals of retweets of the unlabeled users per month)
+
+Written by "polarities/01-TotalsUnlabeledUsers.py" and read by "polarities/02-PolaritiesUnlabeledUsers.py".
+
+The file is a semicolon CSV ("ScatterData_UsuariosSemLabel_GranMensal.csv"), written month by month (append) and read
+back in chunks of rows, so that the whole table is never in memory. The floats are written with repr, so they are read
+back exactly. The .xlsx spreadsheet is only an optional export (openpyxl write-only mode); as a sheet is limited to
+1048576 rows, the rows continue in new sheets. Both formats can be read with read_chunks.
+'''
+from itertools import islice
+import csv
+import os
+import numpy as np
+
+HEADER = ["Period", "User Id",
+          "Number of Retweets - Favoravel (Coxinhas)", "Percent of Retweets - Favoravel (Coxinhas)",
+          "Number of Retweets - Contrario (Petralhas)", "Percent of Retweets - Contrario (Petralhas)"]
+DELIMITER = ";"
+EXCEL_MAX_ROWS = 1048576
+CHUNK_SIZE = 100000
+
+class ScatterDataWriter:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.total_rows = 0
+        self.sfile = open(filename, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.sfile, delimiter=DELIMITER, lineterminator="\n")
+        self.writer.writerow(HEADER)
+
+    # write_month: appends the rows of a month --> columns: user ids and the four totals (same order of HEADER)
+    def write_month(self, period, user_ids, num_fav, perc_fav, num_cont, perc_cont):
+        columns = [user_ids, num_fav, perc_fav, num_cont, perc_cont]
+        for start in range(0, len(user_ids), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            self.writer.writerows((period, "%d" % user_id, "%d" % nfav, repr(pfav), "%d" % ncont, repr(pcont))
+                                  for (user_id, nfav, pfav, ncont, pcont) in
+                                  zip(*[np.asarray(column[start:end]).tolist() for column in columns]))
+        self.total_rows += len(user_ids)
+        self.sfile.flush()
+
+    def close(self):
+        self.sfile.close()
+
+# parse_row: typed values of a row of the csv file (the same values of the .xlsx file)
+def parse_row(row):
+    return (row[0], row[1], int(row[2]), float(row[3]), int(row[4]), float(row[5]))
+
+# read_rows: rows of the file (csv or xlsx), without the header
+def read_rows(filename):
+    if os.path.splitext(filename)[1] == ".xlsx":
+        import openpyxl
+        wb = openpyxl.load_workbook(filename, read_only=True)
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                yield row
+        wb.close()
+        return
+
+    with open(filename, "r", encoding="utf-8", newline="") as sfile:
+        reader = csv.reader(sfile, delimiter=DELIMITER)
+        next(reader, None)
+        for row in reader:
+            yield row
+
+# read_chunks: the rows of the file in lists of at most "chunk_size" rows (csv rows are not converted, see parse_row)
+def read_chunks(filename, chunk_size=CHUNK_SIZE):
+    rows = read_rows(filename)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if len(chunk) == 0:
+            break
+        yield chunk
+
+# export_xlsx: optional export of the csv file to a spreadsheet (openpyxl write-only mode, new sheet every EXCEL_MAX_ROWS)
+def export_xlsx(filename, xlsx_filename=None):
+    import openpyxl
+    xlsx_filename = xlsx_filename if xlsx_filename is not None else os.path.splitext(filename)[0] + ".xlsx"
+    wb = openpyxl.Workbook(write_only=True)
+    ws, rows_sheet = None, EXCEL_MAX_ROWS
+    for chunk in read_chunks(filename):
+        for row in chunk:
+            if rows_sheet == EXCEL_MAX_ROWS:
+                ws = wb.create_sheet("ScatterData" if ws is None else "ScatterData_%d" % (len(wb.worksheets) + 1))
+                ws.append(HEADER)
+                rows_sheet = 1
+            ws.append(parse_row(row))
+            rows_sheet += 1
+    if ws is None:
+        wb.create_sheet("ScatterData").append(HEADER)
+    wb.save(xlsx_filename)
+    return xlsx_filename
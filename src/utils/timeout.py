@@ -1,4 +1,16 @@
+'''
+timeout.py: limits for the time spent on a record
+
+- timeout: context manager based on SIGALRM (main thread of Unix processes only). The signal interrupts the record
+  while it runs, even inside a stuck regular expression.
+- Watchdog: one monitor thread that flags the records running for more than "seconds". It does not use signals, so it
+  works in any thread or process, but it only flags a record after the fact: the record keeps running until it calls
+  check() or finishes, so a stuck regular expression is reported but not interrupted (as SIGALRM would do).
+'''
 import signal
+import threading
+import time
+import os
 
 class timeout:
     def __init__(self, seconds=1, error_message='Timeout'):
@@ -13,4 +25,112 @@ class timeout:
         signal.alarm(self.seconds)
 
     def __exit__(self, type, value, traceback):
-        signal.alarm(0)
\ No newline at end of file
+        signal.alarm(0)
+
+# Watchdog: flags slow records without signals (one monitor thread instead of two syscalls per record)
+# --> works in the main thread, in thread-pool workers and in process-pool workers (the monitor is (re)started lazily
+#     in each process). Usage:
+#         watchdog.begin(record_id)     # before processing a record
+#         watchdog.check()              # raises TimeoutError if the current record exceeded the limit
+#         watchdog.end()                # after processing the record
+class Watchdog:
+    def __init__(self, seconds=60, interval=1.0, error_message='Timeout', on_timeout=None):
+        self.seconds = seconds
+        self.interval = interval
+        self.error_message = error_message
+        self.on_timeout = on_timeout if on_timeout is not None else self.report_timeout
+        self.timed_out = []
+        self._reset_runtime()
+
+    def _reset_runtime(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._slots = []
+        self._monitor = None
+        self._stopped = None # event of the current monitor thread (each thread has its own)
+
+    # the runtime state (thread, lock) is not sent to other processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ["_pid", "_lock", "_local", "_slots", "_monitor", "_stopped"]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_runtime()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    # report_timeout: default action for a slow record
+    def report_timeout(self, record, elapsed):
+        print("[TIMEOUT-ERROR] %s on %s (%.1f s)" % (self.error_message, record, elapsed))
+
+    # _slot: state of the current thread --> [record, start time, expired]
+    def _slot(self):
+        if self._pid != os.getpid():
+            self._reset_runtime() # forked: the monitor thread does not exist in this process
+        slot = getattr(self._local, "slot", None)
+        if slot is None:
+            slot = [None, 0.0, False]
+            self._local.slot = slot
+            with self._lock:
+                self._slots.append(slot)
+        return slot
+
+    # _start_monitor: (re)starts the monitor thread (ex.: on the first record, or after stop)
+    # --> a new event for each thread, so a stop that is still joining the old one cannot be undone by a new begin
+    def _start_monitor(self):
+        with self._lock:
+            if self._monitor is None:
+                self._stopped = threading.Event()
+                self._monitor = threading.Thread(target=self._watch, args=(self._stopped,), name="watchdog", daemon=True)
+                self._monitor.start()
+
+    def begin(self, record):
+        slot = self._slot()
+        if self._monitor is None:
+            self._start_monitor()
+        slot[0] = None
+        slot[2] = False
+        slot[1] = time.monotonic()
+        slot[0] = record
+
+    def end(self):
+        slot = self._slot()
+        slot[0] = None
+
+    # check: raises TimeoutError if the current record was flagged by the monitor
+    def check(self):
+        slot = self._slot()
+        if slot[2]:
+            raise TimeoutError(self.error_message)
+
+    # _watch: monitor thread --> flags the records that are running for more than "seconds"
+    def _watch(self, stopped):
+        while not stopped.wait(self.interval):
+            now = time.monotonic()
+            with self._lock:
+                slots = list(self._slots)
+            for slot in slots:
+                record, started, expired = slot
+                if record is not None and not expired and (now - started) > self.seconds:
+                    slot[2] = True
+                    self.timed_out.append(record)
+                    self.on_timeout(record, now - started)
+
+    # stop: stops the monitor thread (the next record starts a new one)
+    def stop(self):
+        with self._lock:
+            monitor = self._monitor
+            if monitor is not None:
+                self._stopped.set()
+            self._monitor = None
+            self._stopped = None
+        if monitor is not None and monitor is not threading.current_thread():
+            monitor.join()
@@ -2,8 +2,14 @@
 utils.py: some useful methods
 '''
 import gzip
+import json
+import os
+import re
+import sys
+import importlib.util
+from collections import OrderedDict
+import gzip_index
 from nltk.corpus import stopwords
-from nltk import wordpunct_tokenize
 
 # open_file: allows to identify if file is gz or not and open it properly
 def open_file(file):
@@ -12,20 +18,186 @@ def open_file(file):
     else:
         return open(file, "r")
 
+# byte_ranges: splits an uncompressed file into ranges of bytes, so that each part can be read by a different process
+# --> each range is a "shard": (file, start, end). A line belongs to the range where it starts.
+def byte_ranges(file, parts):
+    file_size = os.path.getsize(file)
+    step = max(1, -(-file_size // max(1, parts)))
+    return [(file, start, min(start + step, file_size)) for start in range(0, file_size, step)] or [(file, 0, 0)]
+
+# read_shard: reads the lines (bytes) of a shard --> (file, None, None) reads the whole file
+# --> for .gz files, the range is given by checkpoints of the index of the file (see gzip_index.shards)
+def read_shard(shard):
+    file, start, end = shard
+    if start is None:
+        data_file = open_file(file)
+        for line in data_file:
+            yield line
+        data_file.close()
+        return
+
+    if ".gz" in file:
+        for line in gzip_index.read_range(file, start, end):
+            yield line
+        return
+
+    with open(file, "rb") as data_file:
+        # the line that crosses "start" belongs to the previous shard
+        if start > 0:
+            data_file.seek(start - 1)
+            data_file.readline()
+        position = data_file.tell()
+        while position < end:
+            line = data_file.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+# read_from_offset: reads the lines (bytes) of a file from an offset of its uncompressed data (the beginning of a line)
+def read_from_offset(file, offset):
+    if ".gz" in file:
+        for line in gzip_index.read_from_offset(file, offset):
+            yield line
+        return
+
+    with open(file, "rb") as data_file:
+        data_file.seek(offset)
+        for line in data_file:
+            yield line
+
+# write_json_atomic: writes a json file atomically (a crash leaves either the old or the new file, never a partial one)
+def write_json_atomic(obj, filename):
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as tmp_file:
+        json.dump(obj, tmp_file)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_filename, filename)
+
+# load_script: imports a script of the pipeline whose file name is not a valid module name (ex.: "01-FindingUsersHashtags.py")
+def load_script(path):
+    module_name = re.sub(r"\W", "_", os.path.splitext(os.path.basename(path))[0])
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# LRUCache: bounded cache that discards the least recently used item (with hit/miss counters)
+class LRUCache:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # get: returns the cached value (or None), updating the counters
+    def get(self, key):
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
 # basic methods to detect language in text
 PT_STOPWORDS = set(stopwords.words('portuguese'))
 NON_PT_STOPWORDS = set(stopwords.words()) - PT_STOPWORDS
 
 STOPWORDS_DICT = {lang: set(stopwords.words(lang)) for lang in stopwords.fileids()}
 
+# words of a text: the word tokens of nltk.wordpunct_tokenize (its punctuation tokens are never stopwords)
+WORD_PATTERN = re.compile(r"\w+")
+
+def text_words(text):
+    return set(WORD_PATTERN.findall(text.lower()))
+
+# StopwordIndex: inverted index word --> languages of the stopword lists that contain it
+# --> all the languages are scored in a single pass over the words of a text, which stops as soon as the result is decided
+# --> same results of the set intersections: the most frequent language (the first one of the lists on ties) and
+#     portuguese if there are more portuguese stopwords than stopwords of other languages only
+class StopwordIndex:
+
+    def __init__(self, stopwords_dict, portuguese='portuguese'):
+        self.languages = list(stopwords_dict)
+        self.word_languages = dict()
+        for (i, lang) in enumerate(self.languages):
+            for word in stopwords_dict[lang]:
+                self.word_languages.setdefault(word, []).append(i)
+        self.word_languages = {word: tuple(langs) for (word, langs) in self.word_languages.items()}
+
+        # +1: portuguese stopword, -1: stopword of other languages only
+        pt = self.languages.index(portuguese)
+        self.word_portuguese = {word: 1 if pt in langs else -1 for (word, langs) in self.word_languages.items()}
+
+    # scores: number of stopwords of each language in the words (set) of a text
+    def scores(self, words):
+        counts = [0] * len(self.languages)
+        for word in words:
+            for i in self.word_languages.get(word, ()):
+                counts[i] += 1
+        return dict(zip(self.languages, counts))
+
+    # language: the language with most stopwords --> stops when no other language can reach the leader
+    def language(self, text):
+        words = text_words(text)
+        counts = [0] * len(self.languages)
+        leader = 0
+        remaining = len(words)
+        for word in words:
+            remaining -= 1
+            langs = self.word_languages.get(word)
+            if langs is None:
+                continue
+            for i in langs:
+                counts[i] += 1
+                if counts[i] > counts[leader] or (counts[i] == counts[leader] and i < leader):
+                    leader = i
+            if counts[leader] > remaining and \
+                    counts[leader] > max(c for (i, c) in enumerate(counts) if i != leader) + remaining:
+                break
+        return self.languages[leader]
+
+    # is_portuguese: more portuguese stopwords than stopwords of other languages --> stops when one side cannot be reached
+    def is_portuguese(self, text):
+        words = text_words(text)
+        balance = 0
+        remaining = len(words)
+        for word in words:
+            remaining -= 1
+            balance += self.word_portuguese.get(word, 0)
+            if balance > remaining:
+                return True
+            if balance + remaining <= 0:
+                return False
+        return balance > 0
+
+    # batch versions: one result per text
+    def languages_of(self, texts):
+        return [self.language(text) for text in texts]
+
+    def portuguese_mask(self, texts):
+        return [self.is_portuguese(text) for text in texts]
+
+STOPWORD_INDEX = StopwordIndex(STOPWORDS_DICT)
+
 def get_language(text):
-    words = set(wordpunct_tokenize(text.lower()))
-    return max(((lang, len(words & stopwords)) for lang, stopwords in STOPWORDS_DICT.items()), key = lambda x: x[1])[0]
+    return STOPWORD_INDEX.language(text)
 
 def is_portuguese(text):
-    text = text.lower()
-    words = set(wordpunct_tokenize(text))
-    return len(words & PT_STOPWORDS) > len(words & NON_PT_STOPWORDS)
+    return STOPWORD_INDEX.is_portuguese(text)
 
 # find_month: put month in written form
 def find_month(month_number):